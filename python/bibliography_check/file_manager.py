@@ -1,5 +1,8 @@
 """load txt file with bibliography"""
+from itertools import islice
 from os.path import exists
+from re import compile, IGNORECASE
+from unicodedata import normalize
 import logging
 
 # setup per-module logger
@@ -20,3 +23,286 @@ def load_file(location, encoding="utf-8"):
     f = [i.strip() for i in f if len(i) > 5 and i[0] != "#"]
     logging.info(f"ok: loaded a list of {len(f)} bibliographies from: {location}")
     return f
+
+
+# doi (e.g., "10.1000/xyz123") and issn (e.g., "1234-567X") found anywhere in text
+DOI_PATTERN = compile(r"10\.\d{4,9}/[^\s\"<>{}]+")
+ISSN_PATTERN = compile(r"\b(\d{4})-?(\d{3}[\dX])\b", IGNORECASE)
+# ris tag : field of record (the first of them that is present is kept)
+RIS_FIELDS = {"AU": "author", "A1": "author", "PY": "year", "Y1": "year", "TI": "title", "T1": "title",
+              "JO": "journal", "JF": "journal", "T2": "journal", "JA": "journal", "J2": "journal",
+              "PB": "publisher", "DO": "doi", "SN": "issn"}
+# characters that open or close bibtex values (unless escaped with backslash, e.g., "M\"uller")
+BIBTEX_DELIMITERS = compile(r'(?<!\\)[{}"]')
+# characters that close bibtex entry in parentheses, e.g., "@book(key, publisher = {Press})" (braces and quotes are counted too)
+BIBTEX_PARENTHESES = compile(r'(?<!\\)[{}"()]')
+# start of bibtex entry: its type and brace or parenthesis that opens it, e.g., "@article{" or "@book("
+BIBTEX_OPENING = compile(r"@\s*([^\s{(]+)\s*([{(])")
+# bare bibtex value, e.g., 2009 or name of @string macro
+BIBTEX_BARE = compile(r'[^\s,#{}"]+')
+# latex accents, e.g., \"{u} or \"u -> ü (command : combining character)
+LATEX_ACCENTS = {'"': "\u0308", "'": "\u0301", "`": "\u0300", "^": "\u0302", "~": "\u0303", "=": "\u0304", ".": "\u0307"}
+LATEX_ACCENT = compile(r'\\(["\'`^~=.])\{?([A-Za-z])\}?')
+# bibtex entries that aren't references
+BIBTEX_SKIPPED = ("comment", "string", "preamble")
+
+
+def get_format(location):
+    """
+    return format of bibliography file based on its extension: "bibtex" (.bib), "ris" (.ris) or "text" (anything else)
+    """
+    return {"bib": "bibtex", "ris": "ris"}.get(location.rsplit(".", 1)[-1].lower(), "text")
+
+
+def clean_value(value):
+    """
+    return value without bibtex braces and escapes (e.g., "{IEEE} \\& Sons" -> "IEEE & Sons", "M\\"{u}ller" -> "Müller"), with whitespace collapsed
+    """
+    value = LATEX_ACCENT.sub(lambda match: normalize("NFC", match.group(2) + LATEX_ACCENTS[match.group(1)]), value)
+    value = value.replace("\\&", "&").replace("{", "").replace("}", "")
+    return " ".join(value.split()).strip(" ,")
+
+
+def normalize_doi(value):
+    """
+    return doi in lowercase without "https://doi.org/" or "doi:" in front, or None if there is no doi
+    """
+    match = DOI_PATTERN.search(value or "")
+    return match.group().rstrip(".,;)").lower() if match else None
+
+
+def normalize_issn(value):
+    """
+    return list of issns in value written as "1234-567X" (print and electronic issn are often listed together)
+    """
+    return list(dict.fromkeys(f"{first}-{second.upper()}" for first, second in ISSN_PATTERN.findall(value or "")))
+
+
+def create_record(fields, line, text=None):
+    """
+    return reference as dictionary: "author", "year", "title", "journal", "publisher", "doi", "issn" (list), "line" (where it starts in file)
+    and "text" (the reference as one line, e.g., for printing); missing fields are None
+    """
+    r = {name: clean_value(fields[name]) if fields.get(name) else None for name in ["author", "year", "title", "journal", "publisher"]}
+    r["doi"] = normalize_doi(fields.get("doi") or text)
+    r["issn"] = normalize_issn(fields.get("issn") or (text if text and "issn" in text.lower() else None))
+    r["line"] = line
+    r["text"] = text or ". ".join(r[name].rstrip(".") for name in ["author", "year", "title", "journal", "publisher"] if r[name])
+    return r
+
+
+def get_searchable(record):
+    """
+    return list of (field, text) of record that are checked for publishers: publisher and journal if known, whole reference otherwise
+    """
+    r = [(name, record[name]) for name in ["publisher", "journal"] if record[name]]
+    return r or [("reference", record["text"])]
+
+
+def iter_text(f):
+    """
+    yield reference from each line of plain text file (lines that are too short or start with "#" are skipped)
+    """
+    for number, line in enumerate(f, start=1):
+        if len(line) > 5 and line[0] != "#":
+            yield create_record(dict(), line=number, text=line.strip())
+        continue
+    return
+
+
+def iter_ris(f):
+    """
+    yield reference from each ris entry ("TY  - " ... "ER  - ")
+    """
+    fields = dict()
+    start = None
+    for number, line in enumerate(f, start=1):
+        tag, value = line[:2], line[6:].strip()
+        if line[2:5] != "  -":
+            continue
+        if tag == "TY":
+            fields = dict()
+            start = number
+        elif tag == "ER":
+            if start is not None:
+                yield create_record(fields, line=start)
+            start = None
+        elif tag in RIS_FIELDS and RIS_FIELDS[tag] not in fields:
+            fields[RIS_FIELDS[tag]] = value
+        continue
+    return
+
+
+def find_value_end(body, i):
+    """
+    return position of brace or quote that closes bibtex value starting at i (with "{" or '"'), skipping from one brace or quote to the next
+    braces within value are counted, so that "{{IEEE} Press}" ends at the last brace and quotes within braces don't end a quoted value
+    """
+    quoted = body[i] == '"'
+    depth = 0 if quoted else 1
+    for match in BIBTEX_DELIMITERS.finditer(body, i + 1):
+        c = match.group()
+        if c == '"':
+            if quoted and depth == 0:
+                return match.start()
+            continue
+        depth += 1 if c == "{" else -1
+        if depth == 0 and not quoted:
+            return match.start()
+        continue
+    return len(body)
+
+
+def find_entry_end(text, i):
+    """
+    return position of brace or parenthesis that closes bibtex entry opened at i, or length of text if it isn't closed yet
+    entry in parentheses ends with ")" that is outside of braces and quotes, e.g., "@book(key, title = {A (Short) Title})"
+    """
+    if text[i] == "{":
+        return find_value_end(text, i)
+    quoted = False
+    depth = 0
+    for match in BIBTEX_PARENTHESES.finditer(text, i + 1):
+        c = match.group()
+        if c == '"' and depth == 0:
+            quoted = not quoted
+        elif c in "{}":
+            depth += 1 if c == "{" else -1
+        elif c == ")" and depth == 0 and not quoted:
+            return match.start()
+        continue
+    return len(text)
+
+
+def parse_bibtex_fields(body, macros=None):
+    """
+    return dictionary of field : value from body of bibtex entry (after "key,"); values are in braces (which can be nested), quotes or bare
+    bare values that are names of @string macros (dictionary of lowercase name : value) are replaced with them, parts of values are joined with "#"
+    """
+    macros = macros or dict()
+    r = dict()
+    i = 0
+    while True:
+        # (1) field name, up to "="
+        equals = body.find("=", i)
+        if equals == -1:
+            break
+        name = body[i:equals].strip(" \t\r\n,").lower()
+        i = equals + 1
+        while i < len(body) and body[i].isspace():
+            i += 1
+        # (2) value: parts joined with "#", each in braces ({{IEEE} Press}), quotes ("{IEEE} Press") or bare (2009 or name of macro)
+        parts = list()
+        while i < len(body):
+            if body[i] in ("{", '"'):
+                end = find_value_end(body, i)
+                parts.append(body[i + 1:end])
+                i = end + 1
+            else:
+                match = BIBTEX_BARE.match(body, i)
+                if match is None:
+                    break
+                parts.append(macros.get(match.group().lower(), match.group()))
+                i = match.end()
+            while i < len(body) and body[i].isspace():
+                i += 1
+            if body[i:i + 1] != "#":
+                break
+            i += 1
+            while i < len(body) and body[i].isspace():
+                i += 1
+            continue
+        r[name] = "".join(parts).strip()
+        # (3) next field starts after comma
+        comma = body.find(",", i)
+        if comma == -1:
+            break
+        i = comma + 1
+        continue
+    return r
+
+
+def iter_bibtex(f):
+    """
+    yield reference from each bibtex entry ("@article{key, field = {value}, ...}" or "@article(key, ...)"), which can span many lines
+    only one entry is kept in memory at a time; @string macros are remembered and replaced in entries that follow them
+    """
+    macros = dict()
+    entry = list()
+    opening = None
+    start = None
+    for number, line in enumerate(f, start=1):
+        if start is None:
+            # text between entries is ignored
+            if not line.lstrip().startswith("@"):
+                continue
+            start = number
+        entry.append(line)
+        # (1) type of entry and brace or parenthesis that opens it; a line starting with "@" without them isn't an entry
+        if opening is None:
+            opening = BIBTEX_OPENING.search("".join(entry))
+            if opening is None:
+                entry = list()
+                start = None
+                continue
+        # (2) only lines that can close the entry are checked, so a long entry isn't scanned again for every line
+        if ("}" if opening.group(2) == "{" else ")") not in line:
+            continue
+        text = "".join(entry)
+        end = find_entry_end(text, opening.end() - 1)
+        if end == len(text):
+            continue
+        # (3) whole entry read: "@type{key, fields}"
+        kind = opening.group(1).strip().lower()
+        body = text[opening.end():end]
+        entry = list()
+        opening = None
+        first = start
+        start = None
+        # macro, e.g., @string{arpn = "ARPN Journals"}
+        if kind == "string":
+            macros.update(parse_bibtex_fields(body, macros))
+            continue
+        if kind in BIBTEX_SKIPPED:
+            continue
+        fields = parse_bibtex_fields(body[body.find(",") + 1:], macros)
+        # (4) journal of article, book of chapter or conference paper
+        fields.setdefault("journal", fields.get("booktitle"))
+        yield create_record(fields, line=first)
+        continue
+    return
+
+
+def iter_records(location, encoding="utf-8-sig", fmt=None):
+    """
+    yield references from bibliography file one by one (see create_record()), so that file of any size never has to fit in memory
+    'fmt' is "text" (one reference per line), "bibtex" or "ris"; if None, it's based on extension (see get_format())
+    """
+    if not exists(location):
+        logging.error(f"input file doesn't exist, please create it: {location}")
+        raise Exception
+    fmt = fmt or get_format(location)
+    readers = {"text": iter_text, "bibtex": iter_bibtex, "ris": iter_ris}
+    if fmt not in readers:
+        logging.error(f"unknown format of bibliography: {fmt} (available: {list(readers)})")
+        raise Exception
+    count = 0
+    with open(location, "r", encoding=encoding, errors="replace") as f:
+        for record in readers[fmt](f):
+            count += 1
+            yield record
+            continue
+    logging.info(f"ok: read {count} bibliographies ({fmt}) from: {location}")
+    return
+
+
+def iter_batches(records, size=1000):
+    """
+    yield lists of at most 'size' records, so that only one batch is kept in memory at a time
+    """
+    records = iter(records)
+    while True:
+        batch = list(islice(records, size))
+        if not batch:
+            return
+        yield batch
@@ -1,6 +1,7 @@
 """main function"""
 import file_manager
 import logging
+import matcher
 import sys
 import web
 
@@ -14,21 +15,61 @@ def main():
                         encoding="utf-8",
                         handlers=[logging.FileHandler("./log.log"), logging.StreamHandler(sys.stdout)],
                         level=logging.DEBUG)
-    # download a list of predatory scholarly open-access publishers
-    list_publishers = web.get_publishers("https://beallslist.net/")
-    # load txt file contaning your bibliography
-    # print(wtf)
-    my_bibliography = file_manager.load_file("./input/your_bibliography.txt")
-    # compare each bibliography against list of known publishers
+    # matching options: if fuzzy is True then publishers written slightly differently (letter case, punctuation, diacritics, abbreviations)
+    # are found as well, if their similarity (0-1) is at least threshold; otherwise only exact matches are found:
+    # if case_sensitive is False then letter case is ignored,
+    # if whole_words is True then a publisher must not be a part of a longer word (e.g., "Example" in "Examples")
+    fuzzy = False
+    threshold = 0.8
+    case_sensitive = True
+    whole_words = False
+    # downloaded list of publishers is cached in "./output/publishers.json"; it is used as it is for max_age seconds, then the website is asked
+    # if it changed since; if offline is True then only the cached list is used
+    max_age = 24 * 60 * 60
+    offline = False
+    # pages listing predatory publishers and journals, all downloaded at once: source name : link, where names are listed ("list" or "table"),
+    # timeout (seconds) and how many times a failed download is retried; add mirrors here
+    sources = {"publishers": {"link": "https://beallslist.net/", "parser": "list", "timeout": 10, "retries": 2},
+               "standalone journals": {"link": "https://beallslist.net/standalone-journals/", "parser": "list", "timeout": 10, "retries": 2},
+               "hijacked journals": {"link": "https://beallslist.net/hijacked-journals/", "parser": "table", "timeout": 10, "retries": 2}}
+    # download lists of predatory scholarly open-access publishers and journals, merged into one (publisher : sources)
+    list_publishers = web.get_all_publishers(sources, max_age=max_age, offline=offline)
+    # compile all publishers once: index of their n-grams (fuzzy) or automaton that scans each line a single time (exact)
+    if fuzzy is True:
+        publishers = matcher.FuzzyMatcher(list_publishers, threshold=threshold)
+    else:
+        publishers = matcher.Matcher(list_publishers, case_sensitive=case_sensitive, whole_words=whole_words)
+    # your bibliography: plain text (one reference per line), bibtex (.bib) or ris (.ris), read and checked batch_size references at a time
+    fn_bibliography = "./input/your_bibliography.txt"
+    batch_size = 1000
+    # compare each bibliography against list of known publishers: (similarity, publisher, field, start, end, reference), exact matches are 1
+    # publisher and journal of bibtex and ris references are checked (whole reference if neither is known)
     r = list()
-    for line in my_bibliography:
-        logging.debug(f"checking bibliograhy: {line}")
-        for publisher in list_publishers:
-            if publisher in line:
-                logging.info(f"predatory publisher '{publisher}' found in: {line}")
-                r.append(f"publisher '{publisher}' found in bibliography: {line}")
-    # print results
-    full_string = "*" * 60 + "\n--- list of potentailly predatory publishers found in your bibliography ---\n" + "\n".join(r)
+    for batch in file_manager.iter_batches(file_manager.iter_records(fn_bibliography), size=batch_size):
+        for record in batch:
+            logging.debug(f"checking bibliograhy: {record['text']}")
+            for field, text in file_manager.get_searchable(record):
+                if fuzzy is True:
+                    hits = publishers.find(text)
+                else:
+                    hits = [(publisher, 1.0, start, end) for publisher, start, end in publishers.find(text)]
+                for publisher, similarity, start, end in hits:
+                    logging.info(f"predatory publisher '{publisher}' ({', '.join(list_publishers[publisher])}) found in {field} at {start}-{end} "
+                                 f"(similarity: {similarity}) in: {record['text']}")
+                    r.append((similarity, publisher, field, start, end, record))
+                    continue
+                continue
+            continue
+        continue
+    # print results, most similar first (in order of bibliography if equally similar)
+    r.sort(key=lambda hit: -hit[0])
+    lines = list()
+    for similarity, publisher, field, start, end, record in r:
+        doi = f" (doi: {record['doi']})" if record["doi"] else ""
+        lines.append(f"{similarity:.2f} | publisher '{publisher}' ({', '.join(list_publishers[publisher])}) found in bibliography "
+                     f"({field}, characters {start}-{end}, line {record['line']}): {record['text']}{doi}")
+        continue
+    full_string = "*" * 60 + "\n--- list of potentailly predatory publishers found in your bibliography, most similar first ---\n" + "\n".join(lines)
     logging.info(full_string)
     logging.info("program exist")
     return
@@ -0,0 +1,222 @@
+"""find many publishers in a line at once (aho-corasick automaton), or publishers written slightly differently (n-gram index)"""
+from collections import Counter
+from re import finditer
+from unicodedata import combining, normalize
+import logging
+
+
+# setup per-module logger
+log = logging.getLogger(__name__).addHandler(logging.NullHandler())
+
+
+def lower(text):
+    """
+    return text in lowercase with the same length, so that offsets found in it are offsets in the original text
+    (a few characters, e.g., "İ", become longer when lowercased and are kept as they are)
+    """
+    r = text.lower()
+    if len(r) == len(text):
+        return r
+    return "".join(c if len(c.lower()) != 1 else c.lower() for c in text)
+
+
+def is_word_character(c):
+    """
+    return True if character is a part of a word (letter, digit or underscore)
+    """
+    return c.isalnum() or c == "_"
+
+
+class Matcher:
+    """
+    find every publisher in a line in a single pass over its characters, no matter how many publishers there are
+    publishers are compiled once into an automaton: a tree of their characters (one state per prefix) with links to the longest suffix
+    that is also a prefix of some publisher, so that the scan never goes back in the line
+    'case_sensitive' - if False then "arpn journals" matches "ARPN Journals"
+    'whole_words' - if True then publishers only match whole words, e.g., "Example" doesn't match "Examples"
+    """
+    __slots__ = ("patterns", "case_sensitive", "whole_words", "transitions", "fallbacks", "outputs")
+
+    def __init__(self, patterns, case_sensitive=True, whole_words=False):
+        # empty and duplicated publishers are skipped, the first spelling is reported
+        self.patterns = list(dict.fromkeys(pattern.strip() for pattern in patterns if pattern.strip()))
+        self.case_sensitive = case_sensitive
+        self.whole_words = whole_words
+        # (1) tree of characters: transitions[state] is a dictionary of character : next state, state 0 is the root
+        self.transitions = [dict()]
+        outputs = [list()]
+        for i, pattern in enumerate(self.patterns):
+            state = 0
+            for c in pattern if case_sensitive else lower(pattern):
+                if c not in self.transitions[state]:
+                    self.transitions[state][c] = len(self.transitions)
+                    self.transitions.append(dict())
+                    outputs.append(list())
+                state = self.transitions[state][c]
+                continue
+            outputs[state].append(i)
+            continue
+        # (2) fallback links, breadth first: where to continue when the next character doesn't match
+        # each state also reports patterns of its fallback, i.e., publishers that end within a longer one
+        self.fallbacks = [0] * len(self.transitions)
+        queue = list(self.transitions[0].values())
+        for state in queue:
+            for c, child in self.transitions[state].items():
+                fallback = self.fallbacks[state]
+                while fallback and c not in self.transitions[fallback]:
+                    fallback = self.fallbacks[fallback]
+                fallback = self.transitions[fallback].get(c, 0)
+                self.fallbacks[child] = fallback
+                outputs[child] += outputs[self.fallbacks[child]]
+                queue.append(child)
+                continue
+            continue
+        self.outputs = [tuple(output) for output in outputs]
+        logging.info(f"ok: compiled {len(self.patterns)} publishers into {len(self.transitions)} states "
+                     f"(case sensitive: {case_sensitive}, whole words: {whole_words})")
+
+    def is_whole_word(self, line, start, end):
+        """
+        return True if line[start:end] isn't a part of a longer word
+        (only edges of publisher that are word characters need a boundary, e.g., "Pub." can be followed by a letter)
+        """
+        if start > 0 and is_word_character(line[start]) and is_word_character(line[start - 1]):
+            return False
+        if end < len(line) and is_word_character(line[end - 1]) and is_word_character(line[end]):
+            return False
+        return True
+
+    def find(self, line):
+        """
+        return list of every publisher found in line: (publisher, start, end), where line[start:end] is the match, in order of 'end'
+        overlapping publishers are all reported, e.g., "ARPN" and "ARPN Journals"
+        """
+        r = list()
+        transitions = self.transitions
+        fallbacks = self.fallbacks
+        outputs = self.outputs
+        state = 0
+        for end, c in enumerate(line if self.case_sensitive else lower(line), start=1):
+            while state and c not in transitions[state]:
+                state = fallbacks[state]
+            state = transitions[state].get(c, 0)
+            for i in outputs[state]:
+                start = end - len(self.patterns[i])
+                if not self.whole_words or self.is_whole_word(line, start, end):
+                    r.append((self.patterns[i], start, end))
+                continue
+            continue
+        return r
+
+
+# abbreviations often used in names of publishers and journals, replaced with full words before comparing (empty = left out)
+ABBREVIATIONS = {"j": "journal", "jour": "journal", "jrnl": "journal", "int": "international", "intl": "international",
+                 "pub": "publishing", "publ": "publishing", "publ'g": "publishing", "sci": "science", "res": "research",
+                 "acad": "academic", "am": "american", "univ": "university", "assoc": "association", "soc": "society",
+                 "and": "", "of": "", "the": "", "for": "", "inc": "", "ltd": "", "llc": "", "co": ""}
+
+
+def fold(word):
+    """
+    return word without diacritics and letter case, e.g., "Über" -> "uber", with abbreviation replaced (e.g., "Int" -> "international")
+    """
+    word = "".join(c for c in normalize("NFKD", word) if not combining(c)).casefold()
+    return ABBREVIATIONS.get(word, word)
+
+
+def tokenize(text):
+    """
+    return list of (folded word, start, end) in text, where text[start:end] is the original word; punctuation is left out
+    """
+    r = list()
+    for match in finditer(r"\w+", text):
+        word = fold(match.group())
+        if word:
+            r.append((word, match.start(), match.end()))
+        continue
+    return r
+
+
+def get_ngrams(words, n=3):
+    """
+    return set of character n-grams of words joined with spaces, e.g., ["ab", "c"] -> {" ab", "ab ", "b c", " c "}
+    """
+    text = f" {' '.join(words)} "
+    return {text[i:i + n] for i in range(max(1, len(text) - n + 1))}
+
+
+def get_similarity(a, b):
+    """
+    return dice coefficient of two sets of n-grams: 1 if they are the same, 0 if they have nothing in common
+    """
+    if not a or not b:
+        return 0.0
+    return 2 * len(a & b) / (len(a) + len(b))
+
+
+class FuzzyMatcher:
+    """
+    find publishers written differently than on the list: other letter case, punctuation, diacritics or abbreviations
+    publishers are folded (see fold()) and indexed once by their character n-grams (n-gram : publishers that have it);
+    a line is looked up in the index, so only publishers that share enough n-grams with it are candidates,
+    and only candidates are compared with the words of the line (dice coefficient of n-grams)
+    'threshold' - lowest similarity (0-1) that is reported
+    """
+    __slots__ = ("patterns", "threshold", "n", "words", "ngrams", "index")
+
+    def __init__(self, patterns, threshold=0.8, n=3):
+        # empty and duplicated publishers are skipped, the first spelling is reported
+        self.patterns = list(dict.fromkeys(pattern.strip() for pattern in patterns if pattern.strip()))
+        self.threshold = threshold
+        self.n = n
+        # (1) folded words and n-grams of each publisher
+        self.words = [[word for word, _, _ in tokenize(pattern)] for pattern in self.patterns]
+        self.ngrams = [get_ngrams(words, n) if words else set() for words in self.words]
+        # (2) inverted index: n-gram : publishers that have it
+        self.index = dict()
+        for i, ngrams in enumerate(self.ngrams):
+            for ngram in ngrams:
+                self.index.setdefault(ngram, list()).append(i)
+                continue
+            continue
+        logging.info(f"ok: indexed {len(self.patterns)} publishers by {len(self.index)} {n}-grams (threshold: {threshold})")
+
+    def get_candidates(self, ngrams):
+        """
+        return publishers that share enough n-grams with 'ngrams' (n-grams of a line) to reach 'threshold'
+        a part of line with x n-grams in common with publisher (a n-grams) has dice 2x / (a + b) >= threshold only if x >= threshold / (2 - threshold) * a,
+        because it has at least x n-grams (b >= x); fewer shared n-grams can't reach threshold, so no match is lost
+        """
+        counts = Counter()
+        for ngram in ngrams:
+            counts.update(self.index.get(ngram, ()))
+            continue
+        share = self.threshold / (2 - self.threshold)
+        return [i for i, count in counts.items() if count >= share * len(self.ngrams[i])]
+
+    def find(self, line):
+        """
+        return list of publishers similar to a part of line: (publisher, similarity, start, end), most similar first
+        each candidate is compared with every run of consecutive words of line that is as long as the publisher (plus/minus one word),
+        line[start:end] is the most similar run
+        """
+        r = list()
+        tokens = tokenize(line)
+        if not tokens:
+            return r
+        words = [word for word, _, _ in tokens]
+        for i in self.get_candidates(get_ngrams(words, self.n)):
+            best = (0.0, 0, 0)
+            length = len(self.words[i])
+            for size in range(max(1, length - 1), length + 2):
+                for first in range(0, max(1, len(tokens) - size + 1)):
+                    last = min(first + size, len(tokens)) - 1
+                    similarity = get_similarity(self.ngrams[i], get_ngrams(words[first:last + 1], self.n))
+                    if similarity > best[0]:
+                        best = (similarity, tokens[first][1], tokens[last][2])
+                    continue
+                continue
+            if best[0] >= self.threshold:
+                r.append((self.patterns[i], round(best[0], 4), best[1], best[2]))
+            continue
+        return sorted(r, key=lambda hit: -hit[1])
@@ -0,0 +1,86 @@
+"""check that references are read from bibtex and ris files (run with pytest)"""
+import file_manager
+
+
+def read(tmp_path, name, content, encoding="utf-8"):
+    """
+    return list of records read from file 'name' with 'content'
+    """
+    fn = tmp_path / name
+    fn.write_text(content, encoding=encoding)
+    return list(file_manager.iter_records(str(fn)))
+
+
+def test_bibtex_multi_line_entry(tmp_path):
+    """
+    entry spans many lines, text between entries is ignored, each record knows the line it starts on
+    """
+    r = read(tmp_path, "refs.bib", "comment before entries\n"
+                                   "@article{doe2019,\n"
+                                   "  author = {Doe, John},\n"
+                                   "  journal = {Global Journal of Engineering},\n"
+                                   "  year = 2019\n"
+                                   "}\n"
+                                   "\n"
+                                   "@book{roe2020, publisher = {Example Publishing}}\n")
+    assert [(record["journal"], record["publisher"], record["year"], record["line"]) for record in r] == [
+        ("Global Journal of Engineering", None, "2019", 2),
+        (None, "Example Publishing", None, 8)]
+
+
+def test_bibtex_string_macros(tmp_path):
+    """
+    @string macros are replaced in entries that follow them, parts of values are joined with "#"
+    """
+    r = read(tmp_path, "refs.bib", '@string{arpn = "ARPN"}\n'
+                                   "@string(jour = {Journals})\n"
+                                   '@article{k1, journal = arpn # " " # jour, publisher = "Press of " # arpn}\n')
+    assert [(record["journal"], record["publisher"]) for record in r] == [("ARPN Journals", "Press of ARPN")]
+
+
+def test_bibtex_nested_braces_and_quotes(tmp_path):
+    """
+    nested braces keep value together, quotes within braces and escaped quotes don't end a value
+    """
+    r = read(tmp_path, "refs.bib", '@inproceedings{k1, booktitle = {{IEEE} "Conference"}, title = "M\\"uller {and} Sons", year = {2001}}\n')
+    assert r[0]["journal"] == 'IEEE "Conference"'
+    assert r[0]["title"] == "Müller and Sons"
+    assert r[0]["year"] == "2001"
+
+
+def test_bibtex_entry_in_parentheses(tmp_path):
+    """
+    entry can be written in parentheses instead of braces; parentheses within values don't end it
+    """
+    r = read(tmp_path, "refs.bib", '@book(k2, publisher = {Paren Press}, title = "A (Short) Title",\n'
+                                   "  year = 2009)\n"
+                                   "@article{k3, journal = {Next Journal}}\n")
+    assert [(record["publisher"], record["title"], record["year"], record["journal"]) for record in r] == [
+        ("Paren Press", "A (Short) Title", "2009", None),
+        (None, None, None, "Next Journal")]
+
+
+def test_ris_entries(tmp_path):
+    """
+    each entry starts with "TY" and ends with "ER", the first of tags for the same field is kept
+    """
+    r = read(tmp_path, "refs.ris", "TY  - JOUR\n"
+                                   "AU  - Doe, John\n"
+                                   "JO  - Global Journal of Engineering\n"
+                                   "JF  - Other Journal Name\n"
+                                   "PB  - Example Publishing\n"
+                                   "ER  - \n"
+                                   "TY  - BOOK\n"
+                                   "PY  - 2020\n"
+                                   "ER  - \n")
+    assert [(record["author"], record["journal"], record["publisher"], record["year"], record["line"]) for record in r] == [
+        ("Doe, John", "Global Journal of Engineering", "Example Publishing", None, 1),
+        (None, None, None, "2020", 7)]
+
+
+def test_ris_with_byte_order_mark(tmp_path):
+    """
+    byte order mark at the start of file doesn't hide the first "TY" tag
+    """
+    r = read(tmp_path, "refs.ris", "TY  - JOUR\nJO  - First Journal\nER  - \n", encoding="utf-8-sig")
+    assert [record["journal"] for record in r] == ["First Journal"]
@@ -0,0 +1,49 @@
+"""check that publishers are found (run with pytest)"""
+import matcher
+
+
+def test_fuzzy_finds_truncated_name():
+    """
+    truncated name shares less than 'threshold' of publisher's n-grams, but its similarity is above threshold
+    """
+    publishers = matcher.FuzzyMatcher(["Global Journal of Engineering Science and Research Management"], threshold=0.8)
+    line = "Doe. 2019. A title. Global Journal of Engineering Science and Research 3(1)"
+    r = publishers.find(line)
+    assert [publisher for publisher, _, _, _ in r] == ["Global Journal of Engineering Science and Research Management"]
+    assert r[0][1] >= 0.8
+    assert line[r[0][2]:r[0][3]] == "Global Journal of Engineering Science and Research"
+
+
+def test_overlapping_publishers():
+    """
+    publisher within a longer one and publishers that overlap are all found, in order of where they end
+    """
+    publishers = matcher.Matcher(["ARPN", "ARPN Journals", "Journals of Science"])
+    line = "Doe. ARPN Journals of Science 3(1)"
+    r = publishers.find(line)
+    assert [(publisher, line[start:end]) for publisher, start, end in r] == [("ARPN", "ARPN"),
+                                                                            ("ARPN Journals", "ARPN Journals"),
+                                                                            ("Journals of Science", "Journals of Science")]
+
+
+def test_whole_words():
+    """
+    publisher matches at the start and end of line and next to punctuation, but not within a longer word
+    """
+    publishers = matcher.Matcher(["Example", "Pub."], whole_words=True)
+    assert [start for _, start, _ in publishers.find("Example Press, Examples")] == [0]
+    assert [start for _, start, _ in publishers.find("Examples by Example")] == [12]
+    assert [start for _, start, _ in publishers.find("(Example), Counterexample")] == [1]
+    # edge of publisher that isn't a word character needs no boundary
+    assert [publisher for publisher, _, _ in publishers.find("Pub.Co")] == ["Pub."]
+    assert publishers.find("Republ.") == list()
+
+
+def test_case_insensitive_offsets():
+    """
+    offsets of case insensitive match point into the original line, also after characters that change length when lowercased
+    """
+    publishers = matcher.Matcher(["arpn journals"], case_sensitive=False)
+    line = "İstanbul: ARPN JOURNALS, 2019"
+    r = publishers.find(line)
+    assert [(publisher, line[start:end]) for publisher, start, end in r] == [("arpn journals", "ARPN JOURNALS")]
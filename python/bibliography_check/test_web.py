@@ -0,0 +1,112 @@
+"""check that lists of publishers are downloaded, revalidated and cached (run with pytest)"""
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from threading import Thread
+import pytest
+import web
+
+
+PAGE = """<html><head><title>publishers</title></head><body>
+<div class="wp-block-column" style="flex-basis: 75%;"><ul>
+<li><a href="https://example.com/arpn">ARPN Journals</a></li>
+<li>Example Publishing</li>
+</ul></div></body></html>"""
+ETAG = '"v1"'
+
+
+class Handler(BaseHTTPRequestHandler):
+    """
+    serve PAGE with an etag, answer "not modified" if the client already has it; every request is kept in 'requests'
+    """
+    requests = list()
+
+    def do_GET(self):
+        if self.headers.get("If-None-Match") == ETAG:
+            self.requests.append(304)
+            self.send_response(304)
+            self.end_headers()
+            return
+        body = PAGE.encode("utf-8")
+        self.requests.append(200)
+        self.send_response(200)
+        self.send_header("Content-Type", "text/html; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("ETag", ETAG)
+        self.end_headers()
+        self.wfile.write(body)
+        return
+
+    def log_message(self, format, *args):
+        return
+
+
+@pytest.fixture
+def link():
+    """
+    link to PAGE served on localhost for the duration of a test
+    """
+    Handler.requests = list()
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    thread = Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_address[1]}/"
+    server.shutdown()
+    server.server_close()
+
+
+def test_fresh_download(link, tmp_path):
+    """
+    without cache, website is downloaded and parsed, and the list is saved with its etag
+    """
+    cache_fn = str(tmp_path / "publishers.json")
+    assert web.get_publishers(link, cache_fn=cache_fn) == ["ARPN Journals", "Example Publishing"]
+    assert Handler.requests == [200]
+    assert web.load_cache(cache_fn)[link]["etag"] == ETAG
+
+
+def test_not_modified_reuses_cache(link, tmp_path):
+    """
+    once the list is older than 'max_age', website is asked if it changed; "not modified" keeps the cached list
+    """
+    cache_fn = str(tmp_path / "publishers.json")
+    web.get_publishers(link, cache_fn=cache_fn)
+    cache = web.load_cache(cache_fn)
+    cache[link]["publishers"] = ["Cached Publisher"]
+    web.save_cache(cache, cache_fn)
+    assert web.get_publishers(link, cache_fn=cache_fn, max_age=0) == ["Cached Publisher"]
+    assert Handler.requests == [200, 304]
+    assert web.load_cache(cache_fn)[link]["checked"] >= cache[link]["checked"]
+
+
+def test_recent_cache_skips_request(link, tmp_path):
+    """
+    list younger than 'max_age' is used without asking website
+    """
+    cache_fn = str(tmp_path / "publishers.json")
+    web.get_publishers(link, cache_fn=cache_fn)
+    assert web.get_publishers(link, cache_fn=cache_fn, max_age=60) == ["ARPN Journals", "Example Publishing"]
+    assert Handler.requests == [200]
+
+
+def test_offline(link, tmp_path):
+    """
+    offline, only the cached list is used (however old it is); it's an error if there is none
+    """
+    cache_fn = str(tmp_path / "publishers.json")
+    with pytest.raises(Exception):
+        web.get_publishers(link, cache_fn=cache_fn, offline=True)
+    web.get_publishers(link, cache_fn=cache_fn)
+    assert web.get_publishers(link, cache_fn=cache_fn, max_age=0, offline=True) == ["ARPN Journals", "Example Publishing"]
+    assert Handler.requests == [200]
+
+
+def test_all_publishers_skip_source_without_snapshot(link, tmp_path):
+    """
+    offline, sources with a cached list are merged and a source without one is skipped
+    """
+    cache_fn = str(tmp_path / "publishers.json")
+    web.get_publishers(link, cache_fn=cache_fn)
+    sources = {"publishers": {"link": link},
+               "mirror": {"link": f"{link}mirror"}}
+    r = web.get_all_publishers(sources, cache_fn=cache_fn, offline=True)
+    assert r == {"ARPN Journals": ["publishers"], "Example Publishing": ["publishers"]}
+    assert Handler.requests == [200]
@@ -1,5 +1,12 @@
 """download a list of predatory publishers"""
 from bs4 import BeautifulSoup
+from concurrent.futures import as_completed, ThreadPoolExecutor
+from json import dump, load
+from os import makedirs, replace
+from os.path import dirname, exists
+from threading import Lock
+from time import sleep, time
+from unicodedata import normalize
 import logging
 import requests
 
@@ -7,15 +14,52 @@ import requests
 # setup per-module logger
 log = logging.getLogger(__name__).addHandler(logging.NullHandler())
 
+# responses that are worth asking again (too many requests, server errors)
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+# cache file is read and written by one source at a time
+cache_lock = Lock()
 
-def download_website(link, encoding="utf-8", timeout=10):
+
+def create_session(pool_size=10):
+    """
+    create http session that keeps connections open and reuses them for requests to the same host (up to 'pool_size' at once)
+    """
+    session = requests.Session()
+    adapter = requests.adapters.HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+def request_website(link, session=None, headers=None, timeout=10, retries=0, backoff=1):
+    """
+    send GET request and return response, using session if given (otherwise a one-off connection)
+    requests that fail (no connection, timeout, server error) are sent again up to 'retries' times, waiting 'backoff' seconds longer before each one
+    """
+    for attempt in range(retries + 1):
+        try:
+            r = (session or requests).get(link, headers=headers, timeout=timeout)
+            if r.status_code in RETRY_STATUSES:
+                r.raise_for_status()
+        except Exception as e:
+            if attempt == retries:
+                raise
+            logging.warning(f"failed to download website '{link}' (attempt {attempt + 1} of {retries + 1}), "
+                            f"trying again in {backoff * (attempt + 1)} seconds; reason: {e}")
+            sleep(backoff * (attempt + 1))
+            continue
+        r.raise_for_status()
+        return r
+
+
+def download_website(link, encoding="utf-8", timeout=10, session=None, retries=0):
     """
     download a website and return its content as string
     """
     # send a GET request to website and receive its content
     logging.debug(f"trying to download website: {link}; timeout={timeout} seconds")
     try:
-        r = requests.get(link, timeout=timeout)
+        r = request_website(link, session=session, timeout=timeout, retries=retries)
     except Exception as e:
         logging.error(f"failed to download website '{link}', reason: {e}")
         raise
@@ -43,14 +87,15 @@ def create_soup(html_content):
     return soup
 
 
-def get_publishers(link, encoding="utf-8", timeout=10):
+def parse_publishers(html, parser="list"):
     """
-
+    return list of publishers found on website (html content)
+    'parser' is where they are listed within main div: "list" (first unordered list, e.g., publishers) or "table" (first column, e.g., hijacked journals)
     """
+    if parser == "table":
+        return parse_table(html)
     # define list of publishers that will be returned
     r = list()
-    # download website: list of publishers
-    html = download_website(link, encoding=encoding, timeout=timeout)
     # create bs4 soup object
     soup = create_soup(html)
     # select main div containing article
@@ -73,5 +118,171 @@ def get_publishers(link, encoding="utf-8", timeout=10):
         # append publisher to link
         r.append(link)
         continue
-    logging.info(f"ok: downloaded a list of {len(r)} predatory publishers")
+    return r
+
+
+def parse_table(html):
+    """
+    return list of names in first column of the first table within main div (header row is skipped)
+    """
+    r = list()
+    soup = create_soup(html)
+    main_div = soup.find("div", attrs={"class": "wp-block-column", "style": "flex-basis: 75%;"})
+    table = (main_div or soup).find("table")
+    if table is None:
+        logging.error("failed to find table within main div containing article")
+        raise Exception
+    for row in table.find_all("tr"):
+        cell = row.find("td")
+        # header row has "th" cells only
+        if cell is not None:
+            r.append(cell.text)
+        continue
+    return r
+
+
+def normalize_name(name):
+    """
+    return publisher or journal name with unicode compatibility characters replaced (e.g., non-breaking space),
+    whitespace collapsed and surrounding spaces, commas, semicolons and quotes removed
+    """
+    return " ".join(normalize("NFKC", name).split()).strip(" ,;\"'“”")
+
+
+def load_cache(fn):
+    """
+    return dictionary of link : cached list of publishers (see get_publishers()), empty if there is no cache yet or it can't be read
+    """
+    if not exists(fn):
+        return dict()
+    try:
+        with open(fn, "r", encoding="utf-8") as f:
+            return load(f)
+    except Exception as e:
+        logging.warning(f"failed to load cached publishers, they will be downloaded again: {fn}; reason: {e}")
+        return dict()
+
+
+def save_cache(cache, fn):
+    """
+    save dictionary of link : cached list of publishers; written to a temporary file first, so that a failed write never leaves a broken cache
+    """
+    if dirname(fn):
+        makedirs(dirname(fn), exist_ok=True)
+    with open(f"{fn}.tmp", "w", encoding="utf-8") as f:
+        dump(cache, f, indent=4, ensure_ascii=False)
+    replace(f"{fn}.tmp", fn)
+    logging.debug(f"saved cached publishers: {fn}")
+    return
+
+
+def get_publishers(link, encoding="utf-8", timeout=10, cache_fn="./output/publishers.json", max_age=24 * 60 * 60, offline=False,
+                   session=None, retries=0, parser="list"):
+    """
+    return list of publishers from website, e.g., "https://beallslist.net/"
+    the parsed list is cached in 'cache_fn' (None turns the cache off) along with website's etag and last-modified headers:
+        - if it's younger than 'max_age' seconds then website isn't asked at all
+        - otherwise website is asked if it changed since (conditional request), an unchanged website is neither downloaded nor parsed again
+        - if website can't be reached then the last list that was downloaded is used
+    if 'offline' is True then only the cached list is used, and it's an error if there is none
+    'session' (see create_session()), 'retries' and 'parser' (see parse_publishers()) are used when website is asked
+    """
+    cache = load_cache(cache_fn) if cache_fn else dict()
+    cached = cache.get(link)
+    # (1) offline: last good list, however old it is
+    if offline is True:
+        if cached is None:
+            logging.error(f"offline, but there are no cached publishers for '{link}' in: {cache_fn}")
+            raise Exception
+        logging.info(f"ok: offline, using a list of {len(cached['publishers'])} cached publishers (downloaded {round((time() - cached['downloaded']) / 3600, 1)} hours ago)")
+        return cached["publishers"]
+    # (2) recently checked list is used as it is
+    if cached is not None and time() - cached["checked"] < max_age:
+        logging.info(f"ok: using a list of {len(cached['publishers'])} cached publishers (checked {round((time() - cached['checked']) / 3600, 1)} hours ago)")
+        return cached["publishers"]
+    # (3) ask website, sending what is known about the cached list so that it can answer "not modified"
+    headers = dict()
+    if cached is not None:
+        if cached.get("etag"):
+            headers["If-None-Match"] = cached["etag"]
+        if cached.get("last_modified"):
+            headers["If-Modified-Since"] = cached["last_modified"]
+    logging.debug(f"trying to download website: {link}; timeout={timeout} seconds; conditional: {bool(headers)}")
+    try:
+        response = request_website(link, session=session, headers=headers, timeout=timeout, retries=retries)
+    except Exception as e:
+        if cached is None:
+            logging.error(f"failed to download website '{link}', reason: {e}")
+            raise
+        logging.warning(f"failed to download website '{link}', using a list of {len(cached['publishers'])} cached publishers instead; reason: {e}")
+        return cached["publishers"]
+    # (4) unchanged: cached list is still valid
+    if response.status_code == 304 and cached is not None:
+        logging.info(f"ok: website hasn't changed, using a list of {len(cached['publishers'])} cached publishers: {link}")
+        cached["checked"] = time()
+    # (5) changed (or not cached yet): parse it again
+    else:
+        # if custom encoding was provided, encode it
+        if encoding:
+            response.encoding = encoding
+        html = response.text
+        logging.info(f"ok: downloaded website ({len(html)} characters): {link}")
+        cached = {"publishers": parse_publishers(html, parser=parser),
+                  "etag": response.headers.get("ETag"),
+                  "last_modified": response.headers.get("Last-Modified"),
+                  "downloaded": time(),
+                  "checked": time()}
+        logging.info(f"ok: downloaded a list of {len(cached['publishers'])} predatory publishers")
+    if cache_fn:
+        # cache is read again, other sources may have saved their lists since
+        with cache_lock:
+            cache = load_cache(cache_fn)
+            cache[link] = cached
+            save_cache(cache, cache_fn)
+    return cached["publishers"]
+
+
+def get_all_publishers(sources, cache_fn="./output/publishers.json", max_age=24 * 60 * 60, offline=False, pool_size=10):
+    """
+    return dictionary of publisher or journal : list of sources it was found in, e.g., {"ARPN Journals": ["publishers", "mirror"]}
+    'sources' is a dictionary of source name : {"link": ..., "parser": "list" or "table", "timeout": seconds, "retries": number}
+    all sources are downloaded at once over one session (connections are reused) and each is parsed as soon as it arrives (see get_publishers())
+    names are normalized and compared ignoring letter case, the first spelling found is kept; sources that fail are skipped
+    """
+    found = dict()
+    with create_session(pool_size=pool_size) as session:
+        with ThreadPoolExecutor(max_workers=max(1, min(pool_size, len(sources)))) as executor:
+            futures = {executor.submit(get_publishers,
+                                       link=source["link"],
+                                       timeout=source.get("timeout", 10),
+                                       cache_fn=cache_fn,
+                                       max_age=max_age,
+                                       offline=offline,
+                                       session=session,
+                                       retries=source.get("retries", 0),
+                                       parser=source.get("parser", "list")): name for name, source in sources.items()}
+            for future in as_completed(futures):
+                name = futures[future]
+                try:
+                    found[name] = future.result()
+                except Exception as e:
+                    logging.error(f"failed to get publishers from source '{name}' ({sources[name]['link']}), it will be skipped; reason: {e!r}")
+                continue
+    if not found:
+        logging.error("failed to get publishers from any source")
+        raise Exception
+    # merge in order of sources (not in order of arrival), so that the result is always the same
+    r = dict()
+    spellings = dict()
+    for name in sources:
+        for publisher in found.get(name, list()):
+            publisher = normalize_name(publisher)
+            if not publisher:
+                continue
+            publisher = spellings.setdefault(publisher.casefold(), publisher)
+            if name not in r.setdefault(publisher, list()):
+                r[publisher].append(name)
+            continue
+        continue
+    logging.info(f"ok: merged {len(r)} publishers and journals from {len(found)} of {len(sources)} sources")
     return r
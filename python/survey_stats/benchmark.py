@@ -0,0 +1,208 @@
+"""benchmark each stage of the pipeline on synthetic surveys (9)"""
+from argparse import ArgumentParser
+from importlib.util import find_spec
+from json import dump, load
+from os.path import join
+from platform import platform, python_version
+from subprocess import run
+from tempfile import TemporaryDirectory
+from time import perf_counter, strftime
+import comp
+import fm
+import lang
+import logging
+import numpy as np
+import pandas as pd
+import sys
+import target
+
+
+# setup per-module logger
+log = logging.getLogger(__name__).addHandler(logging.NullHandler())
+
+
+def generate_survey(fn, lang_db, colls_db, survey_lang, participants, clicker_ratio=0.05, wrong_ratio=0.05, scale=7, seed=0):
+    """
+    save synthetic google forms csv in language (e.g., "pl") that matches lang_db and colls_db
+    'clicker_ratio' of participants click the same answer, 'wrong_ratio' of participants answer "no" to one of the filter questions
+    the same seed always gives the same csv
+    """
+    rng = np.random.default_rng(seed)
+
+    def column(name):
+        return lang_db.column(name, survey_lang)
+
+    def answer(name):
+        return lang_db.answer(name, survey_lang)
+
+    def choice(names):
+        return pd.Categorical.from_codes(rng.integers(0, len(names), participants), categories=[answer(name) for name in names])
+
+    # (1) demographics
+    r = {"Timestamp": np.full(participants, "2022/05/01 12:00:00 PM GMT+2")}
+    wrong = rng.random(participants) < wrong_ratio
+    wrong_question = rng.integers(0, 3, participants)
+    for i, name in enumerate(["is_l1", "is_l2", "how_often"]):
+        correct = answer("often_daily") if name == "how_often" else answer("yes")
+        r[column(name)] = np.where(wrong & (wrong_question == i), answer("no"), correct)
+        continue
+    r[column("age_begin_eng")] = rng.integers(3, 16, participants)
+    r[column("birth_year")] = rng.integers(1990, 2004, participants)
+    r[column("what_gender")] = choice(["gender_female", "gender_male", "gender_nonbinary", "gender_notsay", "gender_other"])
+    r[column("how_big_city")] = choice(["less_than_15k", "15k_to_75k", "75k_to_150k", "150k_to_500k", "more_than_500k"])
+    r[column("which_uni_year")] = pd.Categorical.from_codes(rng.integers(0, 6, participants), categories=["1", "2", "3", "4", "5", answer("uni_other")])
+    obj = pd.DataFrame(r)
+    # (2) ratings, clickers click the same answer every time
+    ratings = rng.integers(1, scale + 1, (participants, len(colls_db)), dtype=np.int8)
+    clickers = rng.random(participants) < clicker_ratio
+    ratings[clickers] = rng.integers(1, scale + 1, (int(clickers.sum()), 1), dtype=np.int8)
+    ratings = pd.DataFrame(ratings, columns=[f"{column('rate_competence')}.{i}" if i else column("rate_competence") for i in range(len(colls_db))])
+    obj = pd.concat([obj, ratings], axis=1)
+    # (3) save with duplicate rating columns, the same way google forms does
+    fm.create_dir_if_doesnt_exist(fn)
+    obj.to_csv(fn, index=False, header=list(obj.columns[:-len(colls_db)]) + [column("rate_competence")] * len(colls_db))
+    logging.info(f"ok: generated synthetic survey ({survey_lang}): {fn} (participants: {participants}, clickers: {int(clickers.sum())}, wrong answers: {int(wrong.sum())})")
+    return
+
+
+def time_stage(results, name, function, *args, **kwargs):
+    """
+    run function, save how long it took (seconds) in results under name, return what function returned
+    """
+    start_time = perf_counter()
+    r = function(*args, **kwargs)
+    results[name] = round(perf_counter() - start_time, 6)
+    print(f"\t{name:<45} {results[name]:>10.4f} seconds")
+    return r
+
+
+def benchmark_scale(lang_db, colls_db, participants, directory, seed=0, clicker_ratio=0.05, wrong_ratio=0.05):
+    """
+    return dictionary of stage : seconds for synthetic surveys with 'participants' participants per language
+    """
+    r = dict()
+    enabled = {"get_participant_size":True, "get_began_english":True, "get_age":True, "get_gender":True, "get_city":True, "get_uni_year":True,
+               "display_dataframes":False, "use_csv_from_input":True, "use_incremental":False, "get_descriptives":True,
+               "use_parallel_processing":False}
+    d_filter_conditions = comp.get_filter_conditions(lang_db)
+    colname = lang_db.column("rate_competence")
+    means = dict()
+    for i, survey_lang in enumerate(lang.LANGUAGE_NAMES):
+        fn = join(directory, f"survey_{survey_lang}_{participants}.csv")
+        time_stage(r, f"generate ({survey_lang})", generate_survey, fn=fn, lang_db=lang_db, colls_db=colls_db, survey_lang=survey_lang,
+                   participants=participants, clicker_ratio=clicker_ratio, wrong_ratio=wrong_ratio, seed=seed + i)
+        # (1) fm
+        time_stage(r, f"fm.load_csv ({survey_lang})", fm.load_csv, fn=fn, survey_lang=survey_lang)
+        dtype = fm.build_dtype_schema(lang_db=lang_db, colls_db=colls_db, survey_lang=survey_lang)
+        original = time_stage(r, f"fm.load_csv typed ({survey_lang})", fm.load_csv, fn=fn, survey_lang=survey_lang, dtype=dtype)
+        time_stage(r, f"fm.load_csv projected ({survey_lang})", fm.load_csv, fn=fn, survey_lang=survey_lang, dtype=dtype,
+                   usecols=comp.get_survey_columns(lang_db=lang_db, colls_db=colls_db, survey_lang=survey_lang))
+        # (2) lang
+        if survey_lang != "en":
+            original = time_stage(r, f"lang.translate_to_en ({survey_lang})", lang.translate_to_en, obj=original, lang_db=lang_db, language=survey_lang)
+        # (3) target
+        obj_means = time_stage(r, f"target.get_means ({survey_lang})", target.get_means, original, colls_db=colls_db, lang_db=lang_db, survey_lang=survey_lang)
+        masks = time_stage(r, f"target.find_wrong_answers ({survey_lang})", target.find_wrong_answers, obj=obj_means, d_filter_conditions=d_filter_conditions, survey_lang=survey_lang)
+        clickers = time_stage(r, f"target.find_clickers ({survey_lang})", target.find_clickers, obj_means=obj_means, obj_original=original, colname=colname,
+                              max_clicker_ratio=80, survey_lang=survey_lang)
+        masks["clickers"] = obj_means.index.isin(clickers)
+        time_stage(r, f"target.apply_exclusions ({survey_lang})", target.apply_exclusions, obj=obj_means, masks=masks, survey_lang=survey_lang)
+        # (4) comp, whole chain for one language
+        means[survey_lang], report, reliability = time_stage(r, f"comp.process_language ({survey_lang})", comp.process_language, lang_db=lang_db, colls_db=colls_db, survey_lang=survey_lang,
+                                                fn_survey_input=fn, d_filter_conditions=d_filter_conditions, max_clicker_ratio=80, typed=True)
+        continue
+    means_both = time_stage(r, "comp.combine_dfs", comp.combine_dfs, means=means, enabled=enabled)
+    time_stage(r, "comp.get_participants_statistics", comp.get_participants_statistics, lang_db=lang_db, means=means, enabled=enabled)
+    time_stage(r, "comp.compare_languages (1000 resamples)", comp.compare_languages, colls_db=colls_db, obj=means_both, enabled=enabled, resamples=1000)
+    time_stage(r, "fm.save_dataframe csv", fm.save_dataframe, obj=means_both, fn=join(directory, "combined.csv"))
+    if find_spec("pyarrow") is not None:
+        time_stage(r, "fm.save_dataframe parquet", fm.save_dataframe, obj=means_both, fn=join(directory, "combined.parquet"))
+        time_stage(r, "fm.load_dataframe parquet", fm.load_dataframe, fn=join(directory, "combined.parquet"), survey_lang="all")
+    return r
+
+
+def get_revision():
+    """
+    return current git commit (short hash), or None if not available
+    """
+    try:
+        return run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except Exception:
+        return None
+
+
+def compare(fn_old, fn_new):
+    """
+    print how much faster or slower each stage got between two benchmark json files
+    """
+    with open(fn_old, "r", encoding="utf-8") as f:
+        old = load(f)
+    with open(fn_new, "r", encoding="utf-8") as f:
+        new = load(f)
+    print(f"comparing {old['revision']} ({fn_old}) -> {new['revision']} ({fn_new})")
+    for participants, stages in new["results"].items():
+        for stage, seconds in stages.items():
+            before = old["results"].get(participants, dict()).get(stage)
+            if before is None:
+                continue
+            print(f"{participants:>8} participants | {stage:<45} | {before:>10.4f} -> {seconds:>10.4f} seconds ({seconds / before if before else float('inf'):.2f}x)")
+            continue
+        continue
+    return
+
+
+def main():
+    """
+    benchmark the pipeline at several scales and save results as json; compare two json files with --compare
+    """
+    parser = ArgumentParser(description="benchmark survey_stats on synthetic surveys")
+    parser.add_argument("--participants", type=int, nargs="+", default=[1000, 10000, 100000], help="participants per language, one run for each (1000000 needs several GB of memory)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--clicker-ratio", type=float, default=0.05)
+    parser.add_argument("--wrong-ratio", type=float, default=0.05)
+    parser.add_argument("--output", default=f"./output/benchmark_{strftime('%Y%m%d_%H%M%S')}.json")
+    parser.add_argument("--compare", nargs=2, metavar=("OLD", "NEW"), help="compare two benchmark json files instead of running")
+    args = parser.parse_args()
+    # setup logger, only errors are printed (otherwise each clicker would be logged)
+    logging.basicConfig(datefmt="%G-%m-%d %T",
+                        format="%(asctime)s [%(levelname)s] %(module)s.py : %(funcName)s() - %(message)s",
+                        handlers=[logging.StreamHandler(sys.stdout)],
+                        level=logging.ERROR)
+    if args.compare:
+        compare(*args.compare)
+        return
+    # (1) load the same language database and column names as main.py
+    lang_db = fm.load_lang_db(fn="./input/lang_db.json")
+    colls_db = fm.load_columns(fn="./input/column_names.txt")
+    # (2) run each scale in a temporary directory
+    r = {"revision": get_revision(),
+         "date": strftime("%G-%m-%d %T"),
+         "python": python_version(),
+         "pandas": pd.__version__,
+         "numpy": np.__version__,
+         "platform": platform(),
+         "seed": args.seed,
+         "results": dict()}
+    for participants in args.participants:
+        print(f"{participants} participants per language:")
+        with TemporaryDirectory() as directory:
+            start_time = perf_counter()
+            r["results"][str(participants)] = benchmark_scale(lang_db=lang_db,
+                                                              colls_db=colls_db,
+                                                              participants=participants,
+                                                              directory=directory,
+                                                              seed=args.seed,
+                                                              clicker_ratio=args.clicker_ratio,
+                                                              wrong_ratio=args.wrong_ratio)
+            print(f"\ttotal: {round(perf_counter() - start_time, 3)} seconds")
+        continue
+    # (3) save to json
+    fm.create_dir_if_doesnt_exist(args.output)
+    with open(args.output, "w", encoding="utf-8") as f:
+        dump(r, f, indent=4)
+    print(f"saved benchmark results: {args.output}")
+    return
+
+
+if __name__ == "__main__":
+    main()
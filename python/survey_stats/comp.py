@@ -1,137 +1,473 @@
 """compile results from other functions into single objects (4)"""
+from concurrent.futures import ProcessPoolExecutor
+from os import cpu_count, stat
+from os.path import join
 import fm
 import lang
 import logging
+import numpy as np
 import pandas as pd
+import plan
+import prof
+import resample
 import target
 
 
 # setup per-module logger
 log = logging.getLogger(__name__).addHandler(logging.NullHandler())
 
+# columns of raw surveys (names from lang_db) that your own rules read (e.g., 'extra_rules' of remove_participants())
+# only columns some step needs are read from csvs, so add names here if you read other columns
+EXTRA_COLUMNS = list()
 
-def load_all(lang_db, colls_db, fn_survey_input_en, fn_survey_input_pl):
-    """
-    load custom columns (txt), 'survey_en' (dataframe), 'survey_pl' (dataframe)
-    translate 'survey_pl' into english
-    replace old columns with custom columns in 'survey_en' and 'survey_pl'
-    group by conditions and calculate means of 'survey_en' and 'survey_pl'
-    append old columns (e.g., when were you born?) to means of 'survey_en' and 'survey_pl'
-    return: means of 'survey_en' and 'survey_pl' (+ their unprocessed variants)
-    """
-    # (1) load english csv file
-    original_en = fm.load_csv(fn=fn_survey_input_en,
-                              survey_lang="en")
-    logging.info(f"english group is available ({original_en.shape[0]} participants)")
-    # (2) get means for english group
-    means_en = target.get_means(original_en,
-                                colls_db=colls_db,
-                                lang_db=lang_db,
-                                survey_lang="en")
-    # (3) load polish csv file, translate it to english
-    original_pl = fm.load_csv(fn=fn_survey_input_pl,
-                              survey_lang="pl")
-    original_pl = lang.translate_pl_to_en(obj=original_pl,
-                                          lang_db=lang_db)
-    logging.info(f"polish group is available ({original_pl.shape[0]} participants)")
-    # (4) get means for polish group
-    means_pl = target.get_means(original_pl,
-                                colls_db=colls_db,
-                                lang_db=lang_db,
-                                survey_lang="pl")
-    return means_en, original_en, means_pl, original_pl
-
-
-def remove_participants(lang_db, means_en, original_en, means_pl, original_pl, d_filter_conditions, max_clicker_ratio=80):
+
+def read_survey(frames, fn_survey_input, survey_lang, dtype=None, engine="c"):
+    """
+    step of plan: load raw survey, only columns that steps of plan need (frames["columns"])
+    """
+    return {"original": fm.load_csv(fn=fn_survey_input,
+                                    survey_lang=survey_lang,
+                                    dtype=dtype,
+                                    engine=engine,
+                                    usecols=frames.get("columns"))}
+
+
+def translate_survey(frames, lang_db, survey_lang):
+    """
+    step of plan: translate raw survey into english if it's in another language
+    """
+    if survey_lang == "en":
+        return dict()
+    return {"original": lang.translate_to_en(obj=frames["original"],
+                                             lang_db=lang_db,
+                                             language=survey_lang)}
+
+
+def get_survey_means(frames, lang_db, colls_db, survey_lang):
+    """
+    step of plan: group ratings by conditions, get means and append old columns (e.g., when were you born?) to them
+    """
+    logging.info(f"{lang.LANGUAGE_NAMES[survey_lang]} group is available ({frames['original'].shape[0]} participants)")
+    return {"means": target.get_means(frames["original"],
+                                      colls_db=colls_db,
+                                      lang_db=lang_db,
+                                      survey_lang=survey_lang)}
+
+
+def filter_survey(frames, lang_db, d_filter_conditions, survey_lang, max_clicker_ratio):
+    """
+    step of plan: remove participants (see remove_participants()), along with report of how many each rule removed
+    """
+    means, report = remove_participants(lang_db=lang_db,
+                                        obj_means=frames["means"],
+                                        obj_original=frames["original"],
+                                        d_filter_conditions=d_filter_conditions,
+                                        survey_lang=survey_lang,
+                                        max_clicker_ratio=max_clicker_ratio)
+    logging.info(f"processed {lang.LANGUAGE_NAMES[survey_lang]} survey: {frames['original'].shape[0]} -> {means.shape[0]} participants")
+    return {"means": means, "report": report}
+
+
+def get_survey_reliability(frames, lang_db, colls_db):
+    """
+    step of plan: sums needed for reliability of conditions, from ratings of participants who were not removed
+    """
+    return {"reliability": get_reliability_sums(lang_db=lang_db,
+                                                colls_db=colls_db,
+                                                obj_original=frames["original"],
+                                                obj_means=frames["means"])}
+
+
+def build_plan(lang_db, colls_db, survey_lang, fn_survey_input=None, d_filter_conditions=None, max_clicker_ratio=80, typed=False, engine="c"):
+    """
+    return lazy plan of processing survey in language: load -> translate -> means -> filter -> reliability
+    (statistics of participants are calculated later from means, i.e., from columns that means keep)
+    each step lists raw columns it reads, so the csv reader parses only those (e.g., timestamp and free-text answers are skipped)
+    if d_filter_conditions is None then plan ends with means
+    every row is read, because the report counts participants removed by each rule
+    """
+    dtype = None
+    if typed is True:
+        dtype = fm.build_dtype_schema(lang_db=lang_db, colls_db=colls_db, survey_lang=survey_lang)
+    r = plan.Plan()
+    r = r.then("load csv", read_survey, fn_survey_input=fn_survey_input, survey_lang=survey_lang, dtype=dtype, engine=engine)
+    r = r.then("translate to english", translate_survey, lang_db=lang_db, survey_lang=survey_lang)
+    r = r.then("get means", get_survey_means, needs=("rate_competence",) + target.MEANS_COLUMNS, lang_db=lang_db, colls_db=colls_db, survey_lang=survey_lang)
+    if d_filter_conditions is None:
+        return r
+    # answers to filter questions are looked up by their english column name
+    needs = ["rate_competence"] + [lang_db.column_names["en"][col] for col in d_filter_conditions] + list(EXTRA_COLUMNS)
+    r = r.then("remove participants", filter_survey, needs=needs, lang_db=lang_db, d_filter_conditions=d_filter_conditions,
+               survey_lang=survey_lang, max_clicker_ratio=max_clicker_ratio)
+    r = r.then("get reliability sums", get_survey_reliability, needs=("rate_competence",), lang_db=lang_db, colls_db=colls_db)
+    return r
+
+
+def get_survey_columns(lang_db, colls_db, survey_lang):
+    """
+    return column names in csv header of survey in language that processing it needs (see build_plan())
+    """
+    return build_plan(lang_db=lang_db,
+                      colls_db=colls_db,
+                      survey_lang=survey_lang,
+                      d_filter_conditions=get_filter_conditions(lang_db)).get_columns(lang_db, survey_lang)
+
+
+def load_all(lang_db, colls_db, survey_lang, fn_survey_input, typed=False, engine="c"):
+    """
+    load 'survey' (dataframe) in language, e.g., "en"
+    translate 'survey' into english if it's in another language
+    replace old columns with custom columns in 'survey'
+    group by conditions and calculate means of 'survey'
+    append old columns (e.g., when were you born?) to means of 'survey'
+    if typed is True then ratings are loaded as small integers and answers as categoricals
+    only columns needed by means, filters and statistics are read
+    return: means of 'survey' (+ its unprocessed variant)
+    """
+    frames = build_plan(lang_db=lang_db,
+                        colls_db=colls_db,
+                        survey_lang=survey_lang,
+                        fn_survey_input=fn_survey_input,
+                        typed=typed,
+                        engine=engine).execute(lang_db, survey_lang, frames={"columns": get_survey_columns(lang_db, colls_db, survey_lang)})
+    return frames["means"], frames["original"]
+
+
+def find_careless(lang_db, obj_means, obj_original, max_clicker_ratio, max_straightline_ratio, max_alternating_ratio, survey_lang):
+    """
+    return dictionary of rule : boolean mask of rows where participant kept clicking the same answer
+    optionally, also rows where participant answered in long runs (straight-lining) or alternated between answers
+    """
+    colname = lang_db.column("rate_competence")
+    positions = lang_db.positions(obj_original.columns, "rate_competence")
+    r = dict()
+    list_clickers = target.find_clickers(obj_means=obj_means,
+                                         obj_original=obj_original,
+                                         colname=colname,
+                                         max_clicker_ratio=max_clicker_ratio,
+                                         survey_lang=survey_lang,
+                                         positions=positions)
+    r[f"clicked the same answer (>{max_clicker_ratio}%)"] = obj_means.index.isin(list_clickers)
+    if max_straightline_ratio is not None:
+        list_straightliners = target.find_straightliners(obj_original=obj_original,
+                                                         colname=colname,
+                                                         max_straightline_ratio=max_straightline_ratio,
+                                                         survey_lang=survey_lang,
+                                                         positions=positions)
+        r[f"straight-lining (>{max_straightline_ratio}%)"] = obj_means.index.isin(list_straightliners)
+    if max_alternating_ratio is not None:
+        list_alternators = target.find_alternators(obj_original=obj_original,
+                                                   colname=colname,
+                                                   max_alternating_ratio=max_alternating_ratio,
+                                                   survey_lang=survey_lang,
+                                                   positions=positions)
+        r[f"alternating answers (>{max_alternating_ratio}%)"] = obj_means.index.isin(list_alternators)
+    return r
+
+
+def remove_participants(lang_db, obj_means, obj_original, d_filter_conditions, survey_lang, max_clicker_ratio=80, max_straightline_ratio=None, max_alternating_ratio=None, extra_rules=None):
     """
     remove participants who did not answer with X to a question or kept clicking the same answer
+    if max_straightline_ratio or max_alternating_ratio is provided, also remove participants who answered in patterns
+    'extra_rules' is a dictionary of rule : function(obj_means, obj_original) that returns boolean mask of rows to remove
+    all rules are evaluated on the same (stable) participant index and rows are removed once
+    return: means without removed participants, report of how many participants each rule removed
+    """
+    # (1) find participants who did not answer with X to a question
+    with prof.stage(f"find wrong answers ({survey_lang})"):
+        masks = target.find_wrong_answers(obj=obj_means,
+                                          d_filter_conditions=d_filter_conditions,
+                                          survey_lang=survey_lang)
+    # (2) find participants who kept clicking the same answer
+    with prof.stage(f"find clickers ({survey_lang})"):
+        masks.update(find_careless(lang_db=lang_db,
+                                   obj_means=obj_means,
+                                   obj_original=obj_original,
+                                   max_clicker_ratio=max_clicker_ratio,
+                                   max_straightline_ratio=max_straightline_ratio,
+                                   max_alternating_ratio=max_alternating_ratio,
+                                   survey_lang=survey_lang))
+    # (3) find participants using other rules
+    for rule, function in (extra_rules or dict()).items():
+        masks[rule] = function(obj_means, obj_original)
+        continue
+    # (4) remove all of them at once
+    with prof.stage(f"remove participants ({survey_lang})") as s:
+        r, report = target.apply_exclusions(obj=obj_means,
+                                            masks=masks,
+                                            survey_lang=survey_lang)
+        s.record(r)
+    return r, report
+
+
+def get_reliability_sums(lang_db, colls_db, obj_original, obj_means):
+    """
+    return sums needed for reliability of each condition (see target.accumulate_reliability()), only of participants who were not removed
+    """
+    kept = obj_original[obj_original.index.isin(obj_means.index)]
+    ratings = target.get_ratings(kept, lang_db.column("rate_competence"), positions=lang_db.positions(kept.columns, "rate_competence"))
+    return target.accumulate_reliability(target.get_answer_matrix(ratings), colls_db)
+
+
+def get_filter_conditions(lang_db):
+    """
+    return dictionary of column : answer; participants who did not answer with it are removed
+    """
+    return {lang_db.column("is_l1"):lang_db.answer("yes"), # match only if polish is L1
+            lang_db.column("is_l2"):lang_db.answer("yes"), # match only if english is L2
+            lang_db.column("how_often"):lang_db.answer("often_daily")} # match only if english is used daily
+
+
+def process_language(lang_db, colls_db, survey_lang, fn_survey_input, d_filter_conditions, max_clicker_ratio, typed=False, engine="c"):
+    """
+    return processed survey in language with means and without clickers and participants who clicked the wrong answer
+    (+ report of how many participants were removed by each rule, + sums needed for reliability of conditions)
+    languages never share data, so each call can run as an independent job (e.g., in a separate process)
     """
-    # (1) set variables
-    colname = lang.lstr(lang_db,"rate_competence", category="column")
-    # (2) remove english participants who did not answer with X to a question
-    list_wrong_en = target.find_wrong_answers(obj=means_en,
-                                              d_filter_conditions=d_filter_conditions,
-                                              survey_lang="en")
-    means_en = target.drop_rows(obj=means_en,
-                                target_list=list_wrong_en,
-                                survey_lang="en")
-    # (3) remove polish participants who did not answer with X to a question
-    list_wrong_pl = target.find_wrong_answers(obj=means_pl,
-                                              d_filter_conditions=d_filter_conditions,
-                                              survey_lang="pl")
-    means_pl = target.drop_rows(obj=means_pl,
-                                target_list=list_wrong_pl,
-                                survey_lang="pl")
-    # (4) remove english participants who kept clicking the same answer
-    list_clickers_en = target.find_clickers(obj_means=means_en,
-                                            obj_original=original_en,
-                                            colname=colname,
-                                            max_clicker_ratio=max_clicker_ratio,
-                                            survey_lang="en")
-    means_en = target.drop_rows(obj=means_en,
-                                target_list=list_clickers_en,
-                                survey_lang="en")
-    # (5) remove polish participants who kept clicking the same answer
-    list_clickers_pl = target.find_clickers(obj_means=means_pl,
-                                            obj_original=original_pl,
-                                            colname=colname,
-                                            max_clicker_ratio=max_clicker_ratio,
-                                            survey_lang="pl")
-    means_pl = target.drop_rows(obj=means_pl,
-                                target_list=list_clickers_pl,
-                                survey_lang="pl")
-    return means_en, means_pl
-
-
-def get_clean_dfs(lang_db, enabled, colls_db, fn_survey_input_en, fn_survey_input_pl, fn_survey_output_en, fn_survey_output_pl, max_clicker_ratio):
-    """
-    return processed english and polish survey with means and without clickers and participants who clicked the wrong answer
+    # (1) load survey (only needed columns), get its means by condition, remove participants, get sums needed for reliability
+    frames = build_plan(lang_db=lang_db,
+                        colls_db=colls_db,
+                        survey_lang=survey_lang,
+                        fn_survey_input=fn_survey_input,
+                        d_filter_conditions=d_filter_conditions,
+                        max_clicker_ratio=max_clicker_ratio,
+                        typed=typed,
+                        engine=engine).execute(lang_db, survey_lang)
+    # (2) start numbering from 1, rename index to "Participant"
+    means = target.rename_index_to_participant(frames["means"])
+    return means, frames["report"], frames["reliability"]
+
+
+def append_means(obj_means, obj_new):
     """
+    return processed means with new processed means put below them, numbering of new participants continues after the old ones
+    categorical columns stay categorical (new answers are added as new categories)
+    """
+    obj_new = target.rename_index_to_participant(obj_new)
+    if obj_means is None:
+        return obj_new
+    obj_new.index += obj_means.shape[0]
+    obj_means = obj_means.copy()
+    for col in obj_new.columns:
+        if col in obj_means.columns and isinstance(obj_means[col].dtype, pd.CategoricalDtype) and isinstance(obj_new[col].dtype, pd.CategoricalDtype):
+            categories = list(dict.fromkeys(list(obj_means[col].cat.categories) + list(obj_new[col].cat.categories)))
+            obj_means[col] = obj_means[col].cat.set_categories(categories)
+            obj_new[col] = obj_new[col].cat.set_categories(categories)
+        continue
+    return pd.concat([obj_means, obj_new], axis=0)
+
+
+def merge_reports(report, report_new):
+    """
+    return report of how many participants were removed by each rule, for participants of both reports
+    """
+    r = dict(report)
+    for rule, count in report_new.items():
+        r[rule] = r.get(rule, 0) + count
+        continue
+    # keep "excluded" and "remaining" last, the same as in a single report
+    for key in ("excluded", "remaining"):
+        if key in r:
+            r[key] = r.pop(key)
+        continue
+    return r
+
+
+def process_language_incremental(lang_db, colls_db, survey_lang, fn_survey_input, d_filter_conditions, max_clicker_ratio, typed=False, engine="c", state_dir="./output/incremental"):
+    """
+    return processed survey in language the same as process_language(), but process only rows added to input csv since last run
+    processed means, report and statistics are stored in 'state_dir', new rows are appended to them
+    every step depends only on participant's own row, so appending gives the same result as processing everything again
+    if settings (lang_db, colls_db, conditions, max_clicker_ratio) change or already processed rows change, survey is processed from the beginning
+    """
+    fn_state = join(state_dir, f"{survey_lang}.pkl")
+    settings = fm.get_cache_key(survey_lang, lang_db.digest, colls_db, d_filter_conditions, max_clicker_ratio)
+    info = stat(fn_survey_input)
+    # (1) load what was processed so far
+    state = fm.load_incremental_state(fn_state)
+    if state is not None and state["settings"] != settings:
+        logging.info(f"settings changed, processing {lang.LANGUAGE_NAMES[survey_lang]} survey from the beginning")
+        state = None
+    if state is not None and state["size"] == info.st_size and state["mtime_ns"] == info.st_mtime_ns:
+        logging.info(f"ok: {lang.LANGUAGE_NAMES[survey_lang]} survey hasn't changed since last run ({state['means'].shape[0]} participants)")
+        return state["means"], state["report"], state["reliability"]
+    while True:
+        if state is None:
+            state = {"settings": settings, "offset": 0, "rows": 0, "sha256": None, "means": None, "report": dict(), "statistics": None, "reliability": None, "cube": None}
+        # (2) load only rows after the last processed byte
+        dtype = fm.build_dtype_schema(lang_db=lang_db, colls_db=colls_db, survey_lang=survey_lang) if typed is True else None
+        with prof.stage(f"load new rows of csv ({survey_lang})") as s:
+            original, end = fm.load_csv_from(fn=fn_survey_input,
+                                             survey_lang=survey_lang,
+                                             offset=state["offset"],
+                                             first_row=state["rows"],
+                                             dtype=dtype,
+                                             engine=engine,
+                                             usecols=get_survey_columns(lang_db, colls_db, survey_lang))
+            if original is not None:
+                s.record(original)
+        # (3) check that rows which were processed before haven't changed (e.g., participant edited their answers)
+        sha_processed, sha_end = fm.hash_file_heads(fn_survey_input, [state["offset"], end])
+        if state["offset"] > 0 and sha_processed != state["sha256"]:
+            logging.info(f"processed rows of {lang.LANGUAGE_NAMES[survey_lang]} survey have changed, processing it from the beginning")
+            state = None
+            continue
+        break
+    state.update({"offset": end, "sha256": sha_end, "size": info.st_size, "mtime_ns": info.st_mtime_ns})
+    if original is not None:
+        if survey_lang != "en":
+            original = lang.translate_to_en(obj=original,
+                                            lang_db=lang_db,
+                                            language=survey_lang)
+        # (4) get means of new rows and remove participants among them
+        means = target.get_means(original,
+                                 colls_db=colls_db,
+                                 lang_db=lang_db,
+                                 survey_lang=survey_lang)
+        means, report = remove_participants(lang_db=lang_db,
+                                            obj_means=means,
+                                            obj_original=original,
+                                            d_filter_conditions=d_filter_conditions,
+                                            survey_lang=survey_lang,
+                                            max_clicker_ratio=max_clicker_ratio)
+        # (5) append them to what was processed so far, update report, statistics, reliability and cube
+        statistics = target.accumulate_statistics(obj=means, specs=get_statistics_specs(lang_db))
+        reliability = get_reliability_sums(lang_db=lang_db, colls_db=colls_db, obj_original=original, obj_means=means)
+        state["reliability"] = reliability if state["reliability"] is None else target.merge_reliability(state["reliability"], reliability)
+        # (states saved before cubes were kept get one built from participants processed so far)
+        if state.get("cube") is None and state["means"] is not None:
+            state["cube"] = accumulate_cube(lang_db=lang_db, colls_db=colls_db, obj=state["means"])
+        state["cube"] = target.merge_cubes(state.get("cube"), accumulate_cube(lang_db=lang_db, colls_db=colls_db, obj=means))
+        state["means"] = append_means(state["means"], means)
+        state["report"] = merge_reports(state["report"], report)
+        state["statistics"] = statistics if state["statistics"] is None else target.merge_statistics(state["statistics"], statistics)
+        state["rows"] += original.shape[0]
+        logging.info(f"processed {lang.LANGUAGE_NAMES[survey_lang]} survey: {original.shape[0]} new participants -> {means.shape[0]} appended ({state['means'].shape[0]} in total)")
+    fm.save_incremental_state(obj=state, fn=fn_state)
+    return state["means"], state["report"], state["reliability"]
+
+
+def get_clean_dfs(lang_db, enabled, colls_db, surveys, max_clicker_ratio, fn_exclusions="./output/exclusions.txt", state_dir="./output/incremental",
+                  fn_participant_descriptives="./output/participant_descriptives.csv"):
+    """
+    return dictionary of survey language : processed survey with means and without clickers and participants who clicked the wrong answer
+    'surveys' is a dictionary of survey language : {"fn_input": raw csv, "fn_output": processed csv, parquet or feather}
+    if 'use_cache' is enabled then languages whose input csv, lang_db, colls_db and max_clicker_ratio haven't changed are not processed again
+    if 'use_parallel_processing' is enabled then each language is processed in a separate process
+    if 'use_incremental' is enabled then only rows added to input csvs since last run are processed and appended (instead of using cache)
+    a report of how many participants were removed by each rule is saved to 'fn_exclusions'
+    if 'get_descriptives' is enabled then mean, stdev, min, max and number of ratings of each participant are saved to 'fn_participant_descriptives'
+    return: processed surveys, dictionary of survey language : sums needed for reliability of conditions (empty if csvs are loaded from output)
+    """
+    r = dict()
+    reports = dict()
+    reliability = dict()
     # (1) if asked to open survey and process csv from './input'
     if enabled["use_csv_from_input"] is True:
         logging.info("ok: loading raw csvs from input because 'use_csv_from_input' is True")
-        # (I) load survey_en and survey_pl, get their means by condition; returns dictionary: means_en, original_en, means_pl, original_pl
-        means_en, original_en, means_pl, original_pl = load_all(lang_db=lang_db,
-                                                                colls_db=colls_db,
-                                                                fn_survey_input_en=fn_survey_input_en,
-                                                                fn_survey_input_pl=fn_survey_input_pl)
-        # (II) remove participants who keep clicking the same answer or did not answer with X to a question
-        d_filter_conditions = {lang.lstr(lang_db, "is_l1", category="column"):lang.lstr(lang_db, "yes", category="answer"), # match only if polish is L1
-                               lang.lstr(lang_db, "is_l2", category="column"):lang.lstr(lang_db, "yes", category="answer"), # match only if english is L2
-                               lang.lstr(lang_db, "how_often", category="column"):lang.lstr(lang_db, "often_daily", category="answer")} # match only if english is used daily
-        means_en, means_pl = remove_participants(lang_db=lang_db,
-                                                 means_en=means_en,
-                                                 original_en=original_en,
-                                                 means_pl=means_pl,
-                                                 original_pl=original_pl,
-                                                 d_filter_conditions=d_filter_conditions,
-                                                 max_clicker_ratio=max_clicker_ratio)
-        logging.info(f"processed english survey: {original_en.shape[0]} -> {means_en.shape[0]} participants")
-        logging.info(f"processed polish survey: {original_pl.shape[0]} -> {means_pl.shape[0]} participants")
-        # (III) save to means to csv in "./output"
-        means_en = target.rename_index_to_participant(means_en) # start numbering from 1, rename index to "Participant"
-        means_pl = target.rename_index_to_participant(means_pl) # start numbering from 1, rename index to "Participant"
-        fm.save_dataframe_as_csv(obj=means_en, fn=fn_survey_output_en)
-        fm.save_dataframe_as_csv(obj=means_pl, fn=fn_survey_output_pl)
+        # (I) conditions used to remove participants who did not answer with X to a question
+        d_filter_conditions = get_filter_conditions(lang_db)
+        kwargs = {survey_lang: {"lang_db": lang_db,
+                                "colls_db": colls_db,
+                                "survey_lang": survey_lang,
+                                "fn_survey_input": fn["fn_input"],
+                                "d_filter_conditions": d_filter_conditions,
+                                "max_clicker_ratio": max_clicker_ratio,
+                                "typed": enabled["use_typed_csv"],
+                                "engine": "pyarrow" if enabled["use_pyarrow_engine"] is True else "c"}
+                  for survey_lang, fn in surveys.items()}
+        # processed surveys are either stored incrementally or cached, not both
+        use_cache = enabled["use_cache"] is True and enabled["use_incremental"] is False
+        process = process_language
+        if enabled["use_incremental"] is True:
+            logging.info(f"ok: processing only new rows of raw csvs because 'use_incremental' is True (state: {state_dir})")
+            process = process_language_incremental
+            for kw in kwargs.values():
+                kw["state_dir"] = state_dir
+                continue
+        # (II) reuse means that were cached, if nothing they were calculated from has changed
+        with prof.stage("(II) load cached means"):
+            keys = dict()
+            if use_cache is True:
+                for survey_lang, kw in kwargs.items():
+                    keys[survey_lang] = fm.get_cache_key(survey_lang,
+                                                         fm.hash_file(kw["fn_survey_input"]),
+                                                         lang_db.digest,
+                                                         colls_db,
+                                                         d_filter_conditions,
+                                                         max_clicker_ratio)
+                    cached, metadata = fm.load_cached_dataframe(keys[survey_lang])
+                    # (entries cached before reliability was calculated are processed again)
+                    if cached is not None and "reliability" in metadata:
+                        r[survey_lang] = cached
+                        reports[survey_lang] = metadata["exclusions"]
+                        reliability[survey_lang] = metadata["reliability"]
+                    continue
+        kwargs = {survey_lang: kw for survey_lang, kw in kwargs.items() if survey_lang not in r}
+        # (III) load, translate, get means and remove participants for each language that wasn't cached
+        with prof.stage("(III) process languages"):
+            if enabled["use_parallel_processing"] is True and len(kwargs) > 1:
+                logging.info(f"ok: processing {len(kwargs)} languages in parallel")
+                with ProcessPoolExecutor(max_workers=len(kwargs)) as executor:
+                    futures = {survey_lang: executor.submit(process, **kw) for survey_lang, kw in kwargs.items()}
+                    # gather in the same order as 'surveys', so output matches serial processing
+                    for survey_lang, future in futures.items():
+                        r[survey_lang], reports[survey_lang], reliability[survey_lang] = future.result()
+                        continue
+            else:
+                for survey_lang, kw in kwargs.items():
+                    r[survey_lang], reports[survey_lang], reliability[survey_lang] = process(**kw)
+                    continue
+        # keep the same order as 'surveys'
+        r = {survey_lang: r[survey_lang] for survey_lang in surveys}
+        # (IV) cache newly processed means, remove stale ones
+        with prof.stage("(IV) cache means"):
+            if use_cache is True:
+                for survey_lang in kwargs:
+                    fm.save_cached_dataframe(obj=r[survey_lang],
+                                             key=keys[survey_lang],
+                                             metadata={"survey_lang": survey_lang,
+                                                       "fn_input": surveys[survey_lang]["fn_input"],
+                                                       "max_clicker_ratio": max_clicker_ratio,
+                                                       "exclusions": reports[survey_lang],
+                                                       "reliability": reliability[survey_lang]})
+                    continue
+                fm.evict_cache(keep=keys.values())
+        # (V) save to means to csv in "./output", descriptives of each participant are saved to their own file
+        with prof.stage("(V) save processed means"):
+            participant_descriptives = list()
+            for survey_lang in surveys:
+                r[survey_lang], descriptives = target.split_participant_descriptives(r[survey_lang])
+                fm.save_dataframe(obj=r[survey_lang], fn=surveys[survey_lang]["fn_output"])
+                participant_descriptives.append(descriptives)
+                continue
+            if enabled["get_descriptives"] is True:
+                fm.save_dataframe(obj=pd.concat(participant_descriptives, axis=0), fn=fn_participant_descriptives)
+            fm.save_dictionary_as_txt(obj={f"{survey_lang}: removed participants":reports[survey_lang] for survey_lang in surveys},
+                                      header="[number of participants removed by each rule; a participant can be removed by more than one rule]",
+                                      fn=fn_exclusions)
     # otherwise, load csvs from output; this is useful if you want to edit them directly
     else:
-        logging.info("ok: loading processed csvs from output because 'use_csv_from_input' is False")
-        means_en = fm.load_csv(fn=fn_survey_output_en,
-                               survey_lang="en")
-        means_pl = fm.load_csv(fn=fn_survey_output_pl,
-                               survey_lang="pl")
+        logging.info("ok: loading processed files from output because 'use_csv_from_input' is False")
+        for survey_lang, fn in surveys.items():
+            r[survey_lang] = fm.load_dataframe(fn=fn["fn_output"],
+                                               survey_lang=survey_lang,
+                                               memory_map=enabled["use_memory_map"])
+            continue
     if enabled["display_dataframes"] is True:
-        logging.info(f"polish survey:\n{means_en}")
-        logging.info(f"english survey:\n{means_pl}")
-    return means_en, means_pl
+        for survey_lang, means in r.items():
+            logging.info(f"{lang.LANGUAGE_NAMES[survey_lang]} survey:\n{means}")
+            continue
+    return r, reliability
 
 
-def combine_dfs(means_en, means_pl, enabled):
+def combine_dfs(means, enabled):
     """
-    combine two dataframes into one, put the 2nd below the 1st
+    combine dictionary of survey language : dataframe into one dataframe, put each below the previous one
     """
     # (1) combine into one dataframe
-    means_both = pd.concat([means_en, means_pl], axis=0).fillna("")
+    # (missing values are kept as NaN, they are saved as empty cells in csv and keep columns typed in parquet/feather)
+    means_both = pd.concat(list(means.values()), axis=0)
     # (2) reset index numbering
     means_both.reset_index(inplace=True, drop=True)
     if enabled["display_dataframes"] is True:
@@ -139,46 +475,320 @@ def combine_dfs(means_en, means_pl, enabled):
     return means_both
 
 
-def get_participants_statistics(lang_db, means_en, means_pl, enabled):
+def stream_surveys(lang_db, enabled, colls_db, surveys, max_clicker_ratio, columns_means_only, fn_all_columns, fn_means_only,
+                   fn_exclusions="./output/exclusions.txt", fn_participant_descriptives="./output/participant_descriptives.csv", chunksize=50000):
     """
-    return dictionary with participants: age when began to learn english, age, gender, city size, uni year
+    process surveys in chunks of 'chunksize' rows and return statistics of participants (generator, the same as iter_participants_statistics())
+    (+ descriptive statistics and reliability of conditions, the same as get_descriptives(), if 'get_descriptives' is enabled)
+    (+ cube of sums of conditions by demographics, the same as get_cube(), if 'get_cube' is enabled)
+    every step (means, wrong answers, clickers) depends only on participant's own row, so each chunk is processed on its own
+    processed rows are appended to 'fn_output' of each survey and to combined csvs ('fn_all_columns', 'fn_means_only' with 'columns_means_only')
+    (+ descriptives of each participant to 'fn_participant_descriptives', if 'get_descriptives' is enabled)
+    statistics are updated chunk after chunk, so memory doesn't grow with the number of participants
+    ratings are always typed, so that columns are formatted the same way in every chunk
+    """
+    d_filter_conditions = get_filter_conditions(lang_db)
+    specs = get_statistics_specs(lang_db, enabled)
+    # spread of participants' means in each condition is updated along with other statistics
+    if enabled["get_descriptives"] is True:
+        specs += get_condition_specs(colls_db)
+    sizes = dict()
+    reliability = dict()
+    reports = dict()
+    accumulated = None
+    cube = None
+    combined = 0
+    first_survey = next(iter(surveys))
+    for survey_lang, fn in surveys.items():
+        if fm.get_dataframe_format(fn["fn_output"]) != "csv":
+            logging.error(f"streaming can only save csv files, change output format of: {fn['fn_output']}")
+            quit()
+        logging.info(f"ok: streaming {lang.LANGUAGE_NAMES[survey_lang]} survey in chunks of {chunksize} rows")
+        dtype = fm.build_dtype_schema(lang_db=lang_db, colls_db=colls_db, survey_lang=survey_lang)
+        sizes[survey_lang] = 0
+        reports[survey_lang] = dict()
+        usecols = get_survey_columns(lang_db, colls_db, survey_lang)
+        for chunk in fm.iter_csv(fn=fn["fn_input"], survey_lang=survey_lang, dtype=dtype, chunksize=chunksize, usecols=usecols):
+            # (1) translate chunk to english, get its means, remove participants
+            if survey_lang != "en":
+                chunk = lang.translate_to_en(obj=chunk,
+                                             lang_db=lang_db,
+                                             language=survey_lang)
+            means = target.get_means(chunk,
+                                     colls_db=colls_db,
+                                     lang_db=lang_db,
+                                     survey_lang=survey_lang)
+            means, report = remove_participants(lang_db=lang_db,
+                                                obj_means=means,
+                                                obj_original=chunk,
+                                                d_filter_conditions=d_filter_conditions,
+                                                survey_lang=survey_lang,
+                                                max_clicker_ratio=max_clicker_ratio)
+            # (2) update sums needed for reliability of conditions
+            if enabled["get_descriptives"] is True:
+                sums = get_reliability_sums(lang_db=lang_db, colls_db=colls_db, obj_original=chunk, obj_means=means)
+                reliability[survey_lang] = target.merge_reliability(reliability[survey_lang], sums) if survey_lang in reliability else sums
+            # (3) continue numbering participants from the previous chunk, append to processed csv
+            first = not reports[survey_lang]
+            means = target.rename_index_to_participant(means)
+            means.index += sizes[survey_lang]
+            means, descriptives = target.split_participant_descriptives(means)
+            fm.append_dataframe_as_csv(obj=means, fn=fn["fn_output"], header=first)
+            if enabled["get_descriptives"] is True:
+                fm.append_dataframe_as_csv(obj=descriptives, fn=fn_participant_descriptives, header=first and survey_lang == first_survey)
+            # (4) continue numbering participants from the previous survey, append to combined csvs
+            means.index += combined
+            fm.append_dataframe_as_csv(obj=means, fn=fn_all_columns, header=first and survey_lang == first_survey)
+            fm.append_dataframe_as_csv(obj=means.filter(columns_means_only), fn=fn_means_only, header=first and survey_lang == first_survey)
+            # (5) update statistics, cube and report
+            if specs:
+                statistics = target.accumulate_statistics(obj=means, specs=specs)
+                accumulated = statistics if accumulated is None else target.merge_statistics(accumulated, statistics)
+            if enabled["get_cube"] is True:
+                cube = target.merge_cubes(cube, accumulate_cube(lang_db=lang_db, colls_db=colls_db, obj=means))
+            reports[survey_lang] = merge_reports(reports[survey_lang], report)
+            sizes[survey_lang] += means.shape[0]
+            continue
+        combined += sizes[survey_lang]
+        logging.info(f"processed {lang.LANGUAGE_NAMES[survey_lang]} survey: {reports[survey_lang].get('participants', 0)} -> {sizes[survey_lang]} participants")
+        logging.info(f"ok: saved csv: {fn['fn_output']} (rows: {sizes[survey_lang]})")
+        continue
+    logging.info(f"ok: saved csv: {fn_all_columns} (rows: {combined})")
+    logging.info(f"ok: saved csv: {fn_means_only} (rows: {combined})")
+    fm.save_dictionary_as_txt(obj={f"{survey_lang}: removed participants":reports[survey_lang] for survey_lang in surveys},
+                              header="[number of participants removed by each rule; a participant can be removed by more than one rule]",
+                              fn=fn_exclusions)
+    stats = summarize_participants_statistics(lang_db=lang_db,
+                                              sizes=sizes,
+                                              accumulated=accumulated,
+                                              enabled=enabled)
+    descriptives = dict()
+    if enabled["get_descriptives"] is True:
+        descriptives = get_descriptives(colls_db=colls_db,
+                                        reliability=reliability,
+                                        accumulated=accumulated)
+    if cube is not None:
+        descriptives["cube"] = cube
+    return stats, descriptives
+
+
+def get_statistics_specs(lang_db, enabled=None):
+    """
+    return list of statistics to calculate: (name, column, statistic, label), see target.get_statistics()
+    if enabled is None then all of them are listed
+    """
+    r = list()
+    specs = {"get_began_english": ("began to learn", lang_db.column("age_begin_eng"), "summary", "began learning english"),
+             "get_age": ("age", lang_db.column("birth_year"), "age", "age"),
+             "get_gender": ("gender", lang_db.column("what_gender"), "distribution", None),
+             "get_city": ("city size", lang_db.column("how_big_city"), "distribution", None),
+             "get_uni_year": ("uni year", lang_db.column("which_uni_year"), "distribution", None)}
+    for toggle, spec in specs.items():
+        if enabled is None or enabled[toggle] is True:
+            r.append(spec)
+        continue
+    return r
+
+
+def summarize_participants_statistics(lang_db, sizes, accumulated, enabled):
+    """
+    yield (section, statistics) of participants: participant size, age when began to learn english, age, gender, city size, uni year
+    each section is calculated only when it's asked for, so that it can be saved (see fm.save_report()) before the next one is calculated
+    'sizes' is a dictionary of survey language : number of participants
+    'accumulated' is partial statistics of all participants (from target.accumulate_statistics())
     """
-    r = dict()
     # (1) calculate participant size
     if enabled["get_participant_size"] is True:
-        r.update({"participant size":{"english group":means_en.shape[0],
-                                      "polish group":means_pl.shape[0]}})
-    # (2) calculate when began to learn english
-    if enabled["get_began_english"] is True:
-        dict_learn_en = target.target_learn(means_en, lang.lstr(lang_db, "age_begin_eng", category="column"))
-        dict_learn_pl = target.target_learn(means_pl, lang.lstr(lang_db, "age_begin_eng", category="column"))
-        r.update({"en: began to learn":dict_learn_en,
-                  "pl: began to learn":dict_learn_pl})
-    # (3) calculate age
-    if enabled["get_age"] is True:
-        # df_both = pd.concat([means_en, means_pl], axis=0, ignore_index=True)
-        # print(df_both)
-        dict_age_en = target.target_age(means_en, lang.lstr(lang_db, "birth_year", category="column"))
-        dict_age_pl = target.target_age(means_pl, lang.lstr(lang_db, "birth_year", category="column"))
-        r.update({"en: age":dict_age_en,
-                  "pl: age":dict_age_pl})
-    # (4) calculate gender
-    if enabled["get_gender"] is True:
-        dict_gender_en = target.target_gender(means_en, lang.lstr(lang_db, "what_gender", category="column"))
-        dict_gender_pl = target.target_gender(means_pl, lang.lstr(lang_db, "what_gender", category="column"))
-        r.update({"en: gender":dict_gender_en,
-                  "pl: gender":dict_gender_pl})
-    # (5) calculate city size
-    if enabled["get_city"] is True:
-        dict_city_en = target.target_city(means_en, lang.lstr(lang_db, "how_big_city", category="column"))
-        dict_city_pl = target.target_city(means_pl, lang.lstr(lang_db, "how_big_city", category="column"))
-        r.update({"en: city size":dict_city_en,
-                  "pl: city size":dict_city_pl})
-    # (6) calculate uni year
-    if enabled["get_uni_year"] is True:
-        dict_uni_en = target.target_uni(means_en, lang.lstr(lang_db, "which_uni_year", category="column"))
-        dict_uni_pl = target.target_uni(means_pl, lang.lstr(lang_db, "which_uni_year", category="column"))
-        r.update({"en: uni year":dict_uni_en,
-                  "pl: uni year":dict_uni_pl})
+        yield "participant size", {f"{lang.LANGUAGE_NAMES[survey_lang]} group":size for survey_lang, size in sizes.items()}
+    # (2) finish the rest of enabled statistics, e.g., mean from sum and count
+    specs = get_statistics_specs(lang_db, enabled)
+    if specs:
+        yield from target.iter_statistics(accumulated, specs=specs)
     logging.info("ok: calculated statistics for participants")
+    return
+
+
+def iter_participants_statistics(lang_db, means, enabled, state_dir="./output/incremental"):
+    """
+    yield (section, statistics) of participants: age when began to learn english, age, gender, city size, uni year
+    'means' is a dictionary of survey language : processed survey
+    if 'use_incremental' is enabled then statistics stored along with processed surveys are used
+    """
+    # (1) list statistics to calculate: (name, column, statistic, label)
+    specs = get_statistics_specs(lang_db, enabled)
+    accumulated = None
+    # (2) if surveys were processed incrementally, update statistics stored along with them instead of calculating them again
+    if specs and enabled["use_csv_from_input"] is True and enabled["use_incremental"] is True:
+        states = dict()
+        for survey_lang, obj in means.items():
+            state = fm.load_incremental_state(join(state_dir, f"{survey_lang}.pkl"))
+            if state is not None and state["statistics"] is not None and state["means"].shape[0] == obj.shape[0]:
+                states[survey_lang] = state["statistics"]
+            continue
+        if len(states) == len(means):
+            for statistics in states.values():
+                accumulated = statistics if accumulated is None else target.merge_statistics(accumulated, statistics)
+                continue
+    # (3) otherwise, calculate all of them for all languages at once, using "Language" column to tell languages apart
+    if specs and accumulated is None:
+        accumulated = target.accumulate_statistics(obj=pd.concat(list(means.values()), axis=0, ignore_index=True),
+                                                   specs=specs)
+    yield from summarize_participants_statistics(lang_db=lang_db,
+                                                 sizes={survey_lang: obj.shape[0] for survey_lang, obj in means.items()},
+                                                 accumulated=accumulated,
+                                                 enabled=enabled)
+    return
+
+
+def get_participants_statistics(lang_db, means, enabled, state_dir="./output/incremental"):
+    """
+    return dictionary with participants: age when began to learn english, age, gender, city size, uni year (see iter_participants_statistics())
+    """
+    return dict(iter_participants_statistics(lang_db=lang_db, means=means, enabled=enabled, state_dir=state_dir))
+
+
+def split_section(section, values, languages):
+    """
+    yield (survey language, statistics of its participants only) for section of statistics, see fm.save_report()
+    sections start with language (e.g., "en: age"), participant size is split by group
+    """
+    if section == "participant size":
+        for survey_lang in languages:
+            group = f"{lang.LANGUAGE_NAMES[survey_lang]} group"
+            if group in values:
+                yield survey_lang, {group: values[group]}
+            continue
+        return
+    survey_lang = section.split(": ")[0]
+    if survey_lang in languages:
+        yield survey_lang, values
+    return
+
+
+def get_condition_specs(colls_db):
+    """
+    return list of statistics to calculate for each condition (mean, stdev, min, max of participants' means), see target.get_statistics()
+    """
+    return [(condition, condition, "summary", condition) for condition in target.build_condition_matrix(tuple(colls_db))[0]]
+
+
+def get_descriptives(colls_db, reliability, obj=None, accumulated=None, decimal_points=4):
+    """
+    return dictionary of name : dataframe with
+        "condition_descriptives" - for each language and condition: participants, mean, stdev, min, max of participants' means
+                                   and reliability (cronbach's alpha, mean and lowest item-total correlation)
+        "item_reliability" - for each language and item: mean, stdev, corrected item-total correlation, alpha if item is deleted
+    spread of means is calculated from combined means ('obj') or from partial statistics of conditions ('accumulated', see get_condition_specs())
+    'reliability' is a dictionary of survey language : sums from target.accumulate_reliability()
+    """
+    conditions = target.build_condition_matrix(tuple(colls_db))[0]
+    # (1) partial statistics of each condition for each language, using "Language" column to tell languages apart
+    if accumulated is None:
+        accumulated = target.accumulate_statistics(obj=obj, specs=get_condition_specs(colls_db))
+    frames = list()
+    frames_items = list()
+    for survey_lang in accumulated["groups"]:
+        # (2) spread of participants' means in each condition
+        stats = [accumulated["numeric"][condition][survey_lang] for condition in conditions]
+        r = pd.DataFrame({"participants": [int(x["count"]) for x in stats],
+                          "mean": [x["mean"] for x in stats],
+                          "stdev": np.sqrt([x["var"] for x in stats]),
+                          "min": [x["min"] for x in stats],
+                          "max": [x["max"] for x in stats]},
+                         index=pd.Index(conditions, name="Condition")).round(decimal_points)
+        # (3) reliability of each condition and item (needs ratings, i.e., csvs from input)
+        if survey_lang in reliability:
+            reliability_conditions, reliability_items = target.summarize_reliability(reliability[survey_lang], decimal_points=decimal_points)
+            r = r.join(reliability_conditions)
+            reliability_items.insert(0, "Language", survey_lang)
+            frames_items.append(reliability_items)
+        else:
+            logging.warning(f"reliability of conditions (survey: {survey_lang}) can only be calculated from csvs in input ('use_csv_from_input')")
+        r.insert(0, "Language", survey_lang)
+        frames.append(r)
+        continue
+    r = {"condition_descriptives": pd.concat(frames, axis=0)}
+    if frames_items:
+        r["item_reliability"] = pd.concat(frames_items, axis=0)
+    logging.info(f"ok: calculated descriptive statistics of {len(conditions)} conditions ({list(accumulated['groups'])})")
+    return r
+
+
+def compare_languages(colls_db, obj, enabled, resamples=10000, seed=0, batch_size=1000, confidence=0.95, memory_budget=1 << 28):
+    """
+    return dataframe comparing participants' means of every pair of languages in each condition:
+    mean difference, effect sizes (cohen's d, hedges' g) with bootstrap confidence intervals,
+    permutation p-values and p-values corrected for multiple comparisons (see resample.compare_all())
+    resamples are spread over all cores if 'use_parallel_processing' is True; the same seed gives the same results either way
+    each process keeps at most about 'memory_budget' bytes of resamples in memory, batches get smaller as participants grow
+    """
+    conditions = target.build_condition_matrix(tuple(colls_db))[0]
+    cores = (cpu_count() or 1) if enabled["use_parallel_processing"] is True else 1
+    logging.info(f"ok: comparing languages in {len(conditions)} conditions ({resamples} resamples, seed: {seed}, processes: {cores})")
+    return resample.compare_all(obj=obj,
+                                conditions=conditions,
+                                resamples=resamples,
+                                seed=seed,
+                                cores=cores,
+                                batch_size=batch_size,
+                                confidence=confidence,
+                                memory_budget=memory_budget)
+
+
+def get_cube_dimensions(lang_db):
+    """
+    return dictionary of dimension name (in cube) : column (in processed survey) that cube of conditions is split by
+    """
+    r = {"Language": "Language"}
+    for name in ["what_gender", "how_big_city", "which_uni_year", "how_often"]:
+        r[name] = lang_db.column(name)
+        continue
+    return r
+
+
+def accumulate_cube(lang_db, colls_db, obj):
+    """
+    return cube of sums of participants' means in each condition by language and demographics (see target.accumulate_cube())
+    """
+    return target.accumulate_cube(obj=obj,
+                                  conditions=target.build_condition_matrix(tuple(colls_db))[0],
+                                  dimensions=get_cube_dimensions(lang_db))
+
+
+def get_cube(lang_db, colls_db, means, enabled, state_dir="./output/incremental"):
+    """
+    return cube of sums of participants' means in each condition for every combination of language, gender, city size, uni year and how often english is used
+    'means' is a dictionary of survey language : processed survey
+    if 'use_incremental' is enabled then cubes stored along with processed surveys (updated with new participants only) are used
+    """
+    # (1) if surveys were processed incrementally, merge cubes stored along with them
+    if enabled["use_csv_from_input"] is True and enabled["use_incremental"] is True:
+        cubes = list()
+        for survey_lang, obj in means.items():
+            state = fm.load_incremental_state(join(state_dir, f"{survey_lang}.pkl"))
+            if state is not None and state.get("cube") is not None and state["means"].shape[0] == obj.shape[0]:
+                cubes.append(state["cube"])
+            continue
+        if len(cubes) == len(means):
+            r = None
+            for cube in cubes:
+                r = target.merge_cubes(r, cube)
+                continue
+            logging.info(f"ok: merged cubes stored with incrementally processed surveys ({r.shape[0]} cells)")
+            return r
+    # (2) otherwise, build it from all languages at once
+    return accumulate_cube(lang_db=lang_db,
+                           colls_db=colls_db,
+                           obj=pd.concat(list(means.values()), axis=0, ignore_index=True))
+
+
+def load_cube(fn, dimensions):
+    """
+    return cube saved by main.py (e.g., "./output/cube.csv"), with dimension values as text, ready for target.query_cube() or target.merge_cubes()
+    'dimensions' lists names of dimensions, e.g., from get_cube_dimensions()
+    """
+    r = fm.load_dataframe(fn=fn, survey_lang="all")
+    keys = target.get_cube_keys(r, {name: name for name in dimensions})
+    r = r.drop(columns=list(dimensions))
+    r.index = pd.MultiIndex.from_frame(keys)
     return r
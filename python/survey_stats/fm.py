@@ -1,8 +1,16 @@
 """load and save files (2)"""
-from json import load
-from os import makedirs
-from os.path import exists, split
+from contextlib import ExitStack
+from csv import reader as csv_reader, writer as csv_writer
+from hashlib import sha256
+from io import BytesIO
+from importlib.util import find_spec
+from json import dump, dumps, load
+from os import listdir, makedirs, remove, stat
+from os.path import exists, join, split, splitext
+from time import time
+import lang
 import logging
+import numpy as np
 import pandas as pd
 
 
@@ -26,6 +34,21 @@ def load_json(fn, encoding="utf-8"):
     return r
 
 
+def load_lang_db(fn, encoding="utf-8"):
+    """
+    load language database (json) and compile it into lang.LangDB, checking that every language has every column and answer
+    """
+    r = load_json(fn=fn, encoding=encoding)
+    try:
+        r = lang.LangDB(r)
+        logging.info(f"ok: compiled language database: {r}")
+    except Exception as e:
+        # if failed, quit program
+        logging.exception(f"failed to compile language database {fn}; reason: {e}")
+        quit()
+    return r
+
+
 def load_columns(fn, encoding="utf-8"):
     """
     load column names from text file and return its content as list
@@ -58,13 +81,102 @@ def load_columns(fn, encoding="utf-8"):
     return r
 
 
-def load_csv(fn, survey_lang):
+def build_dtype_schema(lang_db, colls_db, survey_lang,
+                       categorical_columns=("is_l1", "is_l2", "how_often", "what_gender", "how_big_city", "which_uni_year"),
+                       numeric_columns=("age_begin_eng", "birth_year"),
+                       rating_dtype="int8", numeric_dtype="int64"):
+    """
+    return dictionary of column name : dtype for raw survey csv, to be passed to load_csv() or iter_csv()
+    ratings are stored as small integers (nullable if something is missing), answers to demographic questions as categoricals
+    other numeric answers (e.g., birth year) are integers (nullable if something is missing), so they are saved as "1996" the same as
+    without the schema, and a chunk with a missing answer is saved the same way as one without
+    columns not in the schema (e.g., timestamp) are left to pandas
+    """
+    # (1) ratings; every duplicate column (e.g., "Rate...", "Rate....1") shares the same name in the csv header
+    r = {lang_db.column("rate_competence", survey_lang): rating_dtype}
+    # (2) demographic answers
+    for name in categorical_columns:
+        r[lang_db.column(name, survey_lang)] = "category"
+        continue
+    # (3) other numeric answers
+    for name in numeric_columns:
+        r[lang_db.column(name, survey_lang)] = numeric_dtype
+        continue
+    logging.info(f"ok: built dtype schema ({survey_lang}): {len(colls_db)} ratings as '{rating_dtype}', {len(categorical_columns)} answers as 'category', "
+                 f"{len(numeric_columns)} answers as '{numeric_dtype}'")
+    return r
+
+
+def get_csv_engine(engine):
+    """
+    return csv parser engine that can be used, i.e., fall back to "c" if "pyarrow" is not installed
+    """
+    if engine == "pyarrow" and find_spec("pyarrow") is None:
+        logging.warning("pyarrow is not installed (pip install pyarrow); falling back to 'c' engine")
+        return "c"
+    return engine
+
+
+def mangle_duplicate_columns(obj):
+    """
+    rename duplicate columns the same way the "c" engine does, e.g., "Rate", "Rate.1", "Rate.2"
+    the "pyarrow" engine keeps duplicate names as-is
+    """
+    if obj.columns.is_unique:
+        return obj
+    seen = dict()
+    columns = list()
+    for col in obj.columns:
+        count = seen.get(col, 0)
+        columns.append(f"{col}.{count}" if count else col)
+        seen[col] = count + 1
+        continue
+    obj.columns = columns
+    return obj
+
+
+def get_parse_dtype(dtype):
+    """
+    return dtype to parse csv with and dictionary of column name : integer dtype of columns that are parsed as floats
+    integers can't hold missing values and nullable integers (e.g., "Int8") are slow to parse, so floats are parsed first
+    """
+    if not dtype:
+        return dtype, dict()
+    integers = {col: str(pd.api.types.pandas_dtype(t)).lower() for col, t in dtype.items() if pd.api.types.is_integer_dtype(pd.api.types.pandas_dtype(t))}
+    return dict(dtype, **{col: "float32" for col in integers}), integers
+
+
+def restore_integer_dtypes(obj, integers):
+    """
+    convert columns parsed as floats back into integers (dictionary of column name : dtype, e.g., "int8")
+    duplicate columns (e.g., "Rate....1") are converted too; columns with missing values become nullable (e.g., "Int8")
+    """
+    if not integers:
+        return obj
+    columns = [col for col in obj.columns if col in integers or col.rsplit(".", 1)[0] in integers]
+    missing = obj[columns].isna().any()
+    converted = dict()
+    for col in columns:
+        t = integers.get(col, integers.get(col.rsplit(".", 1)[0]))
+        converted[col] = t.capitalize() if missing[col] else t
+        continue
+    return obj.astype(converted)
+
+
+def load_csv(fn, survey_lang, dtype=None, engine="c", usecols=None):
     """
     load csv and return its content as pandas dataframe
+    if dtype is provided (e.g., from build_dtype_schema()), columns are parsed directly into those types
+    engine can be "c" (default), "python" or "pyarrow" (faster, multithreaded; requires pyarrow)
+    if usecols is provided (column names in csv header), other columns are never parsed
     """
     try:
-        r = pd.read_csv(fn)
-        logging.info(f"ok: loaded csv file ({survey_lang}): {fn} (columns: {r.shape[1]}, rows: {r.shape[0]})")
+        engine = get_csv_engine(engine)
+        parse_dtype, integers = get_parse_dtype(dtype)
+        r = read_csv_columns(fn, engine=engine, dtype=parse_dtype, positions=get_usecols(fn, usecols))
+        r = mangle_duplicate_columns(r)
+        r = restore_integer_dtypes(r, integers)
+        logging.info(f"ok: loaded csv file ({survey_lang}): {fn} (columns: {r.shape[1]}, rows: {r.shape[0]}, engine: {engine})")
     except Exception as e:
         # if failed, quit program
         logging.exception(f"failed to load csv file ({survey_lang}); reason: {e}")
@@ -72,6 +184,156 @@ def load_csv(fn, survey_lang):
     return r
 
 
+def iter_csv(fn, survey_lang, dtype=None, chunksize=50000, usecols=None):
+    """
+    load csv in chunks of 'chunksize' rows, yield each chunk as typed pandas dataframe
+    the index keeps counting across chunks, so rows can be matched back to the whole file
+    if usecols is provided (column names in csv header), other columns are never parsed
+    """
+    parse_dtype, integers = get_parse_dtype(dtype)
+    try:
+        reader = pd.read_csv(fn, dtype=parse_dtype, chunksize=chunksize, usecols=get_usecols(fn, usecols))
+    except Exception as e:
+        # if failed, quit program
+        logging.exception(f"failed to open csv file in chunks ({survey_lang}); reason: {e}")
+        quit()
+    rows = 0
+    with reader:
+        for chunk in reader:
+            # (a chunk with missing ratings gets nullable integers, other chunks get plain integers)
+            chunk = restore_integer_dtypes(chunk, integers)
+            rows += chunk.shape[0]
+            logging.debug(f"loaded chunk of csv file ({survey_lang}): {fn} (columns: {chunk.shape[1]}, rows: {chunk.shape[0]}, total: {rows})")
+            yield chunk
+    logging.info(f"ok: loaded csv file in chunks ({survey_lang}): {fn} (rows: {rows}, chunksize: {chunksize})")
+    return
+
+
+def read_header_record(f, chunksize=1 << 16):
+    """
+    return bytes of the first record (header) of csv file opened in binary mode, including its line break
+    """
+    f.seek(0)
+    header = b""
+    while True:
+        chunk = f.read(chunksize)
+        header += chunk
+        end = find_end_of_records(header, first=True)
+        if end or not chunk:
+            return header[:end] if end else header
+        continue
+
+
+def parse_header_record(record):
+    """
+    return list of column names in header record (bytes), as written in csv (duplicates aren't renamed)
+    """
+    return next(csv_reader([record.decode("utf-8-sig").rstrip("\r\n")]), list())
+
+
+def get_column_positions(header, usecols):
+    """
+    return positions of columns in header (list of names) that are in usecols, e.g., every duplicate rating column
+    positions work with every csv engine and with duplicate or dotted column names, unlike names
+    """
+    usecols = set(usecols)
+    r = [i for i, col in enumerate(header) if col in usecols]
+    missing = usecols.difference(header)
+    if missing:
+        logging.warning(f"columns not found in csv header: {sorted(missing)}")
+    return r
+
+
+def get_usecols(fn, usecols):
+    """
+    return positions of columns in csv file that are in usecols (column names), or None to read every column
+    """
+    if usecols is None:
+        return None
+    with open(fn, "rb") as f:
+        header = parse_header_record(read_header_record(f))
+    r = get_column_positions(header, usecols)
+    logging.info(f"ok: reading {len(r)} of {len(header)} columns: {fn}")
+    return r
+
+
+def read_csv_columns(source, engine, dtype, positions=None):
+    """
+    return csv parsed with only columns at 'positions' (all columns if None)
+    the "pyarrow" engine selects columns by name only, which can't tell duplicate ratings apart, so it parses all columns and the rest are dropped
+    """
+    if engine == "pyarrow" and positions is not None:
+        return pd.read_csv(source, dtype=dtype, engine=engine).iloc[:, positions]
+    return pd.read_csv(source, dtype=dtype, engine=engine, usecols=positions)
+
+
+def count_fields(record):
+    """
+    return number of fields in one csv record (commas inside quotes don't count)
+    """
+    data = np.frombuffer(record, dtype=np.uint8)
+    quotes = np.cumsum(data == ord('"'))
+    commas = np.flatnonzero(data == ord(","))
+    return int(np.count_nonzero(quotes[commas] % 2 == 0)) + 1
+
+
+def find_end_of_records(data, first=False, fields=None):
+    """
+    return how many bytes of csv 'data' hold complete records, i.e., up to the last line break outside quotes
+    if 'data' doesn't end inside quotes, its last record is complete even without a line break (google forms doesn't add one),
+    as long as it has 'fields' fields (if provided); otherwise it may still be being written
+    if first is True then return where the first record ends instead (0 if it doesn't end within 'data')
+    """
+    data = np.frombuffer(data, dtype=np.uint8)
+    # a line break (or comma) ends a record (or field) only if an even number of quotes came before it
+    quotes = np.cumsum(data == ord('"'))
+    breaks = np.flatnonzero(data == ord("\n"))
+    breaks = breaks[quotes[breaks] % 2 == 0]
+    if first is True:
+        return int(breaks[0]) + 1 if breaks.size else 0
+    last = int(breaks[-1]) + 1 if breaks.size else 0
+    if quotes.size == 0 or last == data.size or quotes[-1] % 2 != 0:
+        return last
+    if fields is not None and count_fields(data[last:].tobytes()) != fields:
+        return last
+    return data.size
+
+
+def load_csv_from(fn, survey_lang, offset=0, first_row=0, dtype=None, engine="c", chunksize=1 << 16, usecols=None):
+    """
+    load only records of csv that start at byte 'offset' (e.g., rows appended since last time) and return them as pandas dataframe
+    the header is read from the beginning of the file and the index starts from 'first_row', so rows keep the same index as in the whole file
+    if usecols is provided (column names in csv header), other columns are never parsed
+    return: dataframe (or None if there are no new complete records), byte where the last complete record ends
+    """
+    try:
+        with open(fn, "rb") as f:
+            # (1) read header, i.e., the first record (not needed if reading from the beginning)
+            header = read_header_record(f, chunksize) if offset > 0 else b""
+            # (2) read everything after offset, leave out an incomplete record (e.g., file is still being written)
+            f.seek(offset)
+            data = f.read()
+        header_record = header or data[:find_end_of_records(data, first=True)]
+        fields = count_fields(header_record.rstrip(b"\r\n"))
+        end = find_end_of_records(data, fields=fields)
+        if not data[:end].strip():
+            logging.info(f"ok: no new rows in csv file ({survey_lang}): {fn} (from byte: {offset})")
+            return None, offset
+        engine = get_csv_engine(engine)
+        parse_dtype, integers = get_parse_dtype(dtype)
+        positions = None if usecols is None else get_column_positions(parse_header_record(header_record), usecols)
+        r = read_csv_columns(BytesIO(header + data[:end]), engine=engine, dtype=parse_dtype, positions=positions)
+        r = mangle_duplicate_columns(r)
+        r = restore_integer_dtypes(r, integers)
+        r.index = pd.RangeIndex(first_row, first_row + r.shape[0])
+        logging.info(f"ok: loaded csv file ({survey_lang}): {fn} (columns: {r.shape[1]}, rows: {r.shape[0]}, from byte: {offset}, engine: {engine})")
+    except Exception as e:
+        # if failed, quit program
+        logging.exception(f"failed to load csv file ({survey_lang}); reason: {e}")
+        quit()
+    return r, offset + end
+
+
 def create_dir_if_doesnt_exist(fn):
     """
     checks if directory name containing file exists, creates if it doesn't
@@ -98,22 +360,354 @@ def save_dataframe_as_csv(obj, fn, index=True):
     return
 
 
+def append_dataframe_as_csv(obj, fn, header=False, index=True):
+    """
+    append pandas dataframe (e.g., chunk of rows) to the end of csv file
+    if header is true then file is started from scratch with column names as the first line
+    """
+    if header is True:
+        create_dir_if_doesnt_exist(fn)
+    obj.to_csv(fn, mode="w" if header is True else "a", header=header, index=index)
+    logging.debug(f"appended to csv: {fn} (columns: {obj.shape[1]}, rows: {obj.shape[0]})")
+    return
+
+
+def get_dataframe_format(fn):
+    """
+    return format of dataframe file based on its extension: "csv", "parquet" or "feather"
+    """
+    for extension, fmt in {".csv": "csv", ".parquet": "parquet", ".feather": "feather"}.items():
+        if fn.lower().endswith(extension):
+            return fmt
+        continue
+    logging.error(f"unknown dataframe format, expected '.csv', '.parquet' or '.feather': {fn}")
+    quit()
+
+
+def check_pyarrow(fmt):
+    """
+    quit program if pyarrow, required by columnar formats, is not installed
+    """
+    if find_spec("pyarrow") is None:
+        logging.error(f"pyarrow is required to use '{fmt}' files (pip install pyarrow)")
+        quit()
+    return
+
+
+def save_dataframe(obj, fn, index=True, compression="zstd"):
+    """
+    save pandas dataframe as csv, parquet or feather file, depending on extension (e.g., "./output/stats.parquet")
+    parquet and feather are compressed, columnar and keep dtypes (e.g., categoricals); they require pyarrow
+    if index is true then row numbers are kept
+    """
+    fmt = get_dataframe_format(fn)
+    if fmt == "csv":
+        return save_dataframe_as_csv(obj=obj, fn=fn, index=index)
+    check_pyarrow(fmt)
+    # check if directory exists, create if doesn't
+    create_dir_if_doesnt_exist(fn)
+    if fmt == "parquet":
+        obj.to_parquet(fn, index=index, compression=compression)
+    else:
+        # pandas' to_feather() doesn't keep the index, so pyarrow is used directly
+        from pyarrow import Table, feather
+        feather.write_feather(Table.from_pandas(obj, preserve_index=index), fn, compression=compression)
+    logging.info(f"ok: saved {fmt}: {fn} (columns: {obj.shape[1]}, rows: {obj.shape[0]}, compression: {compression})")
+    return
+
+
+def load_dataframe(fn, survey_lang, memory_map=False, dtype=None, engine="c"):
+    """
+    load csv, parquet or feather file (depending on extension) and return its content as pandas dataframe
+    if memory_map is true then parquet and feather files are memory-mapped instead of read into memory first
+    dtype and engine are used for csv files only (see load_csv())
+    """
+    fmt = get_dataframe_format(fn)
+    if fmt == "csv":
+        return load_csv(fn=fn, survey_lang=survey_lang, dtype=dtype, engine=engine)
+    check_pyarrow(fmt)
+    try:
+        if fmt == "parquet":
+            r = pd.read_parquet(fn, memory_map=memory_map)
+        else:
+            from pyarrow import feather
+            r = feather.read_table(fn, memory_map=memory_map).to_pandas()
+        logging.info(f"ok: loaded {fmt} file ({survey_lang}): {fn} (columns: {r.shape[1]}, rows: {r.shape[0]}, memory map: {memory_map})")
+    except Exception as e:
+        # if failed, quit program
+        logging.exception(f"failed to load {fmt} file ({survey_lang}); reason: {e}")
+        quit()
+    return r
+
+
+# formats that reports (e.g., statistics of participants) can be saved in, see ReportWriter
+REPORT_FORMATS = ("txt", "json", "ndjson", "csv")
+
+
+def to_builtin(value):
+    """
+    return numpy scalar as python number (used when saving json, which can't encode numpy integers)
+    """
+    if isinstance(value, np.generic):
+        return value.item()
+    raise TypeError(f"can't save {type(value).__name__} in report")
+
+
+class ReportWriter:
+    """
+    write report (header and sections of key = value) to files in several formats at once, section by section as they come,
+    so that the whole report is never built in memory:
+        "txt" - header, then "[section]" followed by "key = value" lines, each preceded by a tab
+        "json" - {"header": ..., "sections": {section: {key: value}}}
+        "ndjson" - header line, then one line per section: {"section": ..., "values": {key: value}}
+        "csv" - section,key,value rows (without header)
+    files are named after 'fn' with extension of each format, e.g., "./output/stats.txt" -> "./output/stats.json"
+    use as context manager, e.g., "with fm.ReportWriter(fn, header, formats=["txt", "json"]) as report: report.write(section, values)"
+    """
+    __slots__ = ("fns", "header", "files", "csv", "sections")
+
+    def __init__(self, fn, header, formats=("txt",)):
+        unknown = [fmt for fmt in formats if fmt not in REPORT_FORMATS]
+        if unknown:
+            raise ValueError(f"unknown report format: {unknown} (available: {list(REPORT_FORMATS)})")
+        self.fns = {fmt: f"{splitext(fn)[0]}.{fmt}" for fmt in dict.fromkeys(formats)}
+        self.header = header
+        self.files = dict()
+        self.csv = None
+        self.sections = 0
+
+    def __enter__(self):
+        for fmt, fn in self.fns.items():
+            # check if directory exists, create if doesn't
+            create_dir_if_doesnt_exist(fn=fn)
+            self.files[fmt] = open(fn, "w", encoding="utf-8", newline="" if fmt == "csv" else None)
+            continue
+        if "txt" in self.files:
+            self.files["txt"].write(f"{self.header}\n")
+        if "json" in self.files:
+            self.files["json"].write(f'{{"header": {dumps(self.header, ensure_ascii=False)}, "sections": {{')
+        if "ndjson" in self.files:
+            self.files["ndjson"].write(f"{dumps({'header': self.header}, ensure_ascii=False)}\n")
+        if "csv" in self.files:
+            self.csv = csv_writer(self.files["csv"])
+            self.csv.writerow(["section", "key", "value"])
+        return self
+
+    def write(self, section, values):
+        """
+        write one section (dictionary of key : value) to every format
+        """
+        if "txt" in self.files:
+            self.files["txt"].write(f"\n[{section}]\n" + "".join(f"\t{key} = {value}\n" for key, value in values.items()))
+        if "json" in self.files:
+            self.files["json"].write(f"{', ' if self.sections else ''}{dumps(section, ensure_ascii=False)}: {dumps(values, default=to_builtin, ensure_ascii=False)}")
+        if "ndjson" in self.files:
+            self.files["ndjson"].write(f"{dumps({'section': section, 'values': values}, default=to_builtin, ensure_ascii=False)}\n")
+        if self.csv is not None:
+            self.csv.writerows([section, key, value] for key, value in values.items())
+        self.sections += 1
+        return
+
+    def __exit__(self, exc_type, *args):
+        if "json" in self.files and exc_type is None:
+            self.files["json"].write("}}\n")
+        for file in self.files.values():
+            file.close()
+            continue
+        if exc_type is None:
+            for fmt, fn in self.fns.items():
+                logging.info(f"ok: saved {fmt}: {fn}")
+                continue
+        return False
+
+
+def save_report(obj, header, fn, formats=("txt",), split=None, fn_shards=None):
+    """
+    save report in every format (see ReportWriter), each section as soon as 'obj' yields it
+    'obj' is a dictionary of section : dictionary of key : value, or anything that yields (section, dictionary) pairs, e.g., a generator
+    'split' is an optional function(section, values) that yields (shard, values): they are also saved to shard's own report,
+    'fn_shards' has "{shard}" in place of shard name, e.g., "./output/stats_{shard}.txt" -> "./output/stats_en.txt"
+    shards are written one after another in the same loop, not in parallel: each section is written as soon as 'obj' yields it,
+    so workers would only wait for the next section (and writing a few lines of text costs less than starting them)
+    """
+    with ExitStack() as stack:
+        report = stack.enter_context(ReportWriter(fn=fn, header=header, formats=formats))
+        shards = dict()
+        for section, values in (obj.items() if isinstance(obj, dict) else obj):
+            report.write(section, values)
+            # shard's report is opened when its first section comes
+            for shard, shard_values in (split(section, values) if split is not None else ()):
+                if shard not in shards:
+                    shards[shard] = stack.enter_context(ReportWriter(fn=fn_shards.format(shard=shard), header=header, formats=formats))
+                shards[shard].write(section, shard_values)
+                continue
+            continue
+    return
+
+
 def save_dictionary_as_txt(obj, header, fn):
     """
     save dictionary as txt file, with each value preceded by a tab
     """
-    # create long string
-    to_save = f"{header}\n"
-    for key, value in obj.items():
-        to_save += f"\n[{key}]\n"
-        for subkey, subvalue in value.items():
-            to_save += f"\t{subkey} = {subvalue}\n"
+    save_report(obj=obj, header=header, fn=fn, formats=("txt",))
+    return
+
+
+def hash_file(fn, cache_dir="./output/cache", chunksize=1 << 20):
+    """
+    return sha256 of file's content as hex string
+    the hash is remembered in "hashes.json" along with file's size and modification time, so unchanged files are not read again
+    """
+    fn_hashes = join(cache_dir, "hashes.json")
+    hashes = dict()
+    if exists(fn_hashes):
+        try:
+            with open(fn_hashes, "r", encoding="utf-8") as f:
+                hashes = load(f)
+        except Exception as e:
+            logging.warning(f"failed to load file hashes, all files will be hashed again; reason: {e}")
+    info = stat(fn)
+    known = hashes.get(fn)
+    if known and known["size"] == info.st_size and known["mtime_ns"] == info.st_mtime_ns:
+        logging.debug(f"file unchanged since last hashed: {fn}")
+        return known["sha256"]
+    # read in chunks, so that large files don't have to fit in memory
+    h = sha256()
+    with open(fn, "rb") as f:
+        for chunk in iter(lambda: f.read(chunksize), b""):
+            h.update(chunk)
+            continue
+    hashes[fn] = {"size": info.st_size, "mtime_ns": info.st_mtime_ns, "sha256": h.hexdigest()}
+    create_dir_if_doesnt_exist(fn=fn_hashes)
+    with open(fn_hashes, "w", encoding="utf-8") as f:
+        dump(hashes, f, indent=4)
+    logging.info(f"ok: hashed file: {fn} ({info.st_size} bytes)")
+    return hashes[fn]["sha256"]
+
+
+def hash_file_heads(fn, sizes, chunksize=1 << 20):
+    """
+    return list of sha256 (hex strings) of the first 'size' bytes of file for each of 'sizes', reading the file once
+    used to check that the part of a file that was already processed hasn't changed
+    """
+    r = dict()
+    h = sha256()
+    position = 0
+    with open(fn, "rb") as f:
+        for size in sorted(set(sizes)):
+            while position < size:
+                chunk = f.read(min(chunksize, size - position))
+                if not chunk:
+                    break
+                h.update(chunk)
+                position += len(chunk)
+                continue
+            r[size] = h.hexdigest() if position == size else None
             continue
+    return [r[size] for size in sizes]
+
+
+def get_cache_key(*parts):
+    """
+    return sha256 of all parts (e.g., file hashes, settings) as hex string; any json-serializable part can be used
+    """
+    return sha256(dumps(parts, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+
+def load_cached_dataframe(key, cache_dir="./output/cache"):
+    """
+    return pandas dataframe cached under key and its metadata, or None, None if it's not cached
+    """
+    fn = join(cache_dir, f"{key}.pkl")
+    fn_meta = join(cache_dir, f"{key}.json")
+    if not exists(fn) or not exists(fn_meta):
+        return None, None
+    try:
+        r = pd.read_pickle(fn)
+        # remember when the entry was last used, so that unused entries can be evicted
+        with open(fn_meta, "r", encoding="utf-8") as f:
+            metadata = load(f)
+        metadata["last_used"] = time()
+        with open(fn_meta, "w", encoding="utf-8") as f:
+            dump(metadata, f, indent=4)
+    except Exception as e:
+        # e.g., cache written by a different pandas version; treat as not cached
+        logging.warning(f"failed to load cached dataframe '{key}', it will be recalculated; reason: {e}")
+        return None, None
+    logging.info(f"ok: loaded cached dataframe ({metadata.get('survey_lang')}): {key} (columns: {r.shape[1]}, rows: {r.shape[0]})")
+    return r, metadata
+
+
+def save_cached_dataframe(obj, key, metadata, cache_dir="./output/cache"):
+    """
+    save pandas dataframe under key, along with metadata (json) describing what it was calculated from
+    """
+    fn = join(cache_dir, f"{key}.pkl")
+    create_dir_if_doesnt_exist(fn=fn)
+    obj.to_pickle(fn)
+    metadata = dict(metadata, key=key, created=time(), last_used=time(), rows=obj.shape[0], columns=obj.shape[1])
+    with open(join(cache_dir, f"{key}.json"), "w", encoding="utf-8") as f:
+        dump(metadata, f, indent=4)
+    logging.info(f"ok: cached dataframe ({metadata.get('survey_lang')}): {key} (columns: {obj.shape[1]}, rows: {obj.shape[0]})")
+    return
+
+
+def evict_cache(cache_dir="./output/cache", keep=(), max_age_days=30):
+    """
+    remove cached dataframes that are stale, i.e., superseded by an entry in 'keep' (same input file, different key)
+    or not used for more than max_age_days
+    """
+    if not exists(cache_dir):
+        return
+    entries = dict()
+    for fn in listdir(cache_dir):
+        if not fn.endswith(".json") or fn == "hashes.json":
+            continue
+        try:
+            with open(join(cache_dir, fn), "r", encoding="utf-8") as f:
+                entries[fn[:-len(".json")]] = load(f)
+        except Exception as e:
+            logging.warning(f"failed to load cache metadata '{fn}'; reason: {e}")
         continue
-    # check if directory exists, create if doesn't
+    kept_inputs = {entries[key].get("fn_input") for key in keep if key in entries}
+    removed = 0
+    for key, metadata in entries.items():
+        if key in keep:
+            continue
+        superseded = metadata.get("fn_input") in kept_inputs
+        unused = time() - metadata.get("last_used", 0) > max_age_days * 24 * 60 * 60
+        if superseded or unused:
+            for fn in (join(cache_dir, f"{key}.pkl"), join(cache_dir, f"{key}.json")):
+                if exists(fn):
+                    remove(fn)
+                continue
+            removed += 1
+        continue
+    logging.info(f"ok: evicted {removed} stale cached dataframes, {len(entries) - removed} left")
+    return
+
+
+def load_incremental_state(fn):
+    """
+    return what was stored by save_incremental_state() (e.g., how far input csv was processed), or None if nothing was stored
+    """
+    if not exists(fn):
+        return None
+    try:
+        r = pd.read_pickle(fn)
+    except Exception as e:
+        # e.g., written by a different pandas version; start over
+        logging.warning(f"failed to load incremental state, survey will be processed from the beginning; reason: {e}")
+        return None
+    logging.info(f"ok: loaded incremental state: {fn} (rows processed: {r['rows']}, bytes processed: {r['offset']})")
+    return r
+
+
+def save_incremental_state(obj, fn):
+    """
+    save dictionary (e.g., processed means, how far input csv was processed) so that the next run can continue from there
+    """
     create_dir_if_doesnt_exist(fn=fn)
-    # save to txt
-    with open(fn, "w+") as file_write:
-        file_write.write(to_save)
-    logging.info(f"ok: saved txt: {fn}")
+    pd.to_pickle(obj, fn)
+    logging.info(f"ok: saved incremental state: {fn} (rows processed: {obj['rows']}, bytes processed: {obj['offset']})")
     return
@@ -1,16 +1,144 @@
 """translate between english and polish (1)"""
+from hashlib import sha256
+from json import dumps, loads
+from types import MappingProxyType
 import logging
+import numpy as np
+import pandas as pd
 
 # setup per-module logger
 log = logging.getLogger(__name__).addHandler(logging.NullHandler())
 
+# survey language : name used in lang_db (e.g., "polish_columns", "polish_answers")
+# to add a survey language, add it here and add its columns and answers to lang_db
+LANGUAGE_NAMES = {"en": "english",
+                  "pl": "polish"}
+
+
+def validate_lang_db(lang_db):
+    """
+    raise ValueError if lang_db (dictionary loaded from lang_db.json) can't be used, e.g., a language is missing a column or answer
+    every language must have the same internal names as english and no two names can share the same text
+    """
+    problems = list()
+    for language, language_name in LANGUAGE_NAMES.items():
+        for category in ("columns", "answers"):
+            strings = lang_db.get(f"{language_name}_{category}")
+            if not isinstance(strings, dict):
+                problems.append(f"'{language_name}_{category}' is missing")
+                continue
+            missing = [name for name in lang_db.get(f"english_{category}", dict()) if name not in strings]
+            if missing:
+                problems.append(f"'{language_name}_{category}' is missing {missing}")
+            empty = [name for name, text in strings.items() if not isinstance(text, str) or not text]
+            if empty:
+                problems.append(f"'{language_name}_{category}' has no text for {empty}")
+            duplicates = sorted({text for text in strings.values() if list(strings.values()).count(text) > 1}, key=str)
+            if duplicates:
+                problems.append(f"'{language_name}_{category}' uses the same text for more than one name: {duplicates}")
+            continue
+        continue
+    if problems:
+        raise ValueError(f"invalid lang_db: {'; '.join(problems)}")
+    return
+
+
+class LangDB:
+    """
+    lang_db (dictionary loaded from lang_db.json) compiled once into read-only lookups
+    columns[language][name] / answers[language][name] - text in language, e.g., columns["pl"]["is_l1"]
+    column_names[language][text] / answer_names[language][text] - internal name of text in language
+    column_maps[language] / answer_maps[language] - text in language : text in english
+    missing names raise KeyError (lstr() returns None instead)
+    """
+    __slots__ = ("languages", "columns", "answers", "column_names", "answer_names", "column_maps", "answer_maps", "digest", "_source", "_positions")
+
+    def __init__(self, lang_db):
+        validate_lang_db(lang_db)
+        # keep a copy, so that changes to the dictionary don't change lookups
+        source = loads(dumps(lang_db))
+        columns = {language: MappingProxyType(source[f"{language_name}_columns"]) for language, language_name in LANGUAGE_NAMES.items()}
+        answers = {language: MappingProxyType(source[f"{language_name}_answers"]) for language, language_name in LANGUAGE_NAMES.items()}
+
+        def reverse(strings):
+            return MappingProxyType({language: MappingProxyType({text: name for name, text in d.items()}) for language, d in strings.items()})
+
+        def to_english(strings):
+            return MappingProxyType({language: MappingProxyType({d[name]: strings["en"][name] for name in strings["en"]}) for language, d in strings.items()})
+
+        object.__setattr__(self, "languages", tuple(LANGUAGE_NAMES))
+        object.__setattr__(self, "columns", MappingProxyType(columns))
+        object.__setattr__(self, "answers", MappingProxyType(answers))
+        object.__setattr__(self, "column_names", reverse(columns))
+        object.__setattr__(self, "answer_names", reverse(answers))
+        object.__setattr__(self, "column_maps", to_english(columns))
+        object.__setattr__(self, "answer_maps", to_english(answers))
+        object.__setattr__(self, "digest", sha256(dumps(source, sort_keys=True).encode("utf-8")).hexdigest())
+        object.__setattr__(self, "_source", source)
+        object.__setattr__(self, "_positions", dict())
+
+    def __setattr__(self, name, value):
+        raise AttributeError(f"LangDB is read-only, can't set '{name}'")
+
+    def __delattr__(self, name):
+        raise AttributeError(f"LangDB is read-only, can't delete '{name}'")
+
+    def __reduce__(self):
+        # compiled again when unpickled (e.g., in another process)
+        return LangDB, (self._source,)
+
+    def __repr__(self):
+        return f"LangDB(languages={self.languages}, columns={len(self.columns['en'])}, answers={len(self.answers['en'])}, digest={self.digest[:12]})"
+
+    def column(self, name, language="en"):
+        """
+        return column name in language, e.g., column("is_l1", "pl")
+        """
+        try:
+            return self.columns[language][name]
+        except KeyError:
+            raise KeyError(f"column '{name}' in language '{language}' not found in lang_db (languages: {list(self.languages)})") from None
+
+    def answer(self, name, language="en"):
+        """
+        return answer in language, e.g., answer("yes", "pl")
+        """
+        try:
+            return self.answers[language][name]
+        except KeyError:
+            raise KeyError(f"answer '{name}' in language '{language}' not found in lang_db (languages: {list(self.languages)})") from None
+
+    def positions(self, columns, name, language="en"):
+        """
+        return positions (array) of columns of a loaded dataframe that hold column 'name', including duplicates (e.g., "Rate....1")
+        positions are remembered for each distinct list of columns, so they're found once per survey
+        """
+        key = (tuple(columns), name, language)
+        r = self._positions.get(key)
+        if r is None:
+            text = self.column(name, language)
+            r = np.flatnonzero([col == text or col.startswith(f"{text}.") for col in key[0]])
+            r.setflags(write=False)
+            self._positions[key] = r
+        return r
+
 
 def lstr(lang_db, name="", category="", language="en", return_available_categories=False, filename="./input/lang_db.json"):
     """
     Get localized string in either English or Polish.
     If 'return_available_categories' is True then all internal strings are returned as categorized dictionary.
     Return None if failed.
+    Works with both dictionary and LangDB; prefer LangDB.column() / LangDB.answer(), which fail fast on missing names.
     """
+    # compiled lang_db (LangDB), look up directly
+    if isinstance(lang_db, LangDB):
+        if return_available_categories is True:
+            return {"column": list(lang_db.columns["en"]), "answer": list(lang_db.answers["en"])}
+        strings = lang_db.columns if category == "column" else lang_db.answers
+        if language not in strings:
+            logging.error(f"unknown language that is not one of {list(LANGUAGE_NAMES)}: {language}")
+            return None
+        return strings[language].get(name, None)
     logging.debug(f"requested: {name=}, {category=}, {language=}, {return_available_categories=}")
     # if asked to return all available strings as a categorized dictionary, return early
     if return_available_categories is True:
@@ -18,24 +146,16 @@ def lstr(lang_db, name="", category="", language="en", return_available_categori
              "answer": list(lang_db["english_answers"].keys())}
         return r
     # otherwise, translate
-    # return english string from category:
-    if language == "en":
-        # column
-        if category == "column":
-            return lang_db["english_columns"].get(name, None)
-        # answer
-        else:
-            return lang_db["english_answers"].get(name, None)
-    # return polish string from category:
-    elif language == "pl":
+    # return string in language from category:
+    if language in LANGUAGE_NAMES:
         # column
         if category == "column":
-            return lang_db["polish_columns"].get(name, None)
+            return lang_db[f"{LANGUAGE_NAMES[language]}_columns"].get(name, None)
         # answer
         else:
-            return lang_db["polish_answers"].get(name, None)
+            return lang_db[f"{LANGUAGE_NAMES[language]}_answers"].get(name, None)
     else:
-        logging.error(f"unknown language that is not 'en' or 'pl': {language}")
+        logging.error(f"unknown language that is not one of {list(LANGUAGE_NAMES)}: {language}")
     return None
 
 
@@ -43,30 +163,62 @@ def translate_pl_to_en(obj, lang_db):
     """
     Return Polish dataframe where all columns and answers are translated to English.
     """
-    # get all avilable categories and internal string names (e.g., {'column': ['rate_competence', 'is_l1]})
-    internal_categories_db = lstr(lang_db, return_available_categories=True)
-    # create dictionary: polish column name : english column name
-    column_map = dict()
-    for name in internal_categories_db["column"]:
-        column_pl = lstr(lang_db, name, category="column", language="pl")
-        column_en = lstr(lang_db, name, category="column", language="en")
-        # if at rating, replace individual columns that contain numbers at the end
-        # because normally, only the EXACT match will be replaced and not the rest
-        if name == "rate_competence":
-            obj.columns = [col.replace(column_pl, column_en) for col in obj.columns]
-            continue
-        column_map.update({column_pl:column_en})
+    return translate_to_en(obj, lang_db, language="pl")
+
+
+def translate_answers(column, answer_map):
+    """
+    Return column (pandas series) with answers translated using answer_map.
+    Only distinct answers are translated, so the cost depends on the number of distinct answers rather than rows.
+    """
+    # fast path: typed (categorical) column, rename its categories
+    if isinstance(column.dtype, pd.CategoricalDtype):
+        categories = [answer_map.get(category, category) for category in column.cat.categories]
+        if len(set(categories)) == len(categories):
+            return column.cat.rename_categories(categories)
+        # two answers were translated into the same answer (e.g., both "Tak" and "Yes" were found), merge them
+        codes, uniques = column.cat.codes.to_numpy(), categories
+    else:
+        codes, uniques = pd.factorize(column)
+        uniques = [answer_map.get(unique, unique) for unique in uniques]
+    # missing answers have code -1, i.e., the last item
+    translated = np.array(uniques + [np.nan], dtype=object)[codes]
+    if isinstance(column.dtype, pd.CategoricalDtype):
+        return pd.Series(translated, index=column.index, name=column.name, dtype="category")
+    return pd.Series(translated, index=column.index, name=column.name)
+
+
+def translate_to_en(obj, lang_db, language):
+    """
+    Return dataframe in language (e.g., "pl") where all columns and answers are translated to English.
+    'lang_db' is compiled LangDB.
+    Only answers in columns found in lang_db are translated; ratings and other columns are left as-is.
+    """
+    # (1) dictionary of column name in language : english column name (compiled once in lang_db)
+    column_map = dict(lang_db.column_maps[language])
+    # ratings are renamed by prefix, because each of them has a number at the end (e.g., "Rate....1")
+    rate_other = lang_db.column("rate_competence", language)
+    rate_en = column_map.pop(rate_other)
+    # (2) rename columns to english in a single pass
+    obj = obj.copy(deep=False)
+    columns = list()
+    for col in obj.columns:
+        if col in column_map:
+            col = column_map[col]
+        elif col.startswith(rate_other):
+            col = rate_en + col[len(rate_other):]
+        columns.append(col)
         continue
-    # rename polish to english columns
-    obj.rename(columns=column_map, inplace=True)
-    # create dictionary: polish answer name : english answer name
-    answer_map = dict()
-    for name in internal_categories_db["answer"]:
-        answer_pl = lstr(lang_db, name, category="answer", language="pl")
-        answer_en = lstr(lang_db, name, category="answer", language="en")
-        answer_map.update({answer_pl:answer_en})
+    obj.columns = columns
+    # (3) dictionary of answer in language : english answer (compiled once in lang_db)
+    answer_map = lang_db.answer_maps[language]
+    # (4) rename answers to english, only in columns that can contain answers (numbers, e.g., birth year, are skipped)
+    translated = 0
+    for col in column_map.values():
+        if col not in obj.columns or pd.api.types.is_numeric_dtype(obj[col].dtype):
+            continue
+        obj[col] = translate_answers(obj[col], answer_map)
+        translated += 1
         continue
-    # rename polish answers to english answers
-    obj = obj.replace(answer_map)
-    logging.info(f"ok: translated polish survey to english (rows={obj.shape[0]}, columns={obj.shape[1]})")
+    logging.info(f"ok: translated {LANGUAGE_NAMES[language]} survey to english (rows={obj.shape[0]}, columns={obj.shape[1]}, answer columns={translated})")
     return obj
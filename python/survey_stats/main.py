@@ -1,8 +1,10 @@
 """main function (5)"""
+from functools import partial
 from time import perf_counter
 import comp
 import fm
 import logging
+import prof
 import sys
 import target
 
@@ -24,49 +26,141 @@ def main():
     # (0) user toggles
     enabled = {"use_csv_from_input":True, # if false then csv from "./output" will be loaded
                # useful if you want to edit them manually and then pass them to get_participants_statistics()
+               "use_memory_map":False, # if true then parquet/feather files from "./output" are memory-mapped
+               "use_typed_csv":True, # if true then ratings are loaded as small integers and answers as categoricals (saved files are the same, see test_fm.py)
+               "use_pyarrow_engine":False, # if true then csv files are parsed using pyarrow (faster, requires pyarrow)
+               "use_cache":True, # if true then processed csvs are cached in "./output/cache" and reused until input changes
+               "use_parallel_processing":False, # if true then each survey language is processed in a separate process
+               "use_streaming":False, # if true then csvs from "./input" are processed in chunks of 'chunksize' rows (memory doesn't grow with survey size, saves csv only)
+               "use_incremental":False, # if true then only rows added to input csvs since last run are processed (state in "./output/incremental")
                "display_dataframes":True, # if false then dataframes won't be printed out
                "get_participant_size":True,
                "get_began_english":True,
                "get_age":True,
                "get_gender":True,
                "get_city":True,
-               "get_uni_year":True}
+               "get_uni_year":True,
+               "get_descriptives":True, # if true then spread and reliability (cronbach's alpha, item-total correlations) of each condition are saved
+               "get_comparisons":True, # if true then languages are compared in each condition (permutation tests, bootstrap confidence intervals)
+               "get_cube":True, # if true then sums of conditions by language and demographics are saved, so that any subgroup mean is a sum of cells
+               "save_language_reports":False} # if true then statistics of each language are also saved separately (e.g., "./output/stats_en.txt")
+    # format of dataframes saved to "./output": "csv", "parquet" or "feather" (parquet and feather keep dtypes, require pyarrow)
+    output_format = "csv"
+    # formats of statistics of participants: any of "txt", "json", "ndjson", "csv" (all of them are written in the same pass)
+    report_formats = ["txt"]
+    # rows per chunk if 'use_streaming' is True
+    chunksize = 50000
+    # permutations and bootstrap resamples if 'get_comparisons' is True (the same seed always gives the same p-values and confidence intervals)
+    resamples = 10000
+    seed = 0
+    # start measuring stages (if "SURVEY_STATS_PROFILE" environment variable is set)
+    prof.start()
     # (1) load language database: english/polish language database of column names and answers
-    lang_db = fm.load_json(fn="./input/lang_db.json")
+    with prof.stage("(1) load language database"):
+        lang_db = fm.load_lang_db(fn="./input/lang_db.json")
     # (2) load custom column names for questions
-    colls_db = fm.load_columns(fn="./input/column_names.txt")
+    with prof.stage("(2) load custom column names"):
+        colls_db = fm.load_columns(fn="./input/column_names.txt")
     # (3) load csvs, save a copy to "./output"
-    means_en, means_pl = comp.get_clean_dfs(lang_db=lang_db,
-                                            enabled=enabled,
-                                            colls_db=colls_db,
-                                            fn_survey_input_en="./input/Survey research EN.csv",
-                                            fn_survey_input_pl="./input/Survey research PL.csv",
-                                            fn_survey_output_en="./output/processed_EN.csv",
-                                            fn_survey_output_pl="./output/processed_PL.csv",
-                                            max_clicker_ratio=80)
-    # (4) combine both dataframes into one
-    means_both = comp.combine_dfs(means_en=means_en,
-                                  means_pl=means_pl,
-                                  enabled=enabled)
-    means_both = target.rename_index_to_participant(means_both) # start numbering from 1, rename index to "Participant"
-    # (5) calculate statistics (e.g., age, gender, city size):
-    stats = comp.get_participants_statistics(lang_db=lang_db,
-                                             means_en=means_en,
-                                             means_pl=means_pl,
-                                             enabled=enabled)
-    # (6) save all columns in combined means to csv
-    fm.save_dataframe_as_csv(obj=means_both,
-                             fn="./output/combined_all_columns.csv")
-    # (7) save only mean values + "Language" column to csv
+    # survey language : raw csv in "./input" and processed csv in "./output" (language must be in lang.LANGUAGE_NAMES)
+    surveys = {"en": {"fn_input": "./input/Survey research EN.csv",
+                      "fn_output": f"./output/processed_EN.{output_format}"},
+               "pl": {"fn_input": "./input/Survey research PL.csv",
+                      "fn_output": f"./output/processed_PL.{output_format}"}}
+    # columns of combined means only: "Language" + mean values
     colls = list(set(colls_db))
     colls.insert(0, "Language")
-    means_both = means_both.filter(colls)
-    fm.save_dataframe_as_csv(obj=means_both,
-                             fn="./output/combined_means_only.csv")
-    # (8) save participants statistics to a txt file
-    fm.save_dictionary_as_txt(obj=stats,
-                              header="[all data below has been calculated after the participants were removed]",
-                              fn="./output/stats.txt")
+    # (3-7) process csvs from "./input" chunk by chunk, save processed rows as they come and update statistics
+    if enabled["use_streaming"] is True:
+        with prof.stage("(3-7) stream surveys"):
+            stats, descriptives = comp.stream_surveys(lang_db=lang_db,
+                                                      enabled=enabled,
+                                                      colls_db=colls_db,
+                                                      surveys=surveys,
+                                                      max_clicker_ratio=80,
+                                                      columns_means_only=colls,
+                                                      fn_all_columns="./output/combined_all_columns.csv",
+                                                      fn_means_only="./output/combined_means_only.csv",
+                                                      fn_participant_descriptives="./output/participant_descriptives.csv",
+                                                      chunksize=chunksize)
+    # otherwise, process whole surveys in memory
+    else:
+        with prof.stage("(3) get clean dataframes") as s:
+            means, reliability = comp.get_clean_dfs(lang_db=lang_db,
+                                                    enabled=enabled,
+                                                    colls_db=colls_db,
+                                                    surveys=surveys,
+                                                    max_clicker_ratio=80,
+                                                    fn_participant_descriptives=f"./output/participant_descriptives.{output_format}")
+            s.record(means)
+        # (4) combine all dataframes into one
+        with prof.stage("(4) combine dataframes") as s:
+            means_both = comp.combine_dfs(means=means,
+                                          enabled=enabled)
+            means_both = s.record(target.rename_index_to_participant(means_both)) # start numbering from 1, rename index to "Participant"
+        # (5) calculate statistics (e.g., age, gender, city size):
+        # (sections are calculated one by one while they are saved in (8))
+        with prof.stage("(5) calculate statistics"):
+            stats = comp.iter_participants_statistics(lang_db=lang_db,
+                                                      means=means,
+                                                      enabled=enabled)
+        # (6) save all columns in combined means
+        with prof.stage("(6) save all columns") as s:
+            fm.save_dataframe(obj=s.record(means_both),
+                              fn=f"./output/combined_all_columns.{output_format}")
+        # (7) save only mean values + "Language" column
+        with prof.stage("(7) save mean values only") as s:
+            means_both = means_both.filter(colls)
+            fm.save_dataframe(obj=s.record(means_both),
+                              fn=f"./output/combined_means_only.{output_format}")
+        # (7a) calculate descriptive statistics and reliability of each condition
+        descriptives = dict()
+        if enabled["get_descriptives"] is True:
+            with prof.stage("(7a) calculate descriptives"):
+                descriptives = comp.get_descriptives(colls_db=colls_db,
+                                                     reliability=reliability,
+                                                     obj=means_both)
+    # (7b) compare languages in each condition: effect sizes, confidence intervals, p-values (corrected for multiple comparisons)
+    if enabled["get_comparisons"] is True:
+        with prof.stage("(7b) compare languages") as s:
+            # streamed means were only saved to csv
+            if enabled["use_streaming"] is True:
+                means_both = fm.load_dataframe(fn="./output/combined_means_only.csv",
+                                               survey_lang="all")
+            descriptives["language_comparisons"] = s.record(comp.compare_languages(colls_db=colls_db,
+                                                                                   obj=means_both,
+                                                                                   enabled=enabled,
+                                                                                   resamples=resamples,
+                                                                                   seed=seed))
+    # (7c) build cube of sums of conditions for every combination of language, gender, city size, uni year and how often english is used
+    # (streamed surveys update it chunk by chunk)
+    if enabled["get_cube"] is True and enabled["use_streaming"] is False:
+        with prof.stage("(7c) build cube") as s:
+            descriptives["cube"] = s.record(comp.get_cube(lang_db=lang_db,
+                                                          colls_db=colls_db,
+                                                          means=means,
+                                                          enabled=enabled))
+    # (8) save participants statistics to a txt file (and other report formats)
+    with prof.stage("(8) save statistics"):
+        header = "[all data below has been calculated after the participants were removed]"
+        # (8a) statistics of each language are also saved separately, section by section along with the main report
+        split = None
+        if enabled["save_language_reports"] is True:
+            split = partial(comp.split_section, languages=list(surveys))
+        fm.save_report(obj=stats,
+                       header=header,
+                       fn="./output/stats.txt",
+                       formats=report_formats,
+                       split=split,
+                       fn_shards="./output/stats_{shard}.txt")
+    # (9) save descriptive statistics, reliability, comparisons and cube of conditions next to combined means
+    with prof.stage("(9) save descriptives"):
+        for name, obj in descriptives.items():
+            fm.save_dataframe(obj=obj,
+                              fn=f"./output/{name}.{output_format}")
+            continue
+    # save measured stages to "./output/profile.json" and "./log.log"
+    prof.save(fn="./output/profile.json")
     logging.info(f'program ended, took {round(perf_counter() - start_time, 3)} seconds')
     return
 
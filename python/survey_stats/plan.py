@@ -0,0 +1,75 @@
+"""describe how a survey is processed as a lazy plan, so that only columns its steps need are read (6)"""
+import logging
+import prof
+
+
+# setup per-module logger
+log = logging.getLogger(__name__).addHandler(logging.NullHandler())
+
+
+class Step:
+    """
+    one step of plan: function(frames, **kwargs) returning dictionary of frames it adds or replaces (e.g., {"means": ...})
+    'needs' lists columns of raw survey the step reads (names from lang_db, e.g., "what_gender")
+    """
+    __slots__ = ("name", "function", "needs", "kwargs")
+
+    def __init__(self, name, function, needs=(), kwargs=None):
+        self.name = name
+        self.function = function
+        self.needs = tuple(needs)
+        self.kwargs = kwargs or dict()
+
+
+class Plan:
+    """
+    lazy plan of steps, e.g., load -> translate -> means -> filter; nothing is read or calculated until execute() is called
+    columns that every step needs are known up front, so that the reader (first step) parses only those (projection pushdown)
+    plans are never changed, then() returns a new plan
+    """
+    __slots__ = ("steps",)
+
+    def __init__(self, steps=()):
+        self.steps = tuple(steps)
+
+    def then(self, name, function, needs=(), **kwargs):
+        """
+        return plan with step added at the end
+        """
+        return Plan(self.steps + (Step(name, function, needs, kwargs),))
+
+    def get_needs(self):
+        """
+        return names (from lang_db) of raw survey columns needed by any step, in order in which they are first needed
+        """
+        return list(dict.fromkeys(name for step in self.steps for name in step.needs))
+
+    def get_columns(self, lang_db, survey_lang):
+        """
+        return column names in csv header (in survey language) needed by any step; everything else can be skipped by the reader
+        """
+        return [lang_db.column(name, survey_lang) for name in self.get_needs()]
+
+    def explain(self, lang_db, survey_lang):
+        """
+        return plan as text: each step and columns it reads
+        """
+        lines = [f"plan ({survey_lang}), steps and columns they read:"]
+        for i, step in enumerate(self.steps, start=1):
+            lines.append(f"\t({i}) {step.name}: {', '.join(step.needs) or '-'}")
+            continue
+        return "\n".join(lines)
+
+    def execute(self, lang_db, survey_lang, frames=None):
+        """
+        run every step in order and return dictionary of frames they produced
+        frames start with "columns": what the reader should parse (see get_columns())
+        """
+        frames = dict(frames or dict())
+        frames.setdefault("columns", self.get_columns(lang_db, survey_lang))
+        logging.info(f"ok: {self.explain(lang_db, survey_lang)}")
+        for step in self.steps:
+            with prof.stage(f"{step.name} ({survey_lang})"):
+                frames.update(step.function(frames, **step.kwargs))
+            continue
+        return frames
@@ -0,0 +1,166 @@
+"""measure time and memory of each stage of the program (10)"""
+from json import dump
+from os import environ
+from time import perf_counter, process_time
+import fm
+import logging
+import sys
+import tracemalloc
+
+try:
+    from resource import getrusage, RUSAGE_SELF
+except ImportError:
+    # not available on windows, peak rss won't be measured
+    getrusage = None
+
+
+# setup per-module logger
+log = logging.getLogger(__name__).addHandler(logging.NullHandler())
+
+# switched on without editing code, e.g., "SURVEY_STATS_PROFILE=1 python main.py"
+# "1" measures time and peak rss, "memory" also traces python allocations (slower)
+MODE = environ.get("SURVEY_STATS_PROFILE", "").lower()
+ENABLED = MODE not in ("", "0", "false", "no")
+TRACE_MEMORY = MODE == "memory"
+
+# measured stages, in order in which they started
+STAGES = list()
+# stages that have started but not ended yet
+_running = list()
+
+
+def get_peak_rss():
+    """
+    return peak resident memory of the process in megabytes, or None if it can't be measured
+    """
+    if getrusage is None:
+        return None
+    # bytes on macos, kilobytes elsewhere
+    peak = getrusage(RUSAGE_SELF).ru_maxrss
+    return round(peak / 1024 / 1024 if sys.platform == "darwin" else peak / 1024, 2)
+
+
+class Stage:
+    """
+    measure wall time, cpu time, peak rss and (optionally) traced memory of code within 'with' block
+    """
+    __slots__ = ("name", "position", "rows", "columns", "start_wall", "start_cpu", "start_traced", "peak_traced")
+
+    def __init__(self, name):
+        self.name = name
+        self.rows = None
+        self.columns = None
+
+    def __enter__(self):
+        if TRACE_MEMORY:
+            current, peak = tracemalloc.get_traced_memory()
+            # parent stage keeps its peak before it's reset for this stage
+            if _running:
+                _running[-1].peak_traced = max(_running[-1].peak_traced, peak)
+            tracemalloc.reset_peak()
+            self.start_traced = current
+            self.peak_traced = current
+        _running.append(self)
+        # keep place in the list, so that stages are listed in order in which they started
+        self.position = len(STAGES)
+        STAGES.append(None)
+        self.start_wall = perf_counter()
+        self.start_cpu = process_time()
+        return self
+
+    def __exit__(self, *args):
+        wall = perf_counter() - self.start_wall
+        cpu = process_time() - self.start_cpu
+        _running.pop()
+        r = {"stage": self.name,
+             "depth": len(_running),
+             "wall_seconds": round(wall, 6),
+             "cpu_seconds": round(cpu, 6),
+             "peak_rss_mb": get_peak_rss(),
+             "rows": self.rows,
+             "columns": self.columns}
+        if TRACE_MEMORY:
+            current, peak = tracemalloc.get_traced_memory()
+            self.peak_traced = max(self.peak_traced, peak)
+            r["traced_delta_mb"] = round((current - self.start_traced) / 1024 / 1024, 2)
+            r["traced_peak_mb"] = round((self.peak_traced - self.start_traced) / 1024 / 1024, 2)
+            # parent stage's peak includes this stage's peak
+            if _running:
+                _running[-1].peak_traced = max(_running[-1].peak_traced, self.peak_traced)
+        STAGES[self.position] = r
+        return False
+
+    def record(self, obj):
+        """
+        remember size of dataframe (or dictionary of dataframes) produced by stage
+        """
+        frames = list(obj.values()) if isinstance(obj, dict) else [obj]
+        self.rows = sum(frame.shape[0] for frame in frames)
+        self.columns = max((frame.shape[1] for frame in frames), default=None)
+        return obj
+
+
+class NullStage:
+    """
+    does nothing, used when profiling is off
+    """
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        return False
+
+    def record(self, obj):
+        return obj
+
+
+NULL_STAGE = NullStage()
+
+
+def stage(name):
+    """
+    return context manager that measures stage, e.g., "with prof.stage('(1) load json') as s:"
+    costs a single function call when profiling is off
+    """
+    if ENABLED:
+        return Stage(name)
+    return NULL_STAGE
+
+
+def start():
+    """
+    start profiling (if enabled), forget previous stages
+    """
+    if not ENABLED:
+        return
+    STAGES.clear()
+    if TRACE_MEMORY:
+        tracemalloc.start()
+    logging.info(f"ok: profiling stages (mode: {MODE})")
+    return
+
+
+def save(fn="./output/profile.json"):
+    """
+    save measured stages to json file and log them as table (if enabled)
+    """
+    if not ENABLED:
+        return
+    if TRACE_MEMORY:
+        tracemalloc.stop()
+    # check if directory exists, create if doesn't
+    fm.create_dir_if_doesnt_exist(fn)
+    with open(fn, "w", encoding="utf-8") as f:
+        dump(STAGES, f, indent=4)
+    # log as table, nested stages are indented
+    lines = [f"{'stage':<60} {'wall [s]':>10} {'cpu [s]':>10} {'rss [MB]':>10} {'traced [MB]':>12} {'rows':>10} {'cols':>6}"]
+    for r in STAGES:
+        name = "  " * r["depth"] + r["stage"]
+        traced = r.get("traced_peak_mb", "")
+        lines.append(f"{name:<60} {r['wall_seconds']:>10.4f} {r['cpu_seconds']:>10.4f} {str(r['peak_rss_mb']):>10} {str(traced):>12} {str(r['rows'] or ''):>10} {str(r['columns'] or ''):>6}")
+        continue
+    logging.info("profile of stages:\n" + "\n".join(lines))
+    logging.info(f"ok: saved profile: {fn}")
+    return
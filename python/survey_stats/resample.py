@@ -0,0 +1,230 @@
+"""compare groups in every condition at once with permutation tests and bootstrap (7)"""
+from concurrent.futures import ProcessPoolExecutor
+from hashlib import sha256
+from itertools import combinations, repeat
+import logging
+import numpy as np
+import pandas as pd
+
+
+# setup per-module logger
+log = logging.getLogger(__name__).addHandler(logging.NullHandler())
+
+
+def get_group_sums(weights, values, valid, squared=True):
+    """
+    return sums, squared sums (None if 'squared' is False) and counts of values in each condition for each row of weights (resample) at once
+    'values' has missing values replaced with 0, 'valid' is None if nothing is missing
+    """
+    sums = weights @ values
+    squares = weights @ np.square(values) if squared is True else None
+    if valid is None:
+        counts = np.broadcast_to(weights.sum(axis=1)[:, None], sums.shape)
+    else:
+        counts = weights @ valid
+    return sums, squares, counts
+
+
+def get_effect_sizes(sums_a, squares_a, counts_a, sums_b, squares_b, counts_b):
+    """
+    return mean difference (a - b), cohen's d (pooled stdev) and hedges' g (d corrected for small samples) from sums
+    works for a single sample (1d arrays) as well as for many resamples (2d arrays)
+    """
+    with np.errstate(divide="ignore", invalid="ignore"):
+        mean_a = sums_a / counts_a
+        mean_b = sums_b / counts_b
+        # pooled variance: squared deviations of both groups divided by degrees of freedom
+        deviations = (squares_a - sums_a * mean_a) + (squares_b - sums_b * mean_b)
+        freedom = counts_a + counts_b - 2
+        difference = mean_a - mean_b
+        d = difference / np.sqrt(np.maximum(deviations, 0) / freedom)
+        g = d * (1 - 3 / (4 * freedom - 1))
+    return difference, d, g
+
+
+def split_values(values_a, values_b):
+    """
+    return both groups stacked (missing values replaced with 0), boolean mask of values that aren't missing (None if nothing is missing)
+    """
+    pooled = np.concatenate([values_a, values_b])
+    valid = ~np.isnan(pooled)
+    if valid.all():
+        return pooled, None
+    return np.where(valid, pooled, 0), valid.astype(np.float64)
+
+
+def get_batch_size(participants, batch_size=1000, memory_budget=1 << 28):
+    """
+    return how many resamples are generated at once, so that a batch takes at most 'memory_budget' bytes (but no more than 'batch_size' resamples)
+    each resample holds per participant: shuffled int32 order (and its copy) and float64 membership, or int32 index, int64 count and float64 weight
+    of bootstrap (see run_batches())
+    """
+    return max(1, min(batch_size, memory_budget // (participants * 20)))
+
+
+def run_batches(values_a, values_b, batches):
+    """
+    return number of permutations with at least as large absolute mean difference as observed (per condition),
+    bootstrapped mean differences and hedges' g (rows: resamples, columns: conditions)
+    'batches' is a list of (seed, resamples); each batch is generated from its own seed, so results don't depend on how batches are split between processes
+    """
+    pooled, valid = split_values(values_a, values_b)
+    n_a = values_a.shape[0]
+    groups = [(pooled[:n_a], None if valid is None else valid[:n_a]),
+              (pooled[n_a:], None if valid is None else valid[n_a:])]
+    # (1) observed mean difference, totals of both groups (group b is total - group a in each permutation)
+    total_sums, _, total_counts = get_group_sums(np.ones((1, pooled.shape[0])), pooled, valid, squared=False)
+    sums_a, _, counts_a = get_group_sums(np.ones((1, n_a)), *groups[0], squared=False)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        observed = np.abs(sums_a / counts_a - (total_sums - sums_a) / (total_counts - counts_a))
+    exceeded = np.zeros(pooled.shape[1], dtype=np.int64)
+    differences = list()
+    effects = list()
+    for seed, resamples in batches:
+        rng = np.random.default_rng(seed)
+        # (2) permutation test: each row is a shuffled order of participants (int32), the first n_a of them are group a;
+        # turned into group membership (1 = group a), so that all conditions are evaluated with one matrix product
+        order = rng.permuted(np.broadcast_to(np.arange(pooled.shape[0], dtype=np.int32), (resamples, pooled.shape[0])), axis=1)
+        membership = np.zeros(order.shape)
+        np.put_along_axis(membership, order[:, :n_a], 1, axis=1)
+        del order
+        sums_a, _, counts_a = get_group_sums(membership, pooled, valid, squared=False)
+        del membership
+        with np.errstate(divide="ignore", invalid="ignore"):
+            difference = sums_a / counts_a - (total_sums - sums_a) / (total_counts - counts_a)
+        # small tolerance, so that permutations with the same difference as observed aren't lost to rounding
+        exceeded += (np.abs(difference) >= observed - 1e-12).sum(axis=0)
+        # (3) bootstrap: each row of index matrix lists participants drawn (with replacement) from a group,
+        # turned into how many times each participant was drawn, so that all conditions are evaluated with one matrix product
+        sums = list()
+        for values, group_valid in groups:
+            n = values.shape[0]
+            indices = rng.integers(0, n, (resamples, n), dtype=np.int32)
+            indices += (np.arange(resamples, dtype=np.int32) * n)[:, None]
+            weights = np.bincount(indices.ravel(), minlength=resamples * n).reshape(resamples, n).astype(np.float64)
+            del indices
+            sums.append(get_group_sums(weights, values, group_valid))
+            continue
+        difference, _, g = get_effect_sizes(*sums[0], *sums[1])
+        differences.append(difference)
+        effects.append(g)
+        continue
+    return exceeded, np.concatenate(differences), np.concatenate(effects)
+
+
+def correct_p_values(p_values, method):
+    """
+    return p-values corrected for multiple comparisons: "holm" (family-wise error) or "fdr" (benjamini-hochberg false discovery rate)
+    missing p-values are ignored
+    """
+    p_values = np.asarray(p_values, dtype=np.float64)
+    r = np.full(p_values.shape, np.nan)
+    present = np.flatnonzero(~np.isnan(p_values))
+    m = present.size
+    if m == 0:
+        return r
+    order = present[np.argsort(p_values[present], kind="stable")]
+    ranked = p_values[order]
+    if method == "holm":
+        adjusted = np.maximum.accumulate(ranked * (m - np.arange(m)))
+    elif method == "fdr":
+        adjusted = np.minimum.accumulate((ranked * m / np.arange(1, m + 1))[::-1])[::-1]
+    else:
+        raise ValueError(f"unknown correction of p-values: {method}")
+    r[order] = np.minimum(adjusted, 1)
+    return r
+
+
+def compare_groups(values_a, values_b, resamples=10000, seed=0, cores=1, batch_size=1000, confidence=0.95, memory_budget=1 << 28):
+    """
+    return dictionary of statistic : array (one value per condition) comparing participants' means of two groups in every condition:
+    mean difference (a - b) and its bootstrap confidence interval, cohen's d, hedges' g and its bootstrap confidence interval,
+    two-sided permutation p-value of mean difference
+    the same seed (number or numpy seed sequence) always gives the same results, regardless of 'cores' (number of processes)
+    each process keeps at most about 'memory_budget' bytes of resamples in memory (see get_batch_size())
+    """
+    # (1) split resamples into batches with their own seeds (bounded memory, the same random numbers whichever process runs them)
+    batch_size = get_batch_size(values_a.shape[0] + values_b.shape[0], batch_size=batch_size, memory_budget=memory_budget)
+    sizes = [min(batch_size, resamples - start) for start in range(0, resamples, batch_size)]
+    seed = seed if isinstance(seed, np.random.SeedSequence) else np.random.SeedSequence(seed)
+    batches = list(zip(seed.spawn(len(sizes)), sizes))
+    # (2) run batches, optionally spread over processes
+    if cores > 1 and len(batches) > 1:
+        # each process gets consecutive batches, so that resamples stay in order of batches
+        jobs = [[batches[i] for i in job] for job in np.array_split(np.arange(len(batches)), min(cores, len(batches)))]
+        with ProcessPoolExecutor(max_workers=len(jobs)) as executor:
+            results = list(executor.map(run_batches, repeat(values_a), repeat(values_b), jobs))
+        exceeded = sum(result[0] for result in results)
+        differences = np.concatenate([result[1] for result in results])
+        effects = np.concatenate([result[2] for result in results])
+    else:
+        exceeded, differences, effects = run_batches(values_a, values_b, batches)
+    # (3) observed statistics
+    pooled, valid = split_values(values_a, values_b)
+    n_a = values_a.shape[0]
+    sums_a = get_group_sums(np.ones((1, n_a)), pooled[:n_a], None if valid is None else valid[:n_a])
+    sums_b = get_group_sums(np.ones((1, pooled.shape[0] - n_a)), pooled[n_a:], None if valid is None else valid[n_a:])
+    difference, d, g = (x[0] for x in get_effect_sizes(*sums_a, *sums_b))
+    # (4) percentile confidence intervals and permutation p-value (observed arrangement counts as one of the permutations)
+    tails = [(1 - confidence) / 2 * 100, (1 + confidence) / 2 * 100]
+    with np.errstate(invalid="ignore"):
+        p_value = np.where(np.isnan(difference), np.nan, (exceeded + 1) / (resamples + 1))
+    return {"participants_a": sums_a[2][0].astype(np.int64),
+            "participants_b": sums_b[2][0].astype(np.int64),
+            "mean_a": sums_a[0][0] / sums_a[2][0],
+            "mean_b": sums_b[0][0] / sums_b[2][0],
+            "mean_difference": difference,
+            "difference_ci_low": np.nanpercentile(differences, tails[0], axis=0),
+            "difference_ci_high": np.nanpercentile(differences, tails[1], axis=0),
+            "cohens_d": d,
+            "hedges_g": g,
+            "g_ci_low": np.nanpercentile(effects, tails[0], axis=0),
+            "g_ci_high": np.nanpercentile(effects, tails[1], axis=0),
+            "p_value": p_value}
+
+
+def get_pair_seed(seed, group_a, group_b):
+    """
+    return seed sequence of pair of groups, derived from 'seed' and names of both groups (not from position of pair),
+    so that the same pair always gets the same random numbers, whichever other groups are compared
+    names are hashed with sha256, because python's hash() of strings changes between runs
+    """
+    key = sha256(f"{group_a}\0{group_b}".encode("utf-8")).digest()
+    return np.random.SeedSequence(seed, spawn_key=tuple(np.frombuffer(key, dtype=np.uint32).tolist()))
+
+
+def compare_all(obj, conditions, group_column="Language", resamples=10000, seed=0, cores=1, batch_size=1000, confidence=0.95, decimal_points=4,
+                memory_budget=1 << 28):
+    """
+    return dataframe comparing every pair of groups (e.g., "en" vs "pl") in every condition with permutation tests and bootstrap confidence intervals,
+    with p-values corrected for multiple comparisons (holm and benjamini-hochberg) across all conditions and pairs
+    'obj' has one row per participant: group column and participants' means of conditions
+    """
+    values = obj[conditions].to_numpy(dtype=np.float64)
+    labels = obj[group_column].to_numpy()
+    groups = list(pd.unique(labels))
+    pairs = list(combinations(groups, 2))
+    frames = list()
+    # each pair of groups gets its own seed from names of its groups, so adding a group doesn't change results of other pairs
+    for group_a, group_b in pairs:
+        r = compare_groups(values_a=values[labels == group_a],
+                           values_b=values[labels == group_b],
+                           resamples=resamples,
+                           seed=get_pair_seed(seed, group_a, group_b),
+                           cores=cores,
+                           batch_size=batch_size,
+                           confidence=confidence,
+                           memory_budget=memory_budget)
+        r = pd.DataFrame(r, index=pd.Index(conditions, name="Condition"))
+        r.insert(0, "group_a", group_a)
+        r.insert(1, "group_b", group_b)
+        frames.append(r)
+        logging.info(f"ok: compared {group_a} and {group_b} in {len(conditions)} conditions ({resamples} permutations and bootstrap resamples)")
+        continue
+    if not frames:
+        logging.warning(f"can't compare groups, only one group is available ({groups})")
+        return pd.DataFrame()
+    r = pd.concat(frames, axis=0)
+    r["p_holm"] = correct_p_values(r["p_value"], method="holm")
+    r["p_fdr"] = correct_p_values(r["p_value"], method="fdr")
+    return r.round(decimal_points)
@@ -0,0 +1,434 @@
+"""keep processed surveys in memory and answer requests over localhost http or a unix socket (8)"""
+from argparse import ArgumentParser
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from json import dumps, loads
+from os import remove, stat
+from os.path import exists
+from signal import SIGTERM, signal
+from socketserver import UnixStreamServer
+from time import perf_counter
+from urllib.parse import parse_qs, urlparse
+import comp
+import fm
+import lang
+import logging
+import pandas as pd
+import sys
+import target
+
+
+# setup per-module logger
+log = logging.getLogger(__name__).addHandler(logging.NullHandler())
+
+# toggles used by every request (the same meaning as in main.py), statistics can be switched off per request
+ENABLED = {"use_csv_from_input":True,
+           "use_incremental":False,
+           "use_parallel_processing":False,
+           "display_dataframes":False,
+           "get_participant_size":True,
+           "get_began_english":True,
+           "get_age":True,
+           "get_gender":True,
+           "get_city":True,
+           "get_uni_year":True}
+
+
+def get_signature(fn):
+    """
+    return (modification time, size) of file, or None if it doesn't exist; changes whenever file is saved
+    """
+    try:
+        r = stat(fn)
+    except FileNotFoundError:
+        return None
+    return r.st_mtime_ns, r.st_size
+
+
+class State:
+    """
+    language database, custom column names and processed surveys kept in memory between requests
+    files are checked before each request and only what depends on changed files is loaded or processed again
+    """
+    __slots__ = ("fn_lang_db", "fn_columns", "surveys", "max_processed", "signatures", "lang_db", "colls_db", "processed", "responses")
+
+    def __init__(self, fn_lang_db, fn_columns, surveys, max_processed=8):
+        self.fn_lang_db = fn_lang_db
+        self.fn_columns = fn_columns
+        self.surveys = surveys
+        # processed surveys kept for this many (language, max_clicker_ratio), least recently used are dropped
+        self.max_processed = max_processed
+        self.signatures = dict()
+        self.lang_db = None
+        self.colls_db = None
+        # (survey language, max_clicker_ratio) : (means, report, reliability)
+        self.processed = dict()
+        # (route, parameters) : response, dropped whenever any file changes
+        self.responses = dict()
+
+    def refresh(self):
+        """
+        reload language database and custom column names if they changed, forget processed surveys whose csv changed
+        return list of files that changed since the last request
+        """
+        # signatures are stored only after files were loaded, so a file that failed to load is loaded again on the next request
+        signatures = dict()
+        for fn in [self.fn_lang_db, self.fn_columns] + [survey["fn_input"] for survey in self.surveys.values()]:
+            signature = get_signature(fn)
+            if self.signatures.get(fn, False) != signature:
+                signatures[fn] = signature
+            continue
+        changed = list(signatures)
+        if not changed:
+            return changed
+        logging.info(f"ok: files changed since the last request: {changed}")
+        self.responses.clear()
+        # everything is processed with language database and custom column names, so all surveys are processed again
+        if self.fn_lang_db in changed or self.fn_columns in changed or self.lang_db is None:
+            lang_db = fm.load_lang_db(fn=self.fn_lang_db)
+            colls_db = fm.load_columns(fn=self.fn_columns)
+            self.lang_db, self.colls_db = lang_db, colls_db
+            self.processed.clear()
+            self.signatures.update(signatures)
+            return changed
+        for survey_lang, survey in self.surveys.items():
+            if survey["fn_input"] in changed:
+                self.processed = {key: value for key, value in self.processed.items() if key[0] != survey_lang}
+            continue
+        self.signatures.update(signatures)
+        return changed
+
+    def get_processed(self, max_clicker_ratio, languages=None):
+        """
+        return dictionary of survey language : (means, report, reliability), processing only surveys that aren't in memory yet
+        """
+        r = dict()
+        for survey_lang in languages or self.surveys:
+            if survey_lang not in self.surveys:
+                raise ValueError(f"unknown survey language: {survey_lang} (available: {list(self.surveys)})")
+            key = (survey_lang, max_clicker_ratio)
+            if key in self.processed:
+                # move to the end, so that least recently used is dropped first
+                r[survey_lang] = self.processed[key] = self.processed.pop(key)
+                continue
+            r[survey_lang] = comp.process_language(lang_db=self.lang_db,
+                                                   colls_db=self.colls_db,
+                                                   survey_lang=survey_lang,
+                                                   fn_survey_input=self.surveys[survey_lang]["fn_input"],
+                                                   d_filter_conditions=comp.get_filter_conditions(self.lang_db),
+                                                   max_clicker_ratio=max_clicker_ratio,
+                                                   typed=True)
+            self.processed[key] = r[survey_lang]
+            while len(self.processed) > self.max_processed:
+                del self.processed[next(iter(self.processed))]
+                continue
+            continue
+        return r
+
+    def get_means(self, max_clicker_ratio, languages=None):
+        """
+        return dictionary of survey language : processed survey (the same columns as processed csvs)
+        """
+        return {survey_lang: target.split_participant_descriptives(processed[0])[0]
+                for survey_lang, processed in self.get_processed(max_clicker_ratio, languages).items()}
+
+
+def get_parameter(params, name, default, kind=str):
+    """
+    return parameter from query string converted to 'kind' (str, int, float, bool or list), or default if it's not given
+    """
+    if name not in params:
+        return default
+    value = params[name][-1]
+    try:
+        if kind is bool:
+            if value.lower() not in ("1", "true", "yes", "0", "false", "no"):
+                raise ValueError(value)
+            return value.lower() in ("1", "true", "yes")
+        if kind is list:
+            return [x for x in value.split(",") if x]
+        return kind(value)
+    except ValueError:
+        raise ValueError(f"parameter '{name}' must be {kind.__name__}, not: {value}")
+
+
+def get_max_clicker_ratio(params):
+    """
+    return max_clicker_ratio of request (80 by default, the same as main.py), e.g., "?max_clicker_ratio=70"
+    whole numbers are kept as int, so that "70" and "70.0" share processed surveys and look the same in reports
+    """
+    r = get_parameter(params, "max_clicker_ratio", 80, float)
+    return int(r) if float(r).is_integer() else r
+
+
+def get_enabled(params):
+    """
+    return toggles for this request, e.g., "?get_age=false" skips age statistics
+    """
+    r = dict(ENABLED)
+    for toggle in r:
+        if toggle.startswith("get_"):
+            r[toggle] = get_parameter(params, toggle, r[toggle], bool)
+        continue
+    return r
+
+
+def get_combined(state, params):
+    """
+    return processed surveys of chosen languages put one below another, either all columns or "Language" + means only
+    """
+    means = state.get_means(get_max_clicker_ratio(params), get_parameter(params, "languages", None, list))
+    r = target.rename_index_to_participant(comp.combine_dfs(means=means, enabled=ENABLED))
+    if get_parameter(params, "columns", "all") == "means_only":
+        r = r.filter(["Language"] + target.build_condition_matrix(tuple(state.colls_db))[0])
+    return r
+
+
+def get_exclusions(state, params):
+    """
+    return number of participants removed by each rule in each language
+    """
+    processed = state.get_processed(get_max_clicker_ratio(params), get_parameter(params, "languages", None, list))
+    return {f"{survey_lang}: removed participants": report for survey_lang, (_, report, _) in processed.items()}
+
+
+def get_statistics(state, params):
+    """
+    return statistics of participants (the same as stats.txt)
+    """
+    means = state.get_means(get_max_clicker_ratio(params), get_parameter(params, "languages", None, list))
+    return comp.get_participants_statistics(lang_db=state.lang_db,
+                                            means=means,
+                                            enabled=get_enabled(params))
+
+
+def get_descriptives(state, params):
+    """
+    return descriptive statistics and reliability of conditions (the same as condition_descriptives and item_reliability)
+    """
+    processed = state.get_processed(get_max_clicker_ratio(params), get_parameter(params, "languages", None, list))
+    means = comp.combine_dfs(means={survey_lang: means for survey_lang, (means, _, _) in processed.items()}, enabled=ENABLED)
+    return comp.get_descriptives(colls_db=state.colls_db,
+                                 reliability={survey_lang: reliability for survey_lang, (_, _, reliability) in processed.items()},
+                                 obj=means)
+
+
+def get_comparisons(state, params):
+    """
+    return comparison of languages in each condition (the same as language_comparisons)
+    """
+    means = state.get_means(get_max_clicker_ratio(params), get_parameter(params, "languages", None, list))
+    return comp.compare_languages(colls_db=state.colls_db,
+                                  obj=comp.combine_dfs(means=means, enabled=ENABLED),
+                                  enabled=ENABLED,
+                                  resamples=get_parameter(params, "resamples", 10000, int),
+                                  seed=get_parameter(params, "seed", 0, int),
+                                  confidence=get_parameter(params, "confidence", 0.95, float))
+
+
+def get_cube(state, params):
+    """
+    return statistic of conditions for subgroups answered from cube, e.g., "?by=what_gender&Language=pl&statistic=stdev"
+    any dimension of cube can be used as a filter (comma-separated values)
+    """
+    means = state.get_means(get_max_clicker_ratio(params), get_parameter(params, "languages", None, list))
+    cube = comp.get_cube(lang_db=state.lang_db,
+                         colls_db=state.colls_db,
+                         means=means,
+                         enabled=ENABLED)
+    dimensions = comp.get_cube_dimensions(state.lang_db)
+    return target.query_cube(cube=cube,
+                             conditions=target.build_condition_matrix(tuple(state.colls_db))[0],
+                             by=get_parameter(params, "by", list(), list),
+                             where={name: get_parameter(params, name, None, list) for name in dimensions if name in params},
+                             statistic=get_parameter(params, "statistic", "mean"))
+
+
+def get_status(state, params):
+    """
+    return files being watched and what is kept in memory
+    """
+    return {"files": {fn: signature is not None for fn, signature in state.signatures.items()},
+            "languages": list(state.surveys),
+            "processed": [{"language": survey_lang, "max_clicker_ratio": max_clicker_ratio, "participants": processed[0].shape[0]}
+                          for (survey_lang, max_clicker_ratio), processed in state.processed.items()],
+            "responses": len(state.responses)}
+
+
+def reload(state, params):
+    """
+    forget everything kept in memory, load and process files again on the next request
+    """
+    state.signatures.clear()
+    state.processed.clear()
+    return {"reloaded": state.refresh()}
+
+
+# path : (function returning response, whether response can be reused until files change)
+ROUTES = {"/means": (get_combined, True),
+          "/exclusions": (get_exclusions, True),
+          "/statistics": (get_statistics, True),
+          "/descriptives": (get_descriptives, True),
+          "/comparisons": (get_comparisons, True),
+          "/cube": (get_cube, True),
+          "/status": (get_status, False),
+          "/reload": (reload, False)}
+
+
+def to_json(obj):
+    """
+    return response (dataframe, dictionary of dataframes, numbers) as something json can save, e.g., dataframe as {"columns", "index", "data"}
+    """
+    if isinstance(obj, pd.DataFrame):
+        return loads(obj.to_json(orient="split"))
+    if isinstance(obj, dict):
+        return {str(key): to_json(value) for key, value in obj.items()}
+    if isinstance(obj, (list, tuple)):
+        return [to_json(value) for value in obj]
+    if hasattr(obj, "item"):
+        return obj.item()
+    return obj
+
+
+def encode(obj, fmt):
+    """
+    return (content type, bytes) of response in format "json" or "csv" (csv for dataframes only)
+    """
+    if fmt == "csv":
+        if not isinstance(obj, pd.DataFrame):
+            raise ValueError("format 'csv' is only available for dataframes (e.g., /means)")
+        return "text/csv; charset=utf-8", obj.to_csv().encode("utf-8")
+    if fmt != "json":
+        raise ValueError(f"unknown format: {fmt} (available: json, csv)")
+    return "application/json; charset=utf-8", dumps(to_json(obj), ensure_ascii=False).encode("utf-8")
+
+
+class Handler(BaseHTTPRequestHandler):
+    """
+    answer get requests, e.g., "/statistics?max_clicker_ratio=70"; requests are handled one at a time
+    """
+    state = None
+
+    def do_GET(self):
+        start_time = perf_counter()
+        url = urlparse(self.path)
+        params = parse_qs(url.query)
+        if url.path not in ROUTES:
+            self.reply(404, {"error": f"unknown path: {url.path}", "paths": list(ROUTES)})
+            return
+        function, reusable = ROUTES[url.path]
+        try:
+            self.state.refresh()
+            # parameters in any order give the same response
+            key = (url.path, tuple(sorted((name, tuple(values)) for name, values in params.items())))
+            if reusable is True and key in self.state.responses:
+                content_type, body = self.state.responses[key]
+            else:
+                content_type, body = encode(function(self.state, params), get_parameter(params, "format", "json"))
+                if reusable is True:
+                    self.state.responses[key] = (content_type, body)
+        except (ValueError, KeyError) as e:
+            self.reply(400, {"error": str(e.args[0]) if e.args else str(e)})
+            return
+        except SystemExit:
+            # loading functions quit the program when a file can't be loaded; the server keeps running instead
+            self.reply(500, {"error": "failed to load input files, see log"})
+            return
+        except Exception as e:
+            # any other failure (e.g., a filter pandas can't apply) is answered too, instead of closing the connection
+            logging.exception(f"failed to answer {self.path}; reason: {e}")
+            self.reply(500, {"error": f"failed to answer request: {e!r}"})
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+        logging.info(f"ok: answered {self.path} ({len(body)} bytes, {round(perf_counter() - start_time, 3)} seconds)")
+        return
+
+    def reply(self, code, obj):
+        body = dumps(obj).encode("utf-8")
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+        logging.warning(f"{code}: {self.path}: {obj['error']}")
+        return
+
+    def log_message(self, format, *args):
+        logging.debug(f"{self.address_string()} - {format % args}")
+        return
+
+
+class UnixHTTPServer(UnixStreamServer):
+    """
+    http server listening on a unix socket (e.g., "curl --unix-socket ./output/survey_stats.sock http://localhost/statistics")
+    """
+
+    def get_request(self):
+        # clients of unix socket have no address, http handler expects (host, port)
+        request, _ = super().get_request()
+        return request, ("unix socket", 0)
+
+
+def create_server(state, host="127.0.0.1", port=8050, socket=None):
+    """
+    return server listening on localhost port, or on unix socket (path) if given
+    """
+    handler = type("StateHandler", (Handler,), {"state": state})
+    if socket is not None:
+        # socket file is left behind if the server didn't stop cleanly
+        if exists(socket):
+            remove(socket)
+        fm.create_dir_if_doesnt_exist(socket)
+        logging.info(f"ok: listening on unix socket: {socket}")
+        return UnixHTTPServer(socket, handler)
+    logging.info(f"ok: listening on http://{host}:{port}")
+    return HTTPServer((host, port), handler)
+
+
+def stop(*args):
+    """
+    stop server the same way as ctrl+c, used when it's terminated (e.g., by a service manager)
+    """
+    raise KeyboardInterrupt
+
+
+def main():
+    """
+    keep language database, custom column names and processed surveys in memory, answer requests until stopped (ctrl+c)
+    """
+    parser = ArgumentParser(description="serve survey_stats results from memory")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8050)
+    parser.add_argument("--socket", default=None, help="listen on unix socket (path) instead of localhost port")
+    parser.add_argument("--lang-db", default="./input/lang_db.json")
+    parser.add_argument("--columns", default="./input/column_names.txt")
+    args = parser.parse_args()
+    logging.basicConfig(datefmt="%G-%m-%d %T",
+                        format="%(asctime)s [%(levelname)s] %(module)s.py : %(funcName)s() - %(message)s",
+                        encoding="utf-8",
+                        handlers=[logging.StreamHandler(sys.stdout)],
+                        level=logging.INFO)
+    # the same surveys as main.py (language must be in lang.LANGUAGE_NAMES)
+    surveys = {"en": {"fn_input": "./input/Survey research EN.csv"},
+               "pl": {"fn_input": "./input/Survey research PL.csv"}}
+    state = State(fn_lang_db=args.lang_db, fn_columns=args.columns, surveys=surveys)
+    state.refresh()
+    logging.info(f"ok: serving {[lang.LANGUAGE_NAMES[survey_lang] for survey_lang in surveys]} surveys, paths: {list(ROUTES)}")
+    server = create_server(state, host=args.host, port=args.port, socket=args.socket)
+    signal(SIGTERM, stop)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        logging.info("ok: server stopped")
+    finally:
+        server.server_close()
+        if args.socket is not None and exists(args.socket):
+            remove(args.socket)
+    return
+
+
+if __name__ == "__main__":
+    main()
@@ -1,11 +1,19 @@
 """calculate means and other statistics (3)"""
-from collections import Counter
+from functools import lru_cache
 import lang
 import logging
+import numpy as np
+import pandas as pd
+import warnings
 
 # setup per-module logger
 log = logging.getLogger(__name__).addHandler(logging.NullHandler())
 
+# columns (names from lang_db) kept next to means, e.g., for removing participants and statistics
+MEANS_COLUMNS = ("is_l1", "is_l2", "how_often", "age_begin_eng", "birth_year", "what_gender", "how_big_city", "which_uni_year")
+# columns of mean, stdev, min, max and number of ratings of each participant (see get_participant_descriptives())
+PARTICIPANT_DESCRIPTIVES = ("rating_mean", "rating_stdev", "rating_min", "rating_max", "rating_count")
+
 
 def rename_columns(obj, list_columns, survey_lang):
     """
@@ -24,26 +32,74 @@ def rename_columns(obj, list_columns, survey_lang):
     return obj
 
 
-def get_mean_per_language(obj, colname, colls_db, survey_lang, decimal_points=4):
+@lru_cache(maxsize=8)
+def build_condition_matrix(colls_db):
+    """
+    return sorted condition names and sparse indicator matrix of rating columns -> conditions, stored as:
+        order - positions of rating columns, grouped by condition
+        starts - position in 'order' where each condition begins
+    means per condition are grouped by pandas (see get_mean_per_language()); the names are used to order conditions
+    everywhere else, and the matrix only groups items of each condition for reliability (see accumulate_reliability())
+    'colls_db' must be a tuple, so that the matrix is built only once
+    """
+    conditions, codes = np.unique(np.array(colls_db, dtype=object), return_inverse=True)
+    order = np.argsort(codes, kind="stable")
+    starts = np.searchsorted(codes[order], np.arange(len(conditions)))
+    logging.info(f"ok: built condition matrix: {len(colls_db)} columns -> {len(conditions)} conditions")
+    return conditions.tolist(), order, starts
+
+
+def get_mean_per_language(obj, colname, colls_db, survey_lang, decimal_points=4, positions=None):
     """
     return dataframe which contains mean per condition only
     """
     # (1) get dataframe containing ratings columns only
-    obj = obj.filter(like=colname)
+    obj = get_ratings(obj, colname, positions=positions)
     # (2) rename dataframe to custom column names
     obj = rename_columns(obj, colls_db, survey_lang=survey_lang)
-    # (3) group by identical category names
-    obj = obj.groupby(level=0, axis=1)
-    # (4) calculate means per condition
-    obj = obj.mean().round(decimal_points)
-    # obj_means[f"{survey_lang}_avg_mean"] = obj_means.mean(axis=1).round(decimal_points)
-    # obj_means[f"{survey_lang}_stdev"] = obj_means.std(axis=1).round(decimal_points)
-    # obj_means[f"{survey_lang}_min"] = obj.min(axis=1)
-    # obj_means[f"{survey_lang}_max"] = obj.max(axis=1)
+    # (3) group by identical condition names and calculate means per condition (missing answers are not counted,
+    # NaN if participant didn't answer any question in condition); ratings are grouped as one float block,
+    # because nullable integers (e.g., typed csv with missing answers) are much slower to group
+    obj = pd.DataFrame(get_answer_matrix(obj), index=obj.index, columns=obj.columns)
+    obj = obj.T.groupby(level=0).mean().T.round(decimal_points)
     logging.info(f"ok: calculated mean per condition ({survey_lang}): (columns: {obj.shape[1]}, rows: {obj.shape[0]})")
     return obj
 
 
+def get_participant_descriptives(answers, index, decimal_points=4):
+    """
+    return dataframe of mean, stdev, min, max and number of ratings of every participant (row) at once
+    missing ratings are not counted; 'answers' is a 2d array from get_answer_matrix()
+    """
+    missing = np.isnan(answers)
+    if missing.any():
+        count = answers.shape[1] - np.count_nonzero(missing, axis=1)
+        with np.errstate(divide="ignore", invalid="ignore"), warnings.catch_warnings():
+            # a participant without ratings has no mean, stdev, min or max
+            warnings.simplefilter("ignore", category=RuntimeWarning)
+            mean = np.nanmean(answers, axis=1)
+            stdev = np.nanstd(answers, axis=1, ddof=1)
+            minimum = np.nanmin(answers, axis=1)
+            maximum = np.nanmax(answers, axis=1)
+    else:
+        count = np.full(answers.shape[0], answers.shape[1])
+        with np.errstate(divide="ignore", invalid="ignore"):
+            mean = answers.mean(axis=1)
+            stdev = answers.std(axis=1, ddof=1)
+        minimum = answers.min(axis=1, initial=np.inf) if answers.shape[1] else np.full(answers.shape[0], np.nan)
+        maximum = answers.max(axis=1, initial=-np.inf) if answers.shape[1] else np.full(answers.shape[0], np.nan)
+    return pd.DataFrame(dict(zip(PARTICIPANT_DESCRIPTIVES, (mean, stdev, minimum, maximum, count))), index=index).round(decimal_points)
+
+
+def split_participant_descriptives(obj):
+    """
+    return processed survey without descriptives of each participant, and "Language" + those descriptives (see get_means())
+    they are kept along with means until they are saved, so that the same participants are removed from both
+    """
+    columns = [col for col in PARTICIPANT_DESCRIPTIVES if col in obj.columns]
+    return obj.drop(columns=columns), obj.filter(["Language"] + columns)
+
+
 def add_columns_to_means_df(obj_means, obj_original, colls_to_add, lang_db, survey_lang):
     """
     add specific columns from original dataframe (contains all columns) into dataframe (contains means columns only)
@@ -52,7 +108,7 @@ def add_columns_to_means_df(obj_means, obj_original, colls_to_add, lang_db, surv
     obj_means.insert(0, "Language", survey_lang)
     # (2) for each column provided (using internal naming system found in lang_db)
     for item in colls_to_add:
-        english_column_name = lang.lstr(lang_db, item, category="column")
+        english_column_name = lang_db.column(item)
         # re-add it to obj_means as column
         obj_means[english_column_name] = obj_original[english_column_name]
         continue
@@ -62,72 +118,136 @@ def add_columns_to_means_df(obj_means, obj_original, colls_to_add, lang_db, surv
 def get_means(obj, colls_db, lang_db, survey_lang):
     """
     return clean dataframe with means per condition and all columns, e.g., when were you born
+    (+ mean, stdev, min, max and number of ratings of each participant, saved separately, see split_participant_descriptives())
     """
     # (1) get means only
+    colname = lang_db.column("rate_competence")
+    positions = lang_db.positions(obj.columns, "rate_competence")
     obj_means = get_mean_per_language(obj=obj,
-                                      colname=lang.lstr(lang_db, "rate_competence", category="column"),
+                                      colname=colname,
                                       colls_db=colls_db,
-                                      survey_lang=survey_lang)
+                                      survey_lang=survey_lang,
+                                      positions=positions)
     # (2) add specific columns to english means (age, city size, gender, etc)
-    colls_to_add = ["is_l1", "is_l2", "how_often", "age_begin_eng", "birth_year", "what_gender", "how_big_city", "which_uni_year"]
     obj_means_with_columns = add_columns_to_means_df(obj_means=obj_means,
                                                      obj_original=obj,
-                                                     colls_to_add=colls_to_add,
+                                                     colls_to_add=MEANS_COLUMNS,
                                                      lang_db=lang_db,
                                                      survey_lang=survey_lang)
+    # (3) add mean, stdev, min, max and number of ratings of each participant
+    answers = get_answer_matrix(get_ratings(obj, colname, positions=positions))
+    descriptives = get_participant_descriptives(answers, index=obj_means_with_columns.index)
+    for col in descriptives.columns:
+        obj_means_with_columns[col] = descriptives[col]
+        continue
     return obj_means_with_columns
 
 
 def find_wrong_answers(obj, d_filter_conditions, survey_lang):
     """
-    return list of rows that did not not match value (value) under columns (key)
+    return dictionary of rule : boolean mask of rows that did not not match value (value) under columns (key)
     """
-    # create list that will contain indexes (numbers) where wrong answers were found
-    list_wrong_answers = list()
+    r = dict()
     # find rows under columns whose value doesn't match
     for colname, correct_answer in d_filter_conditions.items():
-        # get dataframe containing only specific colname only
-        c_obj = obj.filter(like=colname)
         logging.debug(f"checking column '{colname}' (survey: {survey_lang}) for answers that are not '{correct_answer}'")
         # find rows that do NOT match correct answer
-        match = c_obj[c_obj[colname] != correct_answer]
-        # convert dataframe to list
-        match = match.index.tolist()
-        if match:
-            # if found wrong answers, append to list
-            logging.warning(f"answer to '{colname}' (survey: {survey_lang}) is not '{correct_answer}' for following participants '{match}'")
-            list_wrong_answers.extend(match)
+        mask = obj[colname] != correct_answer
+        if mask.any():
+            # if found wrong answers, log them
+            logging.warning(f"answer to '{colname}' (survey: {survey_lang}) is not '{correct_answer}' for following participants '{obj.index[mask].tolist()}'")
+        r[f"answer to '{colname}' is not '{correct_answer}'"] = mask
         continue
-    # turn repeating rows into single instances
-    list_wrong_answers = list(set(list_wrong_answers))
     # calculate ratio of wrong answers
-    ratio = round(((len(list_wrong_answers) / obj.shape[0]) * 100), 2)
-    logging.info(f"ok: checked answers (survey: {survey_lang}) for '{list(d_filter_conditions.keys())}', result: {len(list_wrong_answers)} out of {obj.shape[0]} participants (ratio: {ratio}%)")
-    return list_wrong_answers
+    wrong = np.logical_or.reduce(list(r.values())).sum() if r else 0
+    ratio = round(((wrong / obj.shape[0]) * 100), 2)
+    logging.info(f"ok: checked answers (survey: {survey_lang}) for '{list(d_filter_conditions.keys())}', result: {wrong} out of {obj.shape[0]} participants (ratio: {ratio}%)")
+    return r
+
+
+def get_ratings(obj, colname, positions=None):
+    """
+    return dataframe containing ratings columns only, i.e., columns named 'colname' (or their duplicates)
+    if positions of ratings columns are provided (e.g., from LangDB.positions()) then columns are not searched by name
+    """
+    if positions is not None:
+        return obj.iloc[:, positions]
+    return obj.filter(like=colname)
+
+
+def get_answer_matrix(obj):
+    """
+    return ratings of all participants as 2d float array (rows = participants, columns = answers; missing = NaN)
+    """
+    return obj.to_numpy(dtype="float64", na_value=np.nan)
+
+
+def format_answer(value):
+    """
+    return answer as it was clicked, e.g., 7 instead of 7.0
+    """
+    return int(value) if float(value).is_integer() else value
+
+
+def get_most_common_answers(answers):
+    """
+    return most common answer and its number of occurrences for every participant (row) at once
+    missing answers are not counted
+    """
+    # each distinct answer (e.g., 1-7) is counted across all rows in a single comparison
+    distinct = np.unique(answers[~np.isnan(answers)])
+    if distinct.size == 0:
+        return np.full(answers.shape[0], np.nan), np.zeros(answers.shape[0], dtype=np.int64)
+    counts = np.stack([(answers == value).sum(axis=1) for value in distinct], axis=1)
+    # on ties, argmax picks the first (smallest) answer
+    position = counts.argmax(axis=1)
+    return distinct[position], counts[np.arange(answers.shape[0]), position]
 
 
-def find_clickers(obj_means, obj_original, colname, max_clicker_ratio, survey_lang):
+def get_longest_runs(answers):
+    """
+    return length of the longest run of identical consecutive answers for every participant (row) at once
+    """
+    if answers.shape[1] == 0:
+        return np.zeros(answers.shape[0], dtype=np.int64)
+    # True where answer is the same as the previous one
+    same = answers[:, 1:] == answers[:, :-1]
+    total = np.cumsum(same, axis=1)
+    # count since the last change of answer
+    since_change = total - np.maximum.accumulate(np.where(same, 0, total), axis=1)
+    return since_change.max(axis=1, initial=0) + 1
+
+
+def get_alternations(answers):
+    """
+    return how many answers continue an alternating pattern (e.g., 1-7-1-7) for every participant (row) at once
+    """
+    if answers.shape[1] < 3:
+        return np.zeros(answers.shape[0], dtype=np.int64)
+    # same as two answers ago, but not the same as the previous one
+    alternating = (answers[:, 2:] == answers[:, :-2]) & (answers[:, 2:] != answers[:, 1:-1])
+    return alternating.sum(axis=1)
+
+
+def find_clickers(obj_means, obj_original, colname, max_clicker_ratio, survey_lang, positions=None):
     """
     return list of rows where participant kept clicking the same answer
     if max_ratio is exceeded then row is marked as a clicker and removed
     """
-    # create list that will contain indexes (numbers) where clickers were found
-    list_clickers = list()
     # using old dataframe, get dataframe containing answers only
-    obj = obj_original.filter(like=colname)
+    obj = get_ratings(obj_original, colname, positions=positions)
+    answers = get_answer_matrix(obj)
     # get total amount of answers, based on column length
-    answers_amount = obj.shape[1]
-    # for each row (participant)
-    for index, row in obj.iterrows():
-        # convert to list, get most occuring answer as tuple
-        row = row.tolist()
-        occurrence = Counter(row).most_common(1)[0]
-        # calculate how often most occuring answer appears vs. total amount of answers
-        ratio_percent = round(occurrence[1] / answers_amount * 100)
-        # logging.info(f"row {index} (survey: {survey_lang}) has chosen the same answer '{occurrence[0]}' in {ratio_percent}% of answers ({answers_amount} answers vs. {occurrence[1]} occurences); {sorted(row)}; {min(row)=}; {max(row)=}")
-        if ratio_percent > max_clicker_ratio:
-            logging.warning(f"participant (survey: {survey_lang}): row '{index}' has same answer '{occurrence[0]}' in {ratio_percent}% of cases (cutoff: >{max_clicker_ratio}%)")
-            list_clickers.append(index)
+    answers_amount = answers.shape[1]
+    # for all participants at once, get most occuring answer and how often it appears vs. total amount of answers
+    most_common, occurrences = get_most_common_answers(answers)
+    ratios = np.rint(occurrences / answers_amount * 100).astype(np.int64)
+    # create list that will contain indexes (numbers) where clickers were found
+    list_clickers = list()
+    for position in np.flatnonzero(ratios > max_clicker_ratio):
+        index = obj.index[position]
+        logging.warning(f"participant (survey: {survey_lang}): row '{index}' has same answer '{format_answer(most_common[position])}' in {ratios[position]}% of cases (cutoff: >{max_clicker_ratio}%)")
+        list_clickers.append(index)
         continue
     # calculate ratio of clickers
     ratio = round(((len(list_clickers) / obj.shape[0]) * 100), 2)
@@ -135,128 +255,407 @@ def find_clickers(obj_means, obj_original, colname, max_clicker_ratio, survey_la
     return list_clickers
 
 
-def drop_rows(obj, target_list, survey_lang):
+def find_straightliners(obj_original, colname, max_straightline_ratio, survey_lang, positions=None):
     """
-    drop rows from dataframe using list
-    if list empty, nothing is dropped
+    return list of rows where participant clicked the same answer many times in a row (straight-lining)
+    if max_straightline_ratio is exceeded by the longest run of identical answers then row is marked
     """
-    # if not empty
-    if target_list:
-        r = obj.copy()
-        # axis=0 - rows should be deleted; inplace=True - operation in the same dataframe
-        r.drop(target_list, axis=0, inplace=True)
-        # reset counting
-        r.reset_index(drop=True, inplace=True)
-        logging.info(f"ok: dropped {len(target_list)} rows: {obj.shape[0]} -> {r.shape[0]} (survey: {survey_lang})")
-        return r
-    logging.info(f"did not drop rows: {obj.shape[0]} (survey: {survey_lang})")
-    return obj
+    obj = get_ratings(obj_original, colname, positions=positions)
+    answers = get_answer_matrix(obj)
+    runs = get_longest_runs(answers)
+    ratios = np.rint(runs / answers.shape[1] * 100).astype(np.int64)
+    list_straightliners = list()
+    for position in np.flatnonzero(ratios > max_straightline_ratio):
+        index = obj.index[position]
+        logging.warning(f"participant (survey: {survey_lang}): row '{index}' has a run of {runs[position]} identical answers in a row, i.e., {ratios[position]}% of answers (cutoff: >{max_straightline_ratio}%)")
+        list_straightliners.append(index)
+        continue
+    ratio = round(((len(list_straightliners) / obj.shape[0]) * 100), 2)
+    logging.info(f"ok: checked straight-lining (survey: {survey_lang}) at >{max_straightline_ratio}% cutoff, result: {len(list_straightliners)} out of {obj.shape[0]} participants (ratio: {ratio}%)")
+    return list_straightliners
 
 
-def target_learn(obj, colname):
+def find_alternators(obj_original, colname, max_alternating_ratio, survey_lang, positions=None):
     """
-    return a dictionary of the age at which the participants began to learn english (e.g., "7")
+    return list of rows where participant kept alternating between two answers (e.g., 1-7-1-7)
+    if max_alternating_ratio is exceeded then row is marked
     """
-    # get dataframe
-    df_begin = obj.filter(like=colname)
-    # get the single column that appears
-    df_begin = df_begin[colname]
-    # get rounded float
-    mean_age = round(float(df_begin.mean()), 2)
-    stdev = round(float(df_begin.std()), 2)
-    min_age = round(float(df_begin.min()), 2)
-    max_age = round(float(df_begin.max()), 2)
-    # create dictionary that contains mean learn and standard deviation
-    r = {
-        "began learning english: mean age":mean_age,
-        "began learning english: min age":min_age,
-        "began learning english: max age":max_age,
-        "began learning english: stdev":stdev
-    }
-    logging.info(f"calculated when began to learn english: {mean_age=}, {min_age=}, {max_age=}, {stdev=}")
-    return r
+    obj = get_ratings(obj_original, colname, positions=positions)
+    answers = get_answer_matrix(obj)
+    alternations = get_alternations(answers)
+    ratios = np.rint(alternations / max(answers.shape[1] - 2, 1) * 100).astype(np.int64)
+    list_alternators = list()
+    for position in np.flatnonzero(ratios > max_alternating_ratio):
+        index = obj.index[position]
+        logging.warning(f"participant (survey: {survey_lang}): row '{index}' alternates between two answers in {ratios[position]}% of cases (cutoff: >{max_alternating_ratio}%)")
+        list_alternators.append(index)
+        continue
+    ratio = round(((len(list_alternators) / obj.shape[0]) * 100), 2)
+    logging.info(f"ok: checked alternating patterns (survey: {survey_lang}) at >{max_alternating_ratio}% cutoff, result: {len(list_alternators)} out of {obj.shape[0]} participants (ratio: {ratio}%)")
+    return list_alternators
+
+
+def apply_exclusions(obj, masks, survey_lang):
+    """
+    return dataframe without rows marked in any of the masks (dictionary of rule : boolean mask), and a report of how many rows each rule marked
+    rows are selected once and keep their index, so participants can be traced back to the input
+    """
+    excluded = np.zeros(obj.shape[0], dtype=bool)
+    report = {"participants": obj.shape[0]}
+    for rule, mask in masks.items():
+        mask = np.asarray(mask, dtype=bool)
+        report[rule] = int(mask.sum())
+        excluded |= mask
+        continue
+    report["excluded"] = int(excluded.sum())
+    # if nothing to exclude, return as-is
+    r = obj[~excluded] if excluded.any() else obj
+    report["remaining"] = r.shape[0]
+    logging.info(f"ok: excluded {report['excluded']} rows: {obj.shape[0]} -> {r.shape[0]} (survey: {survey_lang}); per rule: {dict((rule, report[rule]) for rule in masks)}")
+    return r, report
 
 
-def target_age(obj, colname, current_year=2022):
+def get_summary(stats, label, current_year=None):
     """
-    return a dictionary of the participants' ages (e.g., "22")
+    return a dictionary of mean, min, max and stdev from one row of aggregated statistics, e.g., "age: mean age"
+    if current_year is provided then values are years (e.g., 1999) and are converted into ages (e.g., 2022 - 1999)
     """
-    # get dataframe
-    df_born = obj.filter(like=colname)
-    # get the single column that appears
-    df_born = df_born[colname]
     # get rounded float
-    mean_birth = round(float(df_born.mean()), 2)
-    stdev = round(float(df_born.std()), 2)
-    min_birth = round(float(df_born.min()), 2)
-    max_birth = round(float(df_born.max()), 2)
+    mean_value = round(float(stats["mean"]), 2)
+    stdev = round(float(stats["std"]), 2)
+    min_value = round(float(stats["min"]), 2)
+    max_value = round(float(stats["max"]), 2)
     # calculate age by substracting current year, e.g., 2022 - 1999
-    mean_age = round((current_year - mean_birth), 2)
-    min_age = round((current_year - max_birth), 2)
-    max_age = round((current_year - min_birth), 2)
-    # create dictionary that contains mean age and standard deviation
-    r = {
-        "age: mean age":mean_age,
-        "age: min age":min_age,
-        "age: max age":max_age,
-        "age: stdev":stdev
+    if current_year is not None:
+        mean_value, min_value, max_value = round((current_year - mean_value), 2), round((current_year - max_value), 2), round((current_year - min_value), 2)
+    return {
+        f"{label}: mean age":mean_value,
+        f"{label}: min age":min_value,
+        f"{label}: max age":max_value,
+        f"{label}: stdev":stdev
     }
-    logging.info(f"calculated age: {mean_age=}, {min_age=}, {max_age=}, {stdev=}")
+
+
+def get_distribution(counts):
+    """
+    return a dictionary of answer : percentage with 1 decimal (e.g., {"female": "50.0%"}), most common answer first
+    'counts' is a series of answer : occurrences in order of first appearance
+    """
+    # sort the same way as value_counts() does
+    counts = counts.sort_values(ascending=False)
+    distribution = (counts / counts.sum()).mul(100).round(1).astype(str) + '%'
+    return distribution.to_dict()
+
+
+def accumulate_statistics(obj, specs, group_column="Language"):
+    """
+    return partial statistics of each group (e.g., language) that can be merged with partial statistics of other rows
+    numbers keep count, mean, variance, min and max; answers keep counts in order of first appearance
+    'specs' is the same as in get_statistics()
+    """
+    # (1) resolve columns
+    for name, colname, statistic, label in specs:
+        if colname not in obj.columns:
+            logging.error(f"column for '{name}' not found in dataframe: {colname}")
+            quit()
+        continue
+    groups = obj[group_column].astype(object)
+    r = {"groups": list(dict.fromkeys(groups.dropna())), "numeric": dict(), "counts": dict()}
+    # (2) calculate count, mean, variance, min, max of all numeric columns for all groups at once
+    numeric_columns = list(dict.fromkeys(colname for name, colname, statistic, label in specs if statistic in ("summary", "age")))
+    if numeric_columns:
+        numeric = obj[numeric_columns].apply(pd.to_numeric, errors="coerce").groupby(groups, sort=False).agg(["count", "mean", "var", "min", "max"])
+        for colname in numeric_columns:
+            r["numeric"][colname] = {group: numeric.loc[group, colname].to_dict() for group in r["groups"]}
+            continue
+    # (3) count answers of all categorical columns for all groups at once, in order of first appearance
+    for colname in dict.fromkeys(colname for name, colname, statistic, label in specs if statistic == "distribution"):
+        counts = obj.groupby([groups, obj[colname].astype(object)], sort=False).size()
+        r["counts"][colname] = {group: dict() for group in r["groups"]}
+        for (group, answer), count in counts.items():
+            r["counts"][colname][group][answer] = int(count)
+            continue
+        continue
+    return r
+
+
+def merge_numeric(a, b):
+    """
+    return count, mean, variance, min and max of two sets of numbers, given the same statistics of each set
+    """
+    if not a["count"]:
+        return dict(b)
+    if not b["count"]:
+        return dict(a)
+    count = a["count"] + b["count"]
+    delta = b["mean"] - a["mean"]
+    # sums of squared differences from the mean (a set of one number has none)
+    m2 = sum(0 if np.isnan(x["var"]) else x["var"] * (x["count"] - 1) for x in (a, b)) + delta ** 2 * a["count"] * b["count"] / count
+    return {"count": count,
+            "mean": a["mean"] + delta * b["count"] / count,
+            "var": m2 / (count - 1),
+            "min": min(a["min"], b["min"]),
+            "max": max(a["max"], b["max"])}
+
+
+def merge_statistics(a, b):
+    """
+    return partial statistics (from accumulate_statistics()) of rows of both 'a' and 'b', as if 'b' rows were appended to 'a' rows
+    """
+    r = {"groups": list(dict.fromkeys(a["groups"] + b["groups"])), "numeric": dict(), "counts": dict()}
+    empty = {"count": 0, "mean": np.nan, "var": np.nan, "min": np.nan, "max": np.nan}
+    for colname in dict.fromkeys(list(a["numeric"]) + list(b["numeric"])):
+        r["numeric"][colname] = {group: merge_numeric(a["numeric"].get(colname, dict()).get(group, empty),
+                                                      b["numeric"].get(colname, dict()).get(group, empty))
+                                 for group in r["groups"]}
+        continue
+    for colname in dict.fromkeys(list(a["counts"]) + list(b["counts"])):
+        r["counts"][colname] = dict()
+        for group in r["groups"]:
+            # answers seen for the first time in 'b' go last, the same as in order of first appearance
+            counts = dict(a["counts"].get(colname, dict()).get(group, dict()))
+            for answer, count in b["counts"].get(colname, dict()).get(group, dict()).items():
+                counts[answer] = counts.get(answer, 0) + count
+                continue
+            r["counts"][colname][group] = counts
+            continue
+        continue
+    return r
+
+
+def iter_statistics(accumulated, specs, current_year=2022):
+    """
+    yield (section, statistics) for each group and spec from partial statistics (from accumulate_statistics()), e.g., ("en: age", {...})
+    each section is calculated only when it's asked for, so that it can be saved before the next one is calculated
+    """
+    for name, colname, statistic, label in specs:
+        for group in accumulated["groups"]:
+            if statistic == "distribution":
+                # a group where nobody answered has no counts
+                counts = accumulated["counts"][colname][group]
+                value = get_distribution(pd.Series(counts, index=list(counts), dtype="int64")) if counts else dict()
+            else:
+                stats = accumulated["numeric"][colname][group]
+                value = get_summary(dict(stats, std=np.sqrt(stats["var"])), label=label, current_year=current_year if statistic == "age" else None)
+            logging.info(f"calculated {name} ({group}): {value}")
+            yield f"{group}: {name}", value
+            continue
+        continue
+    return
+
+
+def summarize_statistics(accumulated, specs, current_year=2022):
+    """
+    return a dictionary of statistics for each group and spec from partial statistics (from accumulate_statistics())
+    """
+    return dict(iter_statistics(accumulated, specs=specs, current_year=current_year))
+
+
+def get_statistics(obj, specs, group_column="Language", current_year=2022):
+    """
+    return a dictionary of statistics for each group (e.g., language) and spec, e.g., {"en: age": {"age: mean age": 22.5, ...}}
+    'specs' is a list of (name, column, statistic, label), where statistic is:
+        "summary" - mean, min, max and stdev of numbers (e.g., age when began to learn english)
+        "age" - same as summary, but of years converted into ages (e.g., birth year)
+        "distribution" - percentage of each answer (e.g., gender)
+    columns are resolved once and all groups are calculated in a single grouped pass
+    """
+    return summarize_statistics(accumulate_statistics(obj, specs, group_column=group_column),
+                                specs=specs,
+                                current_year=current_year)
+
+
+def accumulate_reliability(answers, colls_db):
+    """
+    return sums needed for reliability of each condition (cronbach's alpha, item-total correlations), which can be merged with sums of other rows
+    'answers' is a 2d array from get_answer_matrix() (columns in the same order as colls_db)
+    only participants who answered every item of a condition are counted for that condition
+    all items are summed at once, with items grouped by condition (see build_condition_matrix())
+    """
+    conditions, order, starts = build_condition_matrix(tuple(colls_db))
+    ends = np.append(starts[1:], len(colls_db))
+    item_condition = np.repeat(np.arange(len(conditions)), ends - starts)
+    # (1) group items by condition (copy), zero items of conditions that participant didn't fully answer
+    answers = answers.take(order, axis=1)
+    missing = np.isnan(answers)
+    if missing.any():
+        complete = np.add.reduceat(missing.view(np.uint8), starts, axis=1) == 0
+        np.copyto(answers, 0, where=~complete[:, item_condition])
+    else:
+        complete = np.ones((answers.shape[0], len(conditions)), dtype=bool)
+    # (2) total score of each participant in each condition
+    totals = np.add.reduceat(answers, starts, axis=1)
+    # (3) sum of products of each item and total of its condition (one matrix-vector product per condition)
+    item_total_products = np.concatenate([totals[:, c] @ answers[:, start:end] for c, (start, end) in enumerate(zip(starts, ends))])
+    return {"conditions": conditions,
+            "items": order.tolist(),
+            "item_conditions": item_condition.tolist(),
+            "participants": complete.sum(axis=0).tolist(),
+            "item_sums": answers.sum(axis=0).tolist(),
+            "item_squares": np.einsum("ij,ij->j", answers, answers).tolist(),
+            "item_total_products": item_total_products.tolist(),
+            "total_sums": totals.sum(axis=0).tolist(),
+            "total_squares": np.einsum("ij,ij->j", totals, totals).tolist()}
+
+
+def merge_reliability(a, b):
+    """
+    return sums from accumulate_reliability() of rows of both 'a' and 'b'
+    """
+    if a["conditions"] != b["conditions"] or a["items"] != b["items"]:
+        raise ValueError("can't merge reliability of different conditions")
+    r = dict(a)
+    for key in ("participants", "item_sums", "item_squares", "item_total_products", "total_sums", "total_squares"):
+        r[key] = np.add(a[key], b[key]).tolist()
+        continue
+    return r
+
+
+def summarize_reliability(accumulated, decimal_points=4):
+    """
+    return reliability of each condition (number of items, participants who answered all of them, cronbach's alpha, mean and lowest item-total correlation)
+    and of each item (mean, stdev, corrected item-total correlation, alpha if item is deleted) from sums (from accumulate_reliability())
+    """
+    item_condition = np.asarray(accumulated["item_conditions"])
+    sizes = np.bincount(item_condition, minlength=len(accumulated["conditions"]))
+    participants = np.asarray(accumulated["participants"], dtype=np.float64)
+    n = participants[item_condition]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        # (1) variances and covariances from sums, e.g., var = (sum of squares - n * mean^2) / (n - 1)
+        item_mean = np.asarray(accumulated["item_sums"]) / n
+        item_var = (np.asarray(accumulated["item_squares"]) - n * item_mean ** 2) / (n - 1)
+        total_mean = np.asarray(accumulated["total_sums"]) / participants
+        total_var = (np.asarray(accumulated["total_squares"]) - participants * total_mean ** 2) / (participants - 1)
+        item_total_cov = (np.asarray(accumulated["item_total_products"]) - n * item_mean * total_mean[item_condition]) / (n - 1)
+        # (2) cronbach's alpha = k / (k - 1) * (1 - sum of item variances / variance of total)
+        item_var_sums = np.bincount(item_condition, weights=item_var, minlength=sizes.size)
+        alpha = sizes / (sizes - 1) * (1 - item_var_sums / total_var)
+        # (3) corrected item-total correlation, i.e., with the rest of the items in condition (total without the item)
+        rest_var = total_var[item_condition] + item_var - 2 * item_total_cov
+        item_total = (item_total_cov - item_var) / np.sqrt(item_var * rest_var)
+        alpha_deleted = (sizes[item_condition] - 1) / (sizes[item_condition] - 2) * (1 - (item_var_sums[item_condition] - item_var) / rest_var)
+    # (4) lowest and mean item-total correlation of each condition (NaN if it can't be calculated)
+    valid = ~np.isnan(item_total)
+    counts = np.bincount(item_condition[valid], minlength=sizes.size)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        item_total_mean = np.bincount(item_condition[valid], weights=item_total[valid], minlength=sizes.size) / counts
+    item_total_min = np.full(sizes.size, np.inf)
+    np.minimum.at(item_total_min, item_condition[valid], item_total[valid])
+    item_total_min[counts == 0] = np.nan
+    conditions = pd.DataFrame({"items": sizes,
+                               "complete_cases": participants.astype(np.int64),
+                               "cronbach_alpha": alpha,
+                               "item_total_mean": item_total_mean,
+                               "item_total_min": item_total_min},
+                              index=pd.Index(accumulated["conditions"], name="Condition")).round(decimal_points)
+    items = pd.DataFrame({"Condition": np.asarray(accumulated["conditions"], dtype=object)[item_condition],
+                          "item_mean": item_mean,
+                          "item_stdev": np.sqrt(item_var),
+                          "item_total": item_total,
+                          "alpha_if_deleted": alpha_deleted},
+                         index=pd.Index(np.asarray(accumulated["items"]) + 1, name="Item")).round(decimal_points)
+    return conditions, items
+
+
+def get_cube_keys(obj, dimensions):
+    """
+    return dataframe of dimension values of each row as text (missing stay missing), with columns named after 'dimensions'
+    'dimensions' is a dictionary of name (in cube) : column (in 'obj'); text keeps cells the same whether they come from csv or categoricals
+    """
+    r = dict()
+    for name, column in dimensions.items():
+        values = obj[column]
+        r[name] = values.astype(str).where(values.notna())
+        continue
+    return pd.DataFrame(r, index=obj.index)
+
+
+def accumulate_cube(obj, conditions, dimensions, decimal_points=8, block_size=1 << 24):
+    """
+    return aggregate cube: one row for each combination of dimension values (e.g., language, gender, city size) found in 'obj',
+    with number of participants and sum, sum of squares and count of participants' means in each condition
+    any subgroup or marginal is then the sum of its cells (see query_cube()); cubes of different rows can be merged (see merge_cubes())
+    means have 4 decimal points, so sums are rounded to 8: the same cube whether rows are added at once, in chunks or incrementally
+    """
+    # (1) cell of each participant, participants grouped by cell
+    grouped = get_cube_keys(obj, dimensions).groupby(list(dimensions), dropna=False, sort=True)
+    codes = grouped.ngroup().to_numpy()
+    sizes = grouped.size()
+    order = np.argsort(codes, kind="stable")
+    starts = np.searchsorted(codes[order], np.arange(sizes.shape[0]))
+    # (2) sums of conditions in each cell, a block of conditions at a time (about 'block_size' values), so that memory doesn't grow with conditions
+    r = {"participants": sizes.to_numpy(dtype=np.int64)}
+    step = max(1, block_size // max(1, obj.shape[0]))
+    for first in range(0, len(conditions), step):
+        block = conditions[first:first + step]
+        values = obj[block].to_numpy(dtype=np.float64).take(order, axis=0)
+        valid = ~np.isnan(values)
+        np.copyto(values, 0, where=~valid)
+        sums = np.add.reduceat(values, starts, axis=0) if values.shape[0] else np.zeros((0, len(block)))
+        counts = np.add.reduceat(valid.view(np.uint8), starts, axis=0, dtype=np.int64) if values.shape[0] else np.zeros((0, len(block)), dtype=np.int64)
+        squares = np.add.reduceat(np.square(values, out=values), starts, axis=0) if values.shape[0] else np.zeros((0, len(block)))
+        for i, condition in enumerate(block):
+            r[f"{condition}_sum"] = sums[:, i]
+            r[f"{condition}_squares"] = squares[:, i]
+            r[f"{condition}_count"] = counts[:, i]
+            continue
+        continue
+    r = pd.DataFrame(r, index=sizes.index).round(decimal_points)
+    logging.info(f"ok: built cube of {len(conditions)} conditions by {list(dimensions)}: {obj.shape[0]} participants -> {r.shape[0]} cells")
     return r
 
 
-def target_gender(obj, colname):
-    """
-    return a dictionary of participants' gender (e.g., "female")
-    """
-    # get dataframe
-    df_gender = obj.filter(like=colname)
-    # get the single column that appears
-    df_gender = df_gender[colname]
-    # get individual occurences
-    gender_dataset = df_gender.value_counts(normalize=True)
-    # convert to percentage with 1 decimal
-    gender_dataset = gender_dataset.mul(100).round(1).astype(str) + '%'
-    # convert to dictionary
-    gender_dataset = gender_dataset.to_dict()
-    logging.info(f"calculated gender: {gender_dataset=}")
-    return gender_dataset
-
-
-def target_city(obj, colname):
-    """
-    return a dictionary of participants' city size (e.g., "15,000 - 75,000 residents")
-    """
-    # get dataframe
-    df_city = obj.filter(like=colname)
-    # get the single column that appears
-    df_city = df_city[colname]
-    # get individual occurences
-    city_dataset = df_city.value_counts(normalize=True)
-    # convert to percentage with 1 decimal
-    city_dataset = city_dataset.mul(100).round(1).astype(str) + '%'
-    # convert to dictionary
-    city_dataset = city_dataset.to_dict()
-    logging.info(f"calculated city size: {city_dataset=}")
-    return city_dataset
-
-
-def target_uni(obj, colname):
-    """
-    return a dictionary of participants' current uni year
-    """
-    # get dataframe
-    df_uni = obj.filter(like=colname)
-    # get the single column that appears
-    df_uni = df_uni[colname]
-    # get individual occurences
-    uni_dataset = df_uni.value_counts(normalize=True)
-    # convert to percentage with 1 decimal
-    uni_dataset = uni_dataset.mul(100).round(1).astype(str) + '%'
-    # convert to dictionary
-    uni_dataset = uni_dataset.to_dict()
-    logging.info(f"calculated uni size: {uni_dataset=}")
-    return uni_dataset
+def merge_cubes(a, b, decimal_points=8):
+    """
+    return cube of both cubes' rows, cells with the same dimension values are added together
+    """
+    if a is None:
+        return b
+    if b is None:
+        return a
+    return pd.concat([a, b], axis=0).groupby(level=list(range(a.index.nlevels)), dropna=False, sort=True).sum().round(decimal_points)
+
+
+def query_cube(cube, conditions, by=(), where=None, statistic="mean", decimal_points=4):
+    """
+    return dataframe of statistic ("mean", "stdev", "count" or "sum") of participants' means in each condition for each subgroup,
+    calculated by adding cells of cube together instead of going through participants again
+    'by' lists dimensions that make up subgroups (none = everyone), 'where' is a dictionary of dimension : value (or list of values) to keep
+    """
+    # (1) keep only cells that match filter
+    cells = cube
+    for name, values in (where or dict()).items():
+        if name not in cube.index.names:
+            raise KeyError(f"unknown dimension of cube: {name} (available: {list(cube.index.names)})")
+        values = values if isinstance(values, (list, tuple, set)) else [values]
+        cells = cells[cells.index.get_level_values(name).isin([str(value) for value in values])]
+        continue
+    # (2) add cells of each subgroup together
+    for name in by:
+        if name not in cube.index.names:
+            raise KeyError(f"unknown dimension of cube: {name} (available: {list(cube.index.names)})")
+        continue
+    if by:
+        sums = cells.groupby(level=list(by), dropna=False, sort=True).sum()
+    else:
+        sums = cells.sum().to_frame("all").T
+    # (3) statistic of each condition from sums
+    r = {"participants": sums["participants"].astype(np.int64)}
+    with np.errstate(divide="ignore", invalid="ignore"):
+        for condition in conditions:
+            total, squares, count = (sums[f"{condition}_{measure}"] for measure in ("sum", "squares", "count"))
+            if statistic == "mean":
+                r[condition] = total / count
+            elif statistic == "stdev":
+                r[condition] = np.sqrt(np.maximum(squares - total * total / count, 0) / (count - 1))
+            elif statistic == "count":
+                r[condition] = count.astype(np.int64)
+            elif statistic == "sum":
+                r[condition] = total
+            else:
+                raise ValueError(f"unknown statistic of cube: {statistic} (available: mean, stdev, count, sum)")
+            continue
+    return pd.DataFrame(r).round(decimal_points)
 
 
 def rename_index_to_participant(obj, name="Participant"):
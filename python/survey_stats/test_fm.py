@@ -0,0 +1,35 @@
+"""check that typed csvs are processed into the same files as untyped ones (run with pytest)"""
+from os.path import dirname, join
+import benchmark
+import comp
+import fm
+import pytest
+import target
+
+
+INPUT = join(dirname(__file__), "input")
+
+
+@pytest.mark.parametrize("survey_lang", ["en", "pl"])
+def test_typed_processed_csv_is_the_same(tmp_path, survey_lang):
+    """
+    processed csv is byte-for-byte the same with and without dtype schema, e.g., birth year is saved as "1996", not "1996.0"
+    """
+    lang_db = fm.load_lang_db(fn=join(INPUT, "lang_db.json"))
+    colls_db = fm.load_columns(fn=join(INPUT, "column_names.txt"))
+    fn_input = str(tmp_path / f"survey_{survey_lang}.csv")
+    benchmark.generate_survey(fn=fn_input, lang_db=lang_db, colls_db=colls_db, survey_lang=survey_lang, participants=300)
+    r = dict()
+    for typed in (False, True):
+        means, _, _ = comp.process_language(lang_db=lang_db,
+                                            colls_db=colls_db,
+                                            survey_lang=survey_lang,
+                                            fn_survey_input=fn_input,
+                                            d_filter_conditions=comp.get_filter_conditions(lang_db),
+                                            max_clicker_ratio=80,
+                                            typed=typed)
+        fn_output = tmp_path / f"processed_{survey_lang}_{typed}.csv"
+        fm.save_dataframe(obj=target.split_participant_descriptives(means)[0], fn=str(fn_output))
+        r[typed] = fn_output.read_bytes()
+        continue
+    assert r[True] == r[False]